@@ -25,4 +25,6 @@ if __name__ == '__main__':
         logger.info('Initializing database')
         if not database.tables_exist():
             database.create_all()
+        for change in database.upgrade_indexes():
+            logger.info(change)
         exit(0)
@@ -0,0 +1,45 @@
+"""
+Compact old process status events into daily rollups.
+
+Process status events older than ``EVENT_RETENTION`` days are summarized by
+:func:`agent.services.database.compact_events`, and then deleted. This is run
+as a job of its own (e.g. daily), rather than by the consumer, since the first
+run may have to work through a long backlog of events. Use ``--max-days`` to
+work through a backlog a little at a time.
+
+Usage: python -m agent.compact [--max-days N] [--batch-size N]
+"""
+
+import time
+from argparse import ArgumentParser
+
+from arxiv.base import logging
+
+from .factory import create_app
+from .services import database
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    """Compact old process status events."""
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--max-days', type=int, default=None,
+                        help='Maximum number of days to compact')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='Number of events to read at a time')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        start = time.perf_counter()
+        compacted = database.compact_events(
+            int(app.config.get('EVENT_RETENTION', 90)),
+            max_days=args.max_days, batch_size=args.batch_size
+        )
+        logger.info('Compacted %i process status events in %.1f s',
+                    compacted, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
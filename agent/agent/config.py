@@ -180,6 +180,52 @@ if not KINESIS_VERIFY:
     warnings.warn('Certificate verification for Kinesis is disabled; this'
                   ' should not be disabled in production.')
 
+CONSUMER_WORKERS = int(environ.get('CONSUMER_WORKERS', '1'))
+"""
+Number of threads used to process the records in each batch.
+
+Records are partitioned by submission, so that records for the same
+submission are always processed in order. If ``1`` (default), records are
+processed serially.
+"""
+
+DISPATCH_TTL = int(environ.get('DISPATCH_TTL', '604800'))
+"""
+Number of seconds for which dispatched processes are remembered.
+
+The consumer will not dispatch the same process for the same event and rule
+more than once within this period, even if records are replayed. This should
+be at least as long as the retention period of the Kinesis stream.
+"""
+
+EVENT_RETENTION = int(environ.get('EVENT_RETENTION', '90'))
+"""
+Number of days for which process status events are retained.
+
+Older events are compacted into daily per-process rollups (see
+:func:`agent.services.database.get_rollups`) by :mod:`agent.compact`.
+"""
+
+CHECKPOINT_INTERVAL = float(environ.get('CHECKPOINT_INTERVAL', '10'))
+"""
+Maximum number of seconds between stored consumer checkpoints.
+
+Checkpoints are coalesced, so that we don't write to the database after every
+batch of records. Any records after the last stored checkpoint are replayed
+if the consumer restarts; see :const:`DISPATCH_TTL`.
+"""
+
+CHECKPOINT_EVERY = int(environ.get('CHECKPOINT_EVERY', '20'))
+"""
+Maximum number of checkpoints (record batches) between stored checkpoints.
+
+A checkpoint is stored as soon as either this or :const:`CHECKPOINT_INTERVAL`
+is reached. Set to ``1`` to store every checkpoint.
+"""
+
+CHECKPOINT_HISTORY = int(environ.get('CHECKPOINT_HISTORY', '100'))
+"""Number of past checkpoints per shard retained for debugging."""
+
 
 # --- CELERY CONFIGURATION ---
 
@@ -223,11 +269,122 @@ CELERY_RESULT_SERIALIZER = 'process-json'
 """Serialize for celery results."""
 
 
+# --- BACKPRESSURE ---
+#
+# Adaptive concurrency limits and retry budgets for calls to the classifier,
+# compiler, and plain text services. Each of these may also be set for a single
+# service, e.g. ``CLASSIFIER_LIMIT_MAX``. See :mod:`agent.process.backpressure`.
+
+BACKPRESSURE_STATE_DIR = environ.get('BACKPRESSURE_STATE_DIR',
+                                     '/tmp/submission-agent-limits')
+"""Directory for state shared by worker processes on the same host."""
+
+LIMIT_INITIAL = int(environ.get('LIMIT_INITIAL', '4'))
+"""Initial number of concurrent calls allowed to each service."""
+
+LIMIT_MIN = int(environ.get('LIMIT_MIN', '1'))
+"""Concurrent calls allowed to each service, however badly it is doing."""
+
+LIMIT_MAX = int(environ.get('LIMIT_MAX', '32'))
+"""Maximum number of concurrent calls allowed to each service."""
+
+LIMIT_LATENCY_TARGET = float(environ.get('LIMIT_LATENCY_TARGET', '10'))
+"""Calls that take longer than this (in seconds) reduce the limit."""
+
+RETRY_BUDGET_RATIO = float(environ.get('RETRY_BUDGET_RATIO', '0.2'))
+"""Retries earned per call to a service."""
+
+RETRY_BUDGET_MIN_RATE = float(environ.get('RETRY_BUDGET_MIN_RATE', '0.1'))
+"""Retries earned per second, regardless of the number of calls."""
+
+RETRY_BUDGET_MAX = float(environ.get('RETRY_BUDGET_MAX', '20'))
+"""Maximum number of retries that can be banked."""
+
+RETRY_BUDGET_DEFER = int(environ.get('RETRY_BUDGET_DEFER', '300'))
+"""Seconds to defer a retry when the retry budget is exhausted."""
+
+
+# --- CLASSIFIER CACHE ---
+#
+# Classifier results are cached on local disk, keyed by the content that was
+# classified. See :mod:`agent.process.classifier_cache`.
+
+CLASSIFIER_CACHE_PATH = environ.get('CLASSIFIER_CACHE_PATH', '')
+"""
+Path to the cache database. If empty (the default), results are not cached.
+
+Results are keyed by the version reported by the classifier service.
+"""
+
+CLASSIFIER_CACHE_MAX_ENTRIES = int(
+    environ.get('CLASSIFIER_CACHE_MAX_ENTRIES', '10000')
+)
+"""Maximum number of cached results."""
+
+# --- EXTRACTION POLLER ---
+#
+# Plain text extractions are tracked in the agent database, and their status
+# is checked in batches by a poller that runs alongside the consumer. See
+# :mod:`agent.poller`.
+
+EXTRACTION_POLLER_ENABLED = bool(int(environ.get('EXTRACTION_POLLER_ENABLED',
+                                                 '1')))
+"""If false, each task polls the plain text service on its own."""
+
+EXTRACTION_POLL_BATCH_SIZE = int(environ.get('EXTRACTION_POLL_BATCH_SIZE',
+                                             '50'))
+"""Maximum number of extractions to check at once."""
+
+EXTRACTION_POLL_MIN_INTERVAL = float(
+    environ.get('EXTRACTION_POLL_MIN_INTERVAL', '2')
+)
+"""Seconds before the first check of an extraction."""
+
+EXTRACTION_POLL_MAX_INTERVAL = float(
+    environ.get('EXTRACTION_POLL_MAX_INTERVAL', '60')
+)
+"""Maximum seconds between checks of an extraction."""
+
+EXTRACTION_POLL_FACTOR = float(environ.get('EXTRACTION_POLL_FACTOR', '2'))
+"""Growth of the interval with each check that finds extraction incomplete."""
+
+EXTRACTION_TTL = int(environ.get('EXTRACTION_TTL', '86400'))
+"""Seconds after which an extraction is no longer tracked."""
+
 # --- UPSTREAM SERVICE INTEGRATIONS ---
 #
 # See https://kubernetes.io/docs/concepts/services-networking/service/#environment-variables
 # for details on service DNS and environment variables in k8s.
 
+# Shared transport for HTTP service integrations. These may be overridden for
+# an individual service, e.g. ``COMPILER_MAX_IN_FLIGHT``. See
+# :mod:`arxiv.submission.services.transport`.
+HTTP_POOL_MAXSIZE = int(environ.get('HTTP_POOL_MAXSIZE', '10'))
+"""Maximum number of idle connections kept open to each service host."""
+
+HTTP_KEEPALIVE = int(environ.get('HTTP_KEEPALIVE', '60'))
+"""Idle seconds before TCP keep-alive probes are sent; ``0`` to disable."""
+
+HTTP_MAX_IN_FLIGHT = int(environ.get('HTTP_MAX_IN_FLIGHT', '0'))
+"""Maximum concurrent requests to each service; ``0`` for no limit."""
+
+HTTP_IN_FLIGHT_TIMEOUT = float(environ.get('HTTP_IN_FLIGHT_TIMEOUT', '10'))
+"""Seconds to wait for a request slot before failing."""
+
+# Health checks and circuit breakers for upstream services. See
+# :mod:`arxiv.submission.services.health`.
+HEALTH_CHECK_INTERVAL = float(environ.get('HEALTH_CHECK_INTERVAL', '10'))
+"""Seconds between background health checks; ``0`` to disable."""
+
+HEALTH_CHECK_TTL = float(environ.get('HEALTH_CHECK_TTL', '30'))
+"""Seconds for which the result of a health check is used."""
+
+CIRCUIT_BREAKER_THRESHOLD = int(environ.get('CIRCUIT_BREAKER_THRESHOLD', '5'))
+"""Consecutive failures after which calls to a service fail fast."""
+
+CIRCUIT_BREAKER_RESET = float(environ.get('CIRCUIT_BREAKER_RESET', '30'))
+"""Seconds after which a trial call is allowed through an open breaker."""
+
 # Integration with the file manager service.
 FILEMANAGER_HOST = environ.get('FILEMANAGER_SERVICE_HOST', 'arxiv.org')
 """Hostname or addreess of the filemanager service."""
@@ -267,6 +424,25 @@ if FILEMANAGER_PROTO == 'https' and not FILEMANAGER_VERIFY:
     warnings.warn('Certificate verification for filemanager is disabled; this'
                   ' should not be disabled in production.')
 
+# Integration with the legacy filesystem shim. Content larger than a chunk is
+# sent in chunks, so that an upload that fails part of the way through can be
+# resumed. See :meth:`agent.services.filesystem.Filesystem.upload`.
+FILESYSTEM_CHUNK_SIZE = int(
+    environ.get('FILESYSTEM_CHUNK_SIZE', 8 * 1024 * 1024)
+)
+"""Size of each chunk of a chunked upload, in bytes."""
+
+FILESYSTEM_UPLOAD_WORKERS = int(environ.get('FILESYSTEM_UPLOAD_WORKERS', '4'))
+"""Number of chunks of an upload that are sent in parallel."""
+
+FILESYSTEM_CHUNK_RETRIES = int(environ.get('FILESYSTEM_CHUNK_RETRIES', '3'))
+"""Number of times a failed chunk is retried before the upload gives up."""
+
+FILESYSTEM_CHUNK_BACKOFF = float(
+    environ.get('FILESYSTEM_CHUNK_BACKOFF', '0.5')
+)
+"""Seconds to wait before retrying a chunk, doubled with each retry."""
+
 # Integration with the compiler service.
 COMPILER_HOST = environ.get('COMPILER_SERVICE_HOST', 'arxiv.org')
 """Hostname or addreess of the compiler service."""
@@ -30,7 +30,12 @@ The event lifecycle from the perspective of the consumer looks like this:
    using :func:`.rules.evaluate`. A :class:`.Rule` maps a condition (the event
    type and event/submission properties) to a :class:`.Process`.
 4. The agent dispatches any triggered :class:`.Proccess` instances to the
-   :mod:`agent.worker` using the :class:`.AsyncProcessRunner`.
+   :mod:`agent.worker` using the :class:`.AsyncProcessRunner`. Processes
+   triggered by the records in a single batch are collected, and dispatched
+   together over a single broker connection once the whole batch has been
+   evaluated. The consumer checkpoints only after the batch is enqueued.
+   Dispatches are recorded in the agent database, so that processes are not
+   dispatched again if records are replayed (e.g. after a restart).
 
 
 Components
@@ -52,11 +57,26 @@ to the :mod:`agent.worker` using the :class:`.AsyncProcessRunner`.
 
 The :class:`SubmissionEventConsumer` relies on the
 :class:`.DatabaseCheckpointManager` to keep track of its progress in the
-``SubmissionEvents`` stream.
+``SubmissionEvents`` stream. Checkpoints are coalesced (see
+``CHECKPOINT_INTERVAL`` and ``CHECKPOINT_EVERY``), and the most recent
+position is flushed when the consumer stops.
+
+If ``CONSUMER_WORKERS`` is greater than one, the records in each batch are
+partitioned by submission, and the partitions are handled concurrently by a
+pool of worker threads. Records for the same submission are always handled in
+order, by the same thread. The position of the consumer only advances past
+records for which every preceding record in the batch was handled
+successfully.
 
 The :mod:`agent.services.database` integration module provides access to the
 agent database. Specifically, it supports creating and loading checkpoints,
-and storing information about process-relevant events.
+and storing information about process-relevant events. Process status events
+older than ``EVENT_RETENTION`` days are compacted into daily rollups by a
+separate job; see :mod:`agent.compact`.
+
+If ``EXTRACTION_POLLER_ENABLED`` is set, the consumer also runs the
+:class:`.ExtractionPoller`, which checks the status of plain text extractions
+on behalf of the worker. See :mod:`agent.poller`.
 
 Processes are defined in :mod:`agent.process`. Each process is a subclass of
 :class:`.Process`, and may have one or more steps.
@@ -76,8 +96,13 @@ asynchronous tasks carried out by the :mod:`agent.worker`.
 
 import json
 import os
+import threading
 import time
-from typing import List, Any, Optional, Dict, Tuple, Union
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Any, Optional, Dict, Tuple, Union, Iterator, \
+    Sequence, Set
 
 from flask import Flask
 from retry import retry
@@ -99,10 +124,14 @@ from .factory import create_app
 from .domain import Trigger
 from .runner import AsyncProcessRunner
 from .process import Process
+from .poller import ExtractionPoller
 
 logger = logging.getLogger(__name__)
 logger.propagate = False
 
+Dispatch = Tuple[str, Process, Trigger]
+"""The name of a matching rule, the triggered process, and its trigger."""
+
 
 class SubmissionEventConsumer(consumer.BaseConsumer):
     """
@@ -121,6 +150,12 @@ class SubmissionEventConsumer(consumer.BaseConsumer):
         """Initialize a secrets manager before starting."""
         self._config = config
         self._app: Optional[Flask] = kwargs.pop('app', None)
+        self._pending: List[Dispatch] = []
+        self._pending_lock = threading.Lock()
+        self._dispatch_ttl = int(self._config.get('DISPATCH_TTL', 604_800))
+        self._extraction_ttl = int(self._config.get('EXTRACTION_TTL', 86_400))
+        self._last_expired: Optional[float] = None
+        self._workers = int(self._config.get('CONSUMER_WORKERS', 1))
         super(SubmissionEventConsumer, self).__init__(*args, **kwargs)
         if self._config.get('VAULT_ENABLED'):
             logger.info('Vault enabled; getting secrets')
@@ -170,9 +205,89 @@ class SubmissionEventConsumer(consumer.BaseConsumer):
             time.sleep(self.sleep_after_credentials)
             raise consumer.RestartProcessing('Got fresh credentials')
         super_ret: Tuple[str, int]
-        super_ret = super(SubmissionEventConsumer, self).process_records(start)
+        if self._workers > 1:
+            super_ret = self._process_records_in_parallel(start)
+        else:
+            super_ret = \
+                super(SubmissionEventConsumer, self).process_records(start)
+        self._dispatch_pending()
         return super_ret
 
+    def _process_records_in_parallel(self, start: str) -> Tuple[str, int]:
+        """
+        Retrieve records starting at ``start``, and process them in parallel.
+
+        Records are partitioned by submission ID, so that the records for any
+        one submission are processed in order. The position is advanced only
+        as far as the last record for which all preceding records in the batch
+        were processed successfully.
+        """
+        logger.debug('Get more records, starting at %s', start)
+        try:
+            time.sleep(self.sleep_time)   # Don't get carried away.
+            next_start, response = self.get_records(start, self.batch_size,
+                                                    **self.retry_params)
+        except Exception as exc:
+            self._checkpoint()
+            raise consumer.StopProcessing('Unhandled exception: %s' % exc) \
+                from exc
+        self._check_timeout()
+
+        # Kinesis may replay the record at our current position.
+        records = [record for record in response['Records']
+                   if record['SequenceNumber'] != self.position]
+        logger.debug('Got %i records', len(records))
+
+        Partition = List[Tuple[int, Optional[Tuple[Event, Submission,
+                                                   Submission]]]]
+        partitions: Dict[Optional[int], Partition] = OrderedDict()
+        for index, record in enumerate(records):
+            data = self._decode_record(record)
+            key = data[0].submission_id if data is not None else None
+            partitions.setdefault(key, []).append((index, data))
+
+        done = [False] * len(records)
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            futures = [executor.submit(self._process_partition, part, done)
+                       for part in partitions.values()]
+        errors = [future.exception() for future in futures
+                  if future.exception() is not None]
+
+        processed = 0
+        for record, is_done in zip(records, done):
+            if not is_done:
+                break
+            processed += 1
+            if record['SequenceNumber']:    # Make sure it's set.
+                self.position = record['SequenceNumber']
+        logger.debug('Updated position to %s', self.position)
+        if errors:
+            raise errors[0]
+        return next_start, processed
+
+    def _process_partition(self, partition: Sequence[Tuple[int, Any]],
+                           done: List[bool]) -> None:
+        """Process the (ordered) records for a single submission."""
+        with self._app_context():
+            for index, data in partition:
+                if data is not None:
+                    self._handle_event(*data)
+                done[index] = True
+
+    @contextmanager
+    def _app_context(self) -> Iterator[None]:
+        """Push an application context (if we have an app) in a worker."""
+        if self._app is None:
+            yield
+            return
+        with self._app.app_context():
+            yield
+
+    def _checkpoint(self) -> None:
+        """Make sure that pending processes are dispatched, and checkpoint."""
+        self._dispatch_pending()
+        super(SubmissionEventConsumer, self)._checkpoint()
+
     def process_record(self, record: dict) -> None:
         """
         Evaluate an event against registered rules.
@@ -185,6 +300,14 @@ class SubmissionEventConsumer(consumer.BaseConsumer):
         sub_sequence_number : int
 
         """
+        data = self._decode_record(record)
+        if data is not None:
+            self._handle_event(*data)
+        logger.debug('Done processing record %s', record["SequenceNumber"])
+
+    def _decode_record(self, record: dict) \
+            -> Optional[Tuple[Event, Submission, Submission]]:
+        """Deserialize the event and submission states from a record."""
         logger.info(f'Processing record %s', record["SequenceNumber"])
         try:
             data = loads(record['Data'].decode('utf-8'))
@@ -198,11 +321,14 @@ class SubmissionEventConsumer(consumer.BaseConsumer):
         # notification that other services might use to verify their ability
         # to write to the stream.
         try:
-            event, before, after = data['event'], data['before'], data['after']
+            return data['event'], data['before'], data['after']
         except KeyError:
             logger.info('Skipping record %s', record["SequenceNumber"])
-            return
+            return None
 
+    def _handle_event(self, event: Event, before: Submission,
+                      after: Submission) -> None:
+        """Store process-related events, and queue triggered processes."""
         # We want to keep track of process-related events, so that we can
         # reconstruct what happened if necessary.
         if type(event) is AddProcessStatus:
@@ -211,9 +337,9 @@ class SubmissionEventConsumer(consumer.BaseConsumer):
         # rules.evaluate() will yield any processes and corresponding
         # configuration paramters that are triggered by matching rules.
         logger.debug('Evaluating event %s', event.event_id)
-        for process, params in rules.evaluate(event, before, after):
-            self._dispatch_process(process, params, event, before, after)
-        logger.debug('Done processing record %s', record["SequenceNumber"])
+        for rule, process, params in rules.match(event, before, after):
+            self._queue_process(rule.name, process, params, event, before,
+                                after)
 
     @retry(backoff=2, jitter=(0, 1), logger=logger)
     def _store_event(self, event: AddProcessStatus) -> None:
@@ -221,20 +347,97 @@ class SubmissionEventConsumer(consumer.BaseConsumer):
         database.store_event(event)
         logger.debug('..stored.')
 
-    @retry(backoff=2, jitter=(0, 1), logger=logger)
-    def _dispatch_process(self, process: Process, params: Dict[str, Any],
-                          event: Event, before: Submission,
-                          after: Submission) -> None:
+    def _queue_process(self, rule_name: str, process: Process,
+                       params: Dict[str, Any], event: Event,
+                       before: Submission, after: Submission) -> None:
+        """Queue a triggered process to be dispatched with the batch."""
         trigger = Trigger(event=event, before=before, after=after,
                           actor=event.creator, params=params)
-
-        logger.debug('starting process %s', process.name)
-        runner = AsyncProcessRunner(process)
-        runner.run(trigger)
+        with self._pending_lock:
+            self._pending.append((rule_name, process, trigger))
         logger.info('Event %s on submission %s caused %s with params %s',
                     event.event_id, event.submission_id, process.name,
                     params)
 
+    def _dispatch_pending(self) -> None:
+        """
+        Dispatch all of the processes triggered by the current batch.
+
+        Records may be replayed (e.g. if the consumer restarts before it is
+        able to checkpoint), so we skip any process that was already
+        dispatched for the same event and rule.
+        """
+        if not self._pending:
+            return
+        start = time.time()
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        sent: List[Dispatch] = []
+        try:
+            dispatched = self._get_dispatched(pending)
+            to_dispatch = [(rule_name, process, trigger)
+                           for rule_name, process, trigger in pending
+                           if (trigger.event.event_id, rule_name)
+                           not in dispatched]
+            self._dispatch_batch(to_dispatch, sent)
+        except Exception:
+            # The processes that did go out are recorded, so that they are
+            # skipped when the batch is dispatched again.
+            if sent:
+                self._store_dispatched(sent)
+            with self._pending_lock:
+                self._pending = pending + self._pending
+            raise
+        self._store_dispatched(to_dispatch)
+        logger.info('Dispatched %i processes (skipped %i) in %.3f seconds',
+                    len(to_dispatch), len(pending) - len(to_dispatch),
+                    time.time() - start)
+        self._expire_old_records()
+
+    @retry(backoff=2, jitter=(0, 1), logger=logger)
+    def _get_dispatched(self, pending: List[Dispatch]) -> Set[Tuple[str, str]]:
+        keys = {(trigger.event.event_id, rule_name)
+                for rule_name, _, trigger in pending}
+        return database.get_dispatched(keys, self._dispatch_ttl)
+
+    @retry(tries=5, backoff=2, jitter=(0, 1), logger=logger)
+    def _dispatch_batch(self, pending: List[Dispatch],
+                        sent: List[Dispatch]) -> int:
+        """
+        Dispatch the processes in ``pending`` that are not yet in ``sent``.
+
+        Processes are dispatched in order, and each is added to ``sent`` as
+        soon as it goes out, so that a retry after a partial failure picks up
+        where the last attempt left off.
+        """
+        remaining = pending[len(sent):]
+        unsent = iter(remaining)
+        logger.debug('starting %i processes', len(remaining))
+        return AsyncProcessRunner.run_batch(
+            [(process, trigger) for _, process, trigger in remaining],
+            on_dispatch=lambda *_: sent.append(next(unsent))
+        )
+
+    @retry(backoff=2, jitter=(0, 1), logger=logger)
+    def _store_dispatched(self, dispatched: List[Dispatch]) -> None:
+        database.store_dispatched([
+            (trigger.event.event_id, rule_name, process.process_id)
+            for rule_name, process, trigger in dispatched
+        ])
+
+    def _expire_old_records(self) -> None:
+        """Forget old dispatches and extractions, at most hourly."""
+        now = time.time()
+        if self._last_expired is not None and now - self._last_expired < 3600:
+            return
+        try:
+            database.expire_dispatched(self._dispatch_ttl)
+            database.expire_extractions(self._extraction_ttl)
+        except database.Unavailable as e:
+            logger.error('Could not expire old records: %s', e)
+            return
+        self._last_expired = now
+
     def new_client(self) -> boto3.client:
         """Generate a new Kinesis client."""
         params: Dict[str, Any] = {'region_name': self.region,
@@ -287,20 +490,47 @@ class SubmissionEventConsumer(consumer.BaseConsumer):
 
 
 class DatabaseCheckpointManager:
-    """Provides db-backed loading and updating of consumer checkpoints."""
+    """
+    Provides db-backed loading and updating of consumer checkpoints.
 
-    def __init__(self, shard_id: str) -> None:
+    Checkpoints are coalesced: a position is only written to the database
+    once ``interval`` seconds have elapsed or ``every`` checkpoints have been
+    requested since the last write, whichever comes first. Call
+    :meth:`flush` to write the most recent position regardless.
+    """
+
+    def __init__(self, shard_id: str, interval: float = 0, every: int = 1,
+                 history: int = 100) -> None:
         """Get the last checkpoint."""
         self.shard_id = shard_id
+        self.interval = interval
+        self.every = every
+        self.history = history
         self.position = database.get_latest_position(self.shard_id)
+        self._stored = self.position
+        self._requested = 0
+        self._last_stored = time.monotonic()
 
     def checkpoint(self, position: str) -> None:
         """Checkpoint at ``position``."""
+        self.position = position
+        self._requested += 1
+        if self._requested >= self.every \
+                or time.monotonic() - self._last_stored >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the most recent position, if it has not been stored yet."""
+        if self.position is None or self.position == self._stored:
+            return
         try:
-            database.store_position(position, self.shard_id)
-            self.position = position
+            database.store_position(self.position, self.shard_id,
+                                    history=self.history)
         except Exception as e:
             raise consumer.CheckpointError('Could not checkpoint') from e
+        self._stored = self.position
+        self._requested = 0
+        self._last_stored = time.monotonic()
 
 
 def process_stream(app: Flask, duration: Optional[int] = None) -> None:
@@ -316,11 +546,25 @@ def process_stream(app: Flask, duration: Optional[int] = None) -> None:
     """
     # We use the Flask application instance for configuration, and to manage
     # integrations with metadata service, search index.
-    checkpointer = DatabaseCheckpointManager(app.config['KINESIS_SHARD_ID'])
-    consumer.process_stream(SubmissionEventConsumer, app.config,
-                            checkpointmanager=checkpointer,
-                            duration=duration,
-                            extra=dict(app=app, config=app.config))
+    checkpointer = DatabaseCheckpointManager(
+        app.config['KINESIS_SHARD_ID'],
+        interval=float(app.config.get('CHECKPOINT_INTERVAL', 10)),
+        every=int(app.config.get('CHECKPOINT_EVERY', 20)),
+        history=int(app.config.get('CHECKPOINT_HISTORY', 100))
+    )
+    if app.config.get('EXTRACTION_POLLER_ENABLED'):
+        ExtractionPoller.from_config(app.config).start(app)
+    try:
+        consumer.process_stream(SubmissionEventConsumer, app.config,
+                                checkpointmanager=checkpointer,
+                                duration=duration,
+                                extra=dict(app=app, config=app.config))
+    finally:
+        # Make sure that we don't lose track of coalesced checkpoints.
+        try:
+            checkpointer.flush()
+        except consumer.CheckpointError as e:
+            logger.error('Could not store final checkpoint: %s', e)
 
 
 def start_agent() -> None:
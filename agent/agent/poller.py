@@ -0,0 +1,208 @@
+"""
+Shared polling of plain text extraction status.
+
+Rather than each :class:`.PlainTextExtraction` task polling the plain text
+service on its own retry schedule, tasks register the extraction that they are
+waiting for (see :func:`track`), and then check its status in the agent
+database (see :func:`get_status`). A single :class:`.ExtractionPoller`, run
+alongside the consumer, checks the status of due extractions in batches and
+records the results.
+
+Each extraction is checked ``EXTRACTION_POLL_MIN_INTERVAL`` seconds after it
+is registered, and the interval grows by ``EXTRACTION_POLL_FACTOR`` with each
+check that finds it still in progress, up to ``EXTRACTION_POLL_MAX_INTERVAL``
+seconds. Tasks are retried at about the time the next check is due.
+
+If the plain text service (or a stream consumer) can tell us that an extraction
+is complete, it should do so via :func:`notify_complete`; waiting tasks will
+then pick up the result without further polling.
+"""
+
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from flask import Flask
+from pytz import UTC
+
+from arxiv.base import logging
+from arxiv.base.globals import get_application_config
+from arxiv.integration.api import exceptions
+from arxiv.submission import System
+from arxiv.submission.auth import get_system_token, get_fulltext_scopes
+from arxiv.submission.services import PlainTextService
+from arxiv.submission.services.plaintext import ExtractionFailed
+
+from .services import database
+from .services.database import Extraction
+
+logger = logging.getLogger(__name__)
+logger.propagate = False
+
+IN_PROGRESS = Extraction.IN_PROGRESS
+SUCCEEDED = Extraction.SUCCEEDED
+FAILED = Extraction.FAILED
+
+
+class ExtractionPoller:
+    """Checks the status of registered extractions in batches."""
+
+    def __init__(self, batch_size: int = 50, min_interval: float = 2.,
+                 max_interval: float = 60., factor: float = 2.) -> None:
+        """Set the polling parameters."""
+        self.batch_size = batch_size
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.agent = System(__name__)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'ExtractionPoller':
+        """Get a poller using parameters from an application config."""
+        return cls(
+            batch_size=int(config.get('EXTRACTION_POLL_BATCH_SIZE', 50)),
+            min_interval=float(config.get('EXTRACTION_POLL_MIN_INTERVAL', 2)),
+            max_interval=float(config.get('EXTRACTION_POLL_MAX_INTERVAL', 60)),
+            factor=float(config.get('EXTRACTION_POLL_FACTOR', 2))
+        )
+
+    def interval(self, checks: int) -> float:
+        """Get the number of seconds to wait after ``checks`` checks."""
+        return min(self.min_interval * self.factor ** checks,
+                   self.max_interval)
+
+    def poll_once(self) -> int:
+        """
+        Check the status of extractions that are due, and record the results.
+
+        Returns
+        -------
+        int
+            The number of extractions that were checked.
+
+        """
+        due = database.get_due_extractions(self.batch_size)
+        if not due:
+            return 0
+        now = datetime.now(UTC)
+        updates = []
+        for source_id, checksum, checks in due:
+            token = get_system_token(__name__, self.agent,
+                                     get_fulltext_scopes(source_id))
+            status = IN_PROGRESS
+            try:
+                if PlainTextService.extraction_is_complete(source_id,
+                                                           checksum, token):
+                    status = SUCCEEDED
+            except ExtractionFailed:
+                status = FAILED
+            except (exceptions.RequestFailed, exceptions.ConnectionFailed,
+                    exceptions.BadResponse) as e:
+                # Leave it to the next check; the interval still grows, so
+                # that we don't hammer a service that is struggling.
+                logger.error('Could not check extraction %s: %s',
+                             source_id, e)
+            next_check = now + timedelta(seconds=self.interval(checks + 1))
+            updates.append((source_id, checksum, status, next_check))
+        database.update_extractions(updates)
+        return len(due)
+
+    def seconds_until_due(self) -> float:
+        """Get the number of seconds until the next extraction is due."""
+        next_check = database.get_next_extraction_check()
+        if next_check is None:
+            return self.max_interval
+        delay = (next_check - datetime.now(UTC)).total_seconds()
+        return min(max(delay, 0.), self.max_interval)
+
+    def run(self, app: Flask, stop: Optional[threading.Event] = None) -> None:
+        """Poll until ``stop`` is set (or forever)."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            delay = self.min_interval
+            with app.app_context():
+                try:
+                    if self.poll_once() < self.batch_size:
+                        delay = max(self.seconds_until_due(), 0.1)
+                    else:
+                        delay = 0.
+                except Exception as e:
+                    # Tasks depend on the poller to make progress, so it
+                    # must not die on a transient error.
+                    logger.error('Could not poll extractions: %s', e)
+            stop.wait(delay)
+
+    def start(self, app: Flask) -> threading.Thread:
+        """Poll in a background thread."""
+        thread = threading.Thread(target=self.run, args=(app,),
+                                  name='extraction-poller')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+def is_enabled() -> bool:
+    """Determine whether extractions are tracked by the shared poller."""
+    return bool(get_application_config().get('EXTRACTION_POLLER_ENABLED'))
+
+
+def track(source_id: str, checksum: str, restart: bool = False) -> float:
+    """
+    Start tracking an extraction.
+
+    Pass ``restart=True`` when a new extraction has been requested, so that
+    the result of an earlier extraction of the same content is forgotten.
+
+    Returns
+    -------
+    float
+        Seconds until the status of the extraction will be checked.
+
+    """
+    delay = ExtractionPoller.from_config(get_application_config()).interval(0)
+    database.track_extraction(source_id, checksum,
+                              datetime.now(UTC) + timedelta(seconds=delay),
+                              restart=restart)
+    return delay
+
+
+def get_status(source_id: str, checksum: str) \
+        -> Optional[Tuple[str, float]]:
+    """
+    Get the status of a tracked extraction.
+
+    An extraction in progress that is overdue for a check by more than the
+    longest interval between checks is treated as if it were not tracked:
+    the poller is not keeping up (or not running), so the caller should
+    check the service itself.
+
+    Returns
+    -------
+    str or None
+        One of :const:`IN_PROGRESS`, :const:`SUCCEEDED`, or :const:`FAILED`;
+        ``None`` if the extraction is not tracked, or the poller is behind.
+    float
+        Seconds until the status of the extraction will next be checked; at
+        least the shortest interval between checks.
+
+    """
+    result = database.get_extraction(source_id, checksum)
+    if result is None:
+        return None
+    status, next_check = result
+    params = ExtractionPoller.from_config(get_application_config())
+    delay = (next_check - datetime.now(UTC)).total_seconds()
+    if status == IN_PROGRESS and delay < -params.max_interval:
+        logger.warning('Extraction %s is overdue for a check by %.0f s',
+                       source_id, -delay)
+        return None
+    return status, max(delay, params.min_interval)
+
+
+def notify_complete(source_id: str, checksum: str,
+                    failed: bool = False) -> None:
+    """Record that an extraction has finished, e.g. on a callback."""
+    database.update_extractions([
+        (source_id, checksum, FAILED if failed else SUCCEEDED,
+         datetime.now(UTC))
+    ])
@@ -13,7 +13,8 @@ Processes are implemented by defining a class that inherits from
 :class:`.Process`\.
 """
 
-from .base import Process, ProcessType, step, Recoverable, Failed, Retry
+from .base import Process, ProcessType, step, retired_step, Recoverable, \
+    Failed, Retry, Saturated
 from .classification_and_content import \
     PlainTextExtraction, \
     RunAutoclassifier, \
@@ -0,0 +1,234 @@
+"""
+Adaptive concurrency limits and retry budgets for downstream services.
+
+When a downstream service (e.g. the classifier) slows down, every worker will
+otherwise keep calling it, and retries of failed steps only add to the load.
+Steps that call such a service should do so via :func:`limit`:
+
+.. code-block:: python
+
+   with backpressure.limit('classifier'):
+       Classifier.classify(content)
+
+
+The number of concurrent calls to each service is limited using an
+additive-increase/multiplicative-decrease (AIMD) scheme: the limit grows by
+one for every "window" of calls that complete within the latency target, and
+is halved whenever a call fails or is too slow. If the service is saturated,
+:class:`.Saturated` is raised without calling the service, and the step is
+deferred.
+
+Each service also has a retry budget. Calls deposit a fraction of a token
+(``RETRY_BUDGET_RATIO``), and a retry following a failed call withdraws a whole
+token. When the budget is exhausted, retries are deferred by
+``RETRY_BUDGET_DEFER`` seconds so that they don't amplify an outage.
+
+Worker processes on the same host coordinate via small state files in
+``BACKPRESSURE_STATE_DIR``, which are locked with :func:`fcntl.flock` during
+updates. Slots held by processes that have died are reclaimed.
+
+Parameters are read from the application config, and may be set for all
+services (e.g. ``LIMIT_MAX``) or for a single service (e.g.
+``CLASSIFIER_LIMIT_MAX``).
+"""
+
+import fcntl
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from arxiv.base import logging
+from arxiv.base.globals import get_application_config
+
+from .base import Recoverable, Saturated
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS: Dict[str, Any] = {
+    'LIMIT_INITIAL': 4,
+    'LIMIT_MIN': 1,
+    'LIMIT_MAX': 32,
+    'LIMIT_LATENCY_TARGET': 10.,
+    'RETRY_BUDGET_RATIO': 0.2,
+    'RETRY_BUDGET_MIN_RATE': 0.1,
+    'RETRY_BUDGET_MAX': 20.,
+    'RETRY_BUDGET_DEFER': 300,
+}
+"""Default parameters for all services."""
+
+
+class ServiceLimit:
+    """Shared concurrency limit and retry budget for a downstream service."""
+
+    def __init__(self, service: str, state_dir: str,
+                 **params: Any) -> None:
+        """Set the state file and parameters for ``service``."""
+        self.service = service
+        self.path = os.path.join(state_dir, f'{service}.json')
+        self.params = dict(DEFAULTS, **params)
+
+    @contextmanager
+    def _state(self) -> Iterator[Dict[str, Any]]:
+        """Lock, load, and (on exit) store the shared state."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                content = f.read()
+                state = json.loads(content) if content else {}
+                state.setdefault('limit', float(self.params['LIMIT_INITIAL']))
+                state.setdefault('holders', {})
+                state.setdefault('tokens',
+                                 float(self.params['RETRY_BUDGET_MAX']))
+                state.setdefault('updated', time.time())
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def acquire(self) -> bool:
+        """Take a slot, if one is available."""
+        pid = str(os.getpid())
+        with self._state() as state:
+            holders = {holder: n for holder, n in state['holders'].items()
+                       if holder == pid or _is_alive(int(holder))}
+            state['holders'] = holders
+            if sum(holders.values()) >= int(state['limit']):
+                return False
+            holders[pid] = holders.get(pid, 0) + 1
+            self._refill(state)
+            state['tokens'] = min(
+                state['tokens'] + self.params['RETRY_BUDGET_RATIO'],
+                self.params['RETRY_BUDGET_MAX']
+            )
+            return True
+
+    def release(self, succeeded: Optional[bool], latency: float) -> None:
+        """
+        Give back a slot, and adjust the limit based on the outcome.
+
+        If ``succeeded`` is ``None``, the outcome says nothing about the health
+        of the service (e.g. the request was invalid), and the limit is left
+        as it is.
+        """
+        pid = str(os.getpid())
+        with self._state() as state:
+            held = state['holders'].get(pid, 0)
+            if held > 1:
+                state['holders'][pid] = held - 1
+            else:
+                state['holders'].pop(pid, None)
+            limit = state['limit']
+            if succeeded is None:
+                return
+            if succeeded and latency <= self.params['LIMIT_LATENCY_TARGET']:
+                limit += 1 / limit
+            else:
+                limit = limit / 2
+            state['limit'] = max(min(limit, self.params['LIMIT_MAX']),
+                                 self.params['LIMIT_MIN'])
+
+    def withdraw_retry(self) -> bool:
+        """Take a token from the retry budget, if one is available."""
+        with self._state() as state:
+            self._refill(state)
+            if state['tokens'] < 1:
+                return False
+            state['tokens'] -= 1
+            return True
+
+    def _refill(self, state: Dict[str, Any]) -> None:
+        now = time.time()
+        elapsed = max(now - state['updated'], 0)
+        state['tokens'] = min(
+            state['tokens'] + elapsed * self.params['RETRY_BUDGET_MIN_RATE'],
+            self.params['RETRY_BUDGET_MAX']
+        )
+        state['updated'] = now
+
+
+def get_limit(service: str) -> ServiceLimit:
+    """Get the :class:`.ServiceLimit` for a service, using the app config."""
+    config = get_application_config()
+    state_dir = config.get('BACKPRESSURE_STATE_DIR',
+                           os.path.join(tempfile.gettempdir(),
+                                        'submission-agent-limits'))
+    params = {}
+    for key, default in DEFAULTS.items():
+        value = config.get(f'{service.upper()}_{key}', config.get(key))
+        if value is not None:
+            params[key] = type(default)(value)
+    return ServiceLimit(service, state_dir, **params)
+
+
+@contextmanager
+def limit(service: str) -> Iterator[None]:
+    """
+    Call a downstream service, subject to its concurrency limit.
+
+    A :class:`.Recoverable` exception raised in the block counts as a failure
+    of the service, unless it was raised by a call to another service (i.e.
+    in a nested block). Any other exception (e.g. :class:`.Failed`) leaves
+    the limit unchanged.
+
+    Raises
+    ------
+    :class:`.Saturated`
+        If the service is already handling as many calls as it can.
+
+    """
+    service_limit = get_limit(service)
+    if not service_limit.acquire():
+        logger.debug('%s is saturated; deferring', service)
+        exc = Saturated(f'{service} is saturated; try again')
+        exc.service = service
+        raise exc
+    start = time.monotonic()
+    succeeded: Optional[bool] = None
+    try:
+        yield
+        succeeded = True
+    except Recoverable as exc:
+        # Mark the failure so that the runner can charge the retry to the
+        # retry budget for this service.
+        if getattr(exc, 'service', None) is None:
+            succeeded = False
+            exc.service = service
+        raise
+    finally:
+        service_limit.release(succeeded, time.monotonic() - start)
+
+
+def retry_allowed(exc: Exception) -> bool:
+    """
+    Determine whether the retry budget allows a step to be retried now.
+
+    Only failures of calls to a limited service count against its budget.
+    Steps deferred because the service was saturated did not call it.
+    """
+    service: Optional[str] = getattr(exc, 'service', None)
+    if service is None or isinstance(exc, Saturated):
+        return True
+    return get_limit(service).withdraw_retry()
+
+
+def get_retry_defer(exc: Exception) -> int:
+    """Get the minimum delay for a retry that is not allowed by the budget."""
+    return int(get_limit(getattr(exc, 'service')).params['RETRY_BUDGET_DEFER'])
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
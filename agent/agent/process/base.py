@@ -35,6 +35,16 @@ class Recoverable(RuntimeError):
 class Retry(RuntimeError):
     """The process should be retried."""
 
+    def __init__(self, msg: str, countdown: Optional[float] = None) -> None:
+        """Initialize with support for an optional ``countdown``."""
+        super(Retry, self).__init__(msg)
+        self.countdown = countdown
+        """Seconds to wait before retrying, if the step knows best."""
+
+
+class Saturated(Recoverable):
+    """A downstream service is saturated; the step should be deferred."""
+
 
 class ProcessType(type):
     """
@@ -45,6 +55,12 @@ class ProcessType(type):
 
     Adds a property called ``steps`` to the class, which is a list of instance
     methods that should be called in order to carry out the process.
+
+    A subclass may replace an inherited step by defining another step with the
+    same name, or drop it by defining a (non-step) attribute with that name.
+
+    Also adds a property called ``retired_steps``, with the instance methods
+    marked with :func:`retired_step`.
     """
 
     @classmethod
@@ -54,9 +70,16 @@ class ProcessType(type):
 
     def __new__(self, name: str, bases: Tuple[type], attrs: dict):
         """Identify the ordered steps in the process."""
-        steps = [step for base in bases for step in getattr(base, 'steps', [])]
-        steps += [obj for obj in attrs.values() if is_step(obj)]
+        steps = [attrs.get(step.name, step)
+                 for base in bases for step in getattr(base, 'steps', [])
+                 if step.name not in attrs or is_step(attrs[step.name])]
+        names = [step.name for step in steps]
+        steps += [obj for obj in attrs.values()
+                  if is_step(obj) and obj.name not in names]
         attrs['steps'] = steps
+        attrs['retired_steps'] = [
+            obj for obj in attrs.values() if is_retired_step(obj)
+        ]
         return type.__new__(self, name, bases, attrs)
 
 
@@ -72,6 +95,15 @@ def step(max_retries: Optional[int] = 3,
     ----------
     max_retries : int
         If provided, the maximum number of times to retry the step.
+    delay : int
+        The base number of seconds to wait before retrying.
+    backoff : int
+        The factor by which the delay grows after each retry. If ``None``, the
+        delay is constant. See :func:`.async_runner.make_countdown`.
+    max_delay : int
+        If provided, the maximum number of seconds to wait before retrying.
+    jitter : int or tuple
+        Range of a random number of seconds to add to the delay.
     """
     def deco(func: Callable) -> Callable:
         setattr(func, '__is_step__', True)
@@ -89,6 +121,38 @@ def is_step(func: Callable) -> bool:
     return getattr(func, '__is_step__', None) is True
 
 
+def retired_step(name: str, **params: Any) -> Callable:
+    """
+    Mark an instance method as standing in for a step that was removed.
+
+    When a step is removed from a process, chains of tasks that were queued
+    before the upgrade may still call it. A retired step is registered as a
+    task under the name of the removed step (see
+    :func:`.async_runner.register_process`), so that those chains can finish,
+    but it is not part of the process. Retired steps should be removed once
+    no chain from an older release can be queued.
+
+    Parameters
+    ----------
+    name : str
+        Name of the step that was removed.
+    params
+        Retry characteristics, as for :func:`step`.
+    """
+    def deco(func: Callable) -> Callable:
+        func = step(**params)(func)
+        delattr(func, '__is_step__')
+        setattr(func, '__is_retired_step__', True)
+        setattr(func, 'name', name)
+        return func
+    return deco
+
+
+def is_retired_step(func: Callable) -> bool:
+    """Check whether ``func`` was marked with :func:`retired_step`."""
+    return getattr(func, '__is_retired_step__', None) is True
+
+
 class Process(metaclass=ProcessType):
     Status = ProcessStatus.Status
 
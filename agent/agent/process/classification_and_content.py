@@ -1,12 +1,13 @@
 """Extract text, and get suggestions, features, and flags from Classifier."""
 
-from typing import Iterable, Optional, Callable, Tuple
+from typing import Iterable, Optional, Callable, Tuple, Union, IO
 from itertools import count
 import time
 from datetime import datetime
 from pytz import UTC
 from contextlib import contextmanager
 
+from arxiv.base import logging
 from arxiv.taxonomy import CATEGORIES, Category
 from arxiv.integration.api import exceptions
 
@@ -16,12 +17,17 @@ from arxiv.submission.domain.flag import Flag, ContentFlag
 from arxiv.submission.domain.annotation import Feature
 from arxiv.submission.domain.agent import Agent, User
 from arxiv.submission.domain.process import ProcessStatus
+from arxiv.submission.auth import get_system_token, get_fulltext_scopes
 from arxiv.submission.services import Classifier, PlainTextService
 from arxiv.submission.services.plaintext import ExtractionFailed
 
-from .base import Process, step, Retry, Recoverable
+from . import backpressure, classifier_cache
+from .. import poller
+from .base import Process, step, retired_step, Retry, Recoverable
 from ..domain import Trigger
 
+logger = logging.getLogger(__name__)
+
 
 class PlainTextExtraction(Process):
     """Extract plain text from a compiled PDF."""
@@ -52,21 +58,56 @@ class PlainTextExtraction(Process):
     def start_extraction(self, previous: Optional, trigger: Trigger,
                          emit: Callable) -> None:
         """Request extraction by the plain text service."""
-        try:
-            PlainTextService.request_extraction(self.source_id(trigger))
-        except Exception as exc:
-            self.handle_plaintext_exception(exc)
+        source_id = self.source_id(trigger)
+        with backpressure.limit('plaintext'):
+            try:
+                PlainTextService.request_extraction(source_id)
+            except Exception as exc:
+                self.handle_plaintext_exception(exc)
+        if poller.is_enabled():
+            # Forget the outcome of any earlier extraction of this content.
+            poller.track(source_id, trigger.after.source_content.checksum,
+                         restart=True)
 
-    @step(max_retries=None, delay=1, backoff=1, jitter=(0, 1))
+    @step(max_retries=None, delay=2, backoff=2, max_delay=60)
     def poll_extraction(self, previous: Optional, trigger: Trigger,
                         emit: Callable) -> None:
-        """Poll the plain text service until extraction is complete."""
+        """
+        Wait until extraction is complete.
+
+        If the shared :mod:`agent.poller` is enabled, we check the status
+        recorded by the poller, and retry when the next check is due. The
+        service is checked directly only if the extraction is not tracked, or
+        if the poller has fallen behind.
+        """
         source_id = self.source_id(trigger)
-        try:
-            complete = PlainTextService.extraction_is_complete(source_id)
-        except Exception as exc:
-            self.handle_plaintext_exception(exc)
+        checksum = trigger.after.source_content.checksum
+        tracked = poller.is_enabled()
+        if tracked:
+            result = poller.get_status(source_id, checksum)
+            if result is not None:
+                status, countdown = result
+                if status == poller.SUCCEEDED:
+                    return
+                if status == poller.FAILED:
+                    self.fail(message='Extraction service failed to extract'
+                                      ' text')
+                raise Retry('Not complete; try again', countdown=countdown)
+        with backpressure.limit('plaintext'):
+            try:
+                token = get_system_token(__name__, self.agent,
+                                         get_fulltext_scopes(source_id))
+                complete = PlainTextService.extraction_is_complete(
+                    source_id, checksum, token
+                )
+            except Exception as exc:
+                self.handle_plaintext_exception(exc)
+        if complete and tracked:
+            poller.notify_complete(source_id, checksum)
         if not complete:
+            if tracked:
+                raise Retry('Not complete; try again',
+                            countdown=poller.track(source_id, checksum))
             raise Retry('Not complete; try again')
 
     @step(max_retries=None)
@@ -74,10 +115,11 @@ class PlainTextExtraction(Process):
                          emit: Callable) -> bytes:
         """Retrieve the extracted plain text."""
         source_id = self.source_id(trigger)
-        try:
-            return PlainTextService.retrieve_content(source_id)
-        except Exception as exc:
-            self.handle_plaintext_exception(exc)
+        with backpressure.limit('plaintext'):
+            try:
+                return PlainTextService.retrieve_content(source_id)
+            except Exception as exc:
+                self.handle_plaintext_exception(exc)
 
 
 class RunAutoclassifier(PlainTextExtraction):
@@ -110,17 +152,88 @@ class RunAutoclassifier(PlainTextExtraction):
             self.fail(exc, 'Unrecoverable exception: %i' % exc.status_code)
         self.fail(exc, 'Unhandled exception')
 
+    # Content is streamed to the classifier in retrieve_and_classify, rather
+    # than retrieved in a step of its own.
+    retrieve_content = None
+
     @step(max_retries=None)
-    def call_classifier(self, content: bytes, trigger: Trigger,
-                        emit: Callable) -> None:
+    def retrieve_and_classify(self, previous: Optional, trigger: Trigger,
+                              emit: Callable) -> None:
+        """
+        Stream the extracted plain text to the autoclassifier.
+
+        The content is read from the plain text service as it is sent to the
+        classifier, so it is never held in memory all at once, nor passed
+        between steps (i.e. through the task backend). If the same content has
+        been classified before (see :mod:`.classifier_cache`), neither service
+        is called.
+        """
+        source_id = self.source_id(trigger)
+        checksum = trigger.after.source_content.checksum
+        cache = classifier_cache.get_cache()
+        if cache is not None:
+            result = cache.get(source_id, checksum)
+            if result is not None:
+                logger.debug('Classifier result for %s is cached', source_id)
+                self.process_result(result, trigger, emit)
+                return
+        # The body of the response is read as it is sent to the classifier,
+        # so the call to the plain text service lasts until then.
+        with backpressure.limit('plaintext'):
+            try:
+                token = get_system_token(__name__, self.agent,
+                                         get_fulltext_scopes(source_id))
+                content = PlainTextService.retrieve_content(source_id,
+                                                            checksum, token)
+            except Exception as exc:
+                self.handle_plaintext_exception(exc)
+            reader = classifier_cache.HashingReader(content)
+            try:
+                result = self.classify(reader)
+            finally:
+                reader.close()
+        if cache is not None and reader.exhausted:
+            cache.set(source_id, checksum, reader.hexdigest(), result)
+        self.process_result(result, trigger, emit)
+
+    # retrieve_content, call_classifier, and process_result were steps up to
+    # appVersion 0.0.1 of the submission-agent chart (deploy/), and chains
+    # queued by that release may still call them. Remove these in the first
+    # release after the one that replaces 0.0.1.
+
+    @retired_step('retrieve_content', max_retries=None)
+    def retired_retrieve_content(self, previous: Optional, trigger: Trigger,
+                                 emit: Callable) -> None:
+        """Retrieve and classify content, for an older chain."""
+        self.retrieve_and_classify(previous, trigger, emit)
+
+    @retired_step('call_classifier', max_retries=None)
+    def retired_call_classifier(self, previous: Optional[bytes],
+                                trigger: Trigger, emit: Callable) -> None:
+        """Classify content retrieved by an older release, if any."""
+        if previous is not None:
+            self.call_classifier(previous, trigger, emit)
+
+    @retired_step('process_result')
+    def retired_process_result(self, previous: Optional, trigger: Trigger,
+                               emit: Callable) -> None:
+        """Do nothing; the result was processed by the previous step."""
+
+    def call_classifier(self, content: Union[bytes, IO[bytes]],
+                        trigger: Trigger, emit: Callable) -> None:
         """Send plain text content to the autoclassifier."""
-        try:
-            # The autoclassifier runs synchronously; it's pretty fast.
-            self.process_result(Classifier.classify(content), trigger, emit)
-        except Exception as exc:
-            self.handle_classifier_exception(exc)
+        self.process_result(self.classify(content), trigger, emit)
+
+    def classify(self, content: Union[bytes, IO[bytes]]) \
+            -> classifier_cache.Result:
+        """Get a result from the autoclassifier."""
+        with backpressure.limit('classifier'):
+            try:
+                # The autoclassifier runs synchronously; it's pretty fast.
+                return Classifier.classify(content)
+            except Exception as exc:
+                self.handle_classifier_exception(exc)
 
-    @step()
     def process_result(self, result: Tuple, trigger: Trigger,
                        emit: Callable) -> None:
         """Process the results returned by the autoclassifier."""
@@ -0,0 +1,183 @@
+"""
+Local cache of classifier results, keyed by the content that was classified.
+
+Previews are often re-confirmed after trivial changes to metadata, which
+triggers :class:`.RunAutoclassifier` again for the same plain text. Results
+are cached in a small SQLite database on local disk, keyed by the SHA-256 of
+the plain text and the version of the classifier. The digest of the text
+extracted from each source package (identified by source ID and checksum) is
+also recorded, so that on a hit neither the text nor the classifier need to
+be requested.
+
+The version is the ``version`` in the classifier service's status response,
+fetched once per worker, so results from one version of the classifier are
+never used for another. If the service doesn't report a version, nothing is
+cached. Workers should be restarted when the classifier is upgraded.
+
+The cache holds at most ``CLASSIFIER_CACHE_MAX_ENTRIES`` results; the least
+recently used are evicted first. If ``CLASSIFIER_CACHE_PATH`` is not set, no
+results are cached.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, IO, Iterator, List, Optional, Tuple
+
+from arxiv.base import logging
+from arxiv.base.globals import get_application_config
+from arxiv.taxonomy import Category
+from arxiv.submission.services import Classifier
+from arxiv.submission.services.classifier.classifier import Counts, Flag, \
+    Suggestion
+
+logger = logging.getLogger(__name__)
+
+Result = Tuple[List[Suggestion], List[Flag], Optional[Counts]]
+
+
+class HashingReader:
+    """Computes the SHA-256 digest of a stream as it is read."""
+
+    def __init__(self, stream: IO[bytes]) -> None:
+        """Wrap ``stream``."""
+        self._stream = stream
+        self._hash = hashlib.sha256()
+        self.exhausted = False
+
+    def read(self, size: int = -1) -> bytes:
+        """Read from the stream, and update the digest."""
+        chunk = self._stream.read(size)
+        if chunk:
+            self._hash.update(chunk)
+        else:
+            self.exhausted = True
+        return chunk
+
+    def close(self) -> None:
+        """Close the underlying stream."""
+        self._stream.close()
+
+    def hexdigest(self) -> str:
+        """Get the digest of the content read so far."""
+        return self._hash.hexdigest()
+
+
+class ClassifierCache:
+    """On-disk LRU cache of classifier results."""
+
+    def __init__(self, path: str, version: str,
+                 max_entries: int = 10_000) -> None:
+        """Set the location and size of the cache."""
+        self.path = path
+        self.version = version
+        self.max_entries = max_entries
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS results (digest TEXT,'
+                         ' version TEXT, result TEXT, accessed REAL,'
+                         ' PRIMARY KEY (digest, version))')
+            conn.execute('CREATE INDEX IF NOT EXISTS results_accessed'
+                         ' ON results (accessed)')
+            conn.execute('CREATE TABLE IF NOT EXISTS sources (source_id TEXT,'
+                         ' checksum TEXT, digest TEXT,'
+                         ' PRIMARY KEY (source_id, checksum))')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, source_id: str, checksum: str) -> Optional[Result]:
+        """Get the cached result for a source package, if there is one."""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT results.digest, results.result FROM sources'
+                ' JOIN results ON results.digest = sources.digest'
+                ' WHERE sources.source_id = ? AND sources.checksum = ?'
+                ' AND results.version = ?',
+                (source_id, checksum, self.version)
+            ).fetchone()
+            if row is None:
+                return None
+            digest, data = row
+            conn.execute('UPDATE results SET accessed = ? WHERE digest = ?'
+                         ' AND version = ?', (time.time(), digest,
+                                              self.version))
+        return _loads(data)
+
+    def set(self, source_id: str, checksum: str, digest: str,
+            result: Result) -> None:
+        """Store the result for content with SHA-256 ``digest``."""
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?)',
+                         (source_id, checksum, digest))
+            conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                         (digest, self.version, _dumps(result), time.time()))
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        count, = conn.execute('SELECT COUNT(*) FROM results').fetchone()
+        if count <= self.max_entries:
+            return
+        conn.execute('DELETE FROM results WHERE rowid IN (SELECT rowid FROM'
+                     ' results ORDER BY accessed LIMIT ?)',
+                     (count - self.max_entries,))
+        conn.execute('DELETE FROM sources WHERE digest NOT IN'
+                     ' (SELECT digest FROM results)')
+
+
+def get_cache() -> Optional[ClassifierCache]:
+    """Get the classifier cache, if one is configured."""
+    config = get_application_config()
+    path = config.get('CLASSIFIER_CACHE_PATH')
+    if not path:
+        return None
+    try:
+        version = _service_version()
+    except Exception as e:
+        logger.error('Could not get the classifier version: %s', e)
+        return None
+    if version is None:
+        return None
+    return ClassifierCache(
+        path, version, int(config.get('CLASSIFIER_CACHE_MAX_ENTRIES', 10_000))
+    )
+
+
+@lru_cache(maxsize=1)
+def _service_version() -> Optional[str]:
+    """Get the version of the classifier service, once per worker."""
+    version = Classifier.get_service_status().get('version')
+    if version is None:
+        logger.warning('Classifier reports no version; results not cached')
+        return None
+    return str(version)
+
+
+def _dumps(result: Result) -> str:
+    suggestions, flags, counts = result
+    return json.dumps({
+        'suggestions': [[str(s.category), s.probability]
+                        for s in suggestions],
+        'flags': [[f.key, f.value] for f in flags],
+        'counts': counts._asdict() if counts is not None else None
+    })
+
+
+def _loads(data: str) -> Result:
+    parsed: Any = json.loads(data)
+    counts = parsed['counts']
+    return ([Suggestion(Category(category), probability)
+             for category, probability in parsed['suggestions']],
+            [Flag(key, value) for key, value in parsed['flags']],
+            Counts(**counts) if counts is not None else None)
@@ -1,15 +1,38 @@
-"""Deposit source content and PDF preview in the legacy filesystem."""
+"""
+Deposit source content and PDF preview in the legacy filesystem.
+
+Before content is copied, the legacy filesystem is asked whether it already
+has it (a cheap ``HEAD`` request). If it does, the copy is skipped, and a
+process status with reason :const:`SKIPPED` is recorded.
+
+Content is downloaded on a separate thread while it is uploaded (see
+:class:`.PipelinedReader`), and its checksum is verified before the last of
+it is sent.
+
+Each deposit is versioned by the time of the event that triggered it (see
+:meth:`_SourceProcess.deposit_version`), so that when deposits for the same
+submission overlap, content for an older event never replaces content for a
+newer one, whichever finishes last.
+"""
 
 from typing import Optional, Callable
 
+from arxiv.base import logging
 from arxiv.users import auth, domain
 from arxiv.integration.api import exceptions
 from arxiv.submission.auth import get_system_token
+from arxiv.submission.domain.event import AddProcessStatus
 from arxiv.submission.services import preview, filemanager
+from arxiv.submission.services.util import PipelinedReader, IntegrityError
 from .base import Process, step, Retry, Recoverable
 from ..domain import Trigger
 from ..services import filesystem
 
+logger = logging.getLogger(__name__)
+
+SKIPPED = 'skipped: identical content already present'
+"""Reason given in the process status when a copy is skipped."""
+
 
 class _SourceProcess(Process):
     """Provides :func:`.source_id`."""
@@ -35,6 +58,58 @@ class _SourceProcess(Process):
             return None
         return trigger.after.source_content.checksum
 
+    def deposit_version(self, trigger: Trigger) -> Optional[int]:
+        """
+        Get the version of a deposit, for ordering deposits.
+
+        This is the time (in microseconds) of the triggering event, or of the
+        last update to the submission if the process was started directly.
+        """
+        if trigger.event is not None and trigger.event.created is not None:
+            when = trigger.event.created
+        elif trigger.after is not None and trigger.after.updated is not None:
+            when = trigger.after.updated
+        else:
+            return None
+        return int(when.timestamp() * 1_000_000)
+
+    def is_present(self, exists: Callable[..., bool], submission_id: int,
+                   checksum: str, step_name: str, emit: Callable) -> bool:
+        """
+        Determine whether the legacy filesystem already has the content.
+
+        If it does, record that the copy is skipped.
+
+        Parameters
+        ----------
+        exists : callable
+            E.g. :meth:`.Filesystem.does_source_exist`.
+        submission_id : int
+        checksum : str
+            Checksum of the content that would be copied.
+        step_name : str
+            Name of the step that would copy the content.
+        emit : callable
+
+        """
+        try:
+            present = exists(submission_id, checksum)
+        except filesystem.ValidationFailed:
+            return False    # There is content, but not the same content.
+        except (exceptions.RequestFailed, exceptions.ConnectionFailed) as e:
+            # The copy itself will tell us if something is really wrong.
+            logger.error('Could not check for existing content: %s', e)
+            return False
+        if not present:
+            return False
+        logger.debug('%s: content for %i already present', self.name,
+                     submission_id)
+        emit(AddProcessStatus(creator=self.agent, process=self.name,
+                              step=step_name,
+                              status=self._success_status(step_name),
+                              process_id=self.process_id, reason=SKIPPED))
+        return True
+
 
 class CopySourceToLegacy(_SourceProcess):
     """Deposit source content in the legacy filesystem."""
@@ -54,6 +129,11 @@ class CopySourceToLegacy(_SourceProcess):
         if upload_id < 0:
             return None
 
+        if self.is_present(fs.does_source_exist, trigger.after.submission_id,
+                           trigger.after.source_content.checksum,
+                           'copy_source_content', emit):
+            return None
+
         scopes = [auth.scopes.READ_UPLOAD.for_resource(upload_id)]
         token = get_system_token(__name__, self.agent, scopes)
         try:
@@ -80,18 +160,33 @@ class CopySourceToLegacy(_SourceProcess):
             self.fail(RuntimeError(msg), msg)
             return None
 
+        version = self.deposit_version(trigger)
+        reader = PipelinedReader(reader, checksum)
         try:
-            fs.deposit_source(trigger.after.submission_id, reader, checksum)
+            fs.deposit_source(trigger.after.submission_id, reader, checksum,
+                              version=version)
         except (exceptions.RequestForbidden, exceptions.RequestUnauthorized,
                 exceptions.BadRequest) as e:
             msg = 'Unrecoverable error while calling filesystem service'
             self.fail(e, msg)
             return None
-        except filesystem.ValidationFailed as e:
+        except filesystem.Superseded as e:
+            if version is None:
+                raise Recoverable('Deposit superseded by a deposit of unknown'
+                                  ' age') from e
+            # A deposit for a more recent event (or a retry of this one) has
+            # started; it is retried until it succeeds, and it brings the
+            # legacy filesystem up to date.
+            logger.info('%s: deposit for %i superseded', self.name,
+                        trigger.after.submission_id)
+            return None
+        except (filesystem.ValidationFailed, IntegrityError) as e:
             raise Recoverable('Integrity could not be verified') from e
         except exceptions.RequestFailed as e:
             raise Recoverable('An (hopefully temporary) error occurred while'
                               ' calling the filesystem service.') from e
+        finally:
+            reader.close()
         return None
 
 
@@ -118,6 +213,18 @@ class CopyPDFPreviewToLegacy(_SourceProcess):
         if upload_id < 0:
             return
 
+        # If we know the checksum of the preview, we can check whether it is
+        # already present without asking the preview service. Otherwise, the
+        # checksum is in the preview response headers, and we can still check
+        # before reading the preview itself.
+        known = trigger.after.preview is not None \
+            and trigger.after.preview.source_checksum == checksum
+        if known and self.is_present(fs.does_preview_exist,
+                                     trigger.after.submission_id,
+                                     trigger.after.preview.preview_checksum,
+                                     'copy_preview', emit):
+            return
+
         scopes = [auth.scopes.READ_UPLOAD.for_resource(upload_id)]
         token = get_system_token(__name__, self.agent, scopes)
 
@@ -133,17 +240,38 @@ class CopyPDFPreviewToLegacy(_SourceProcess):
             raise Recoverable('An (hopefully temporary) error occurred while'
                               ' calling the preview service.') from e
 
+        if not known and self.is_present(fs.does_preview_exist,
+                                         trigger.after.submission_id,
+                                         checksum, 'copy_preview', emit):
+            reader.close()
+            return
+
+        version = self.deposit_version(trigger)
+        reader = PipelinedReader(reader, checksum)
         try:
-            fs.deposit_preview(trigger.after.submission_id, reader, checksum)
+            fs.deposit_preview(trigger.after.submission_id, reader, checksum,
+                               version=version)
         except (exceptions.RequestForbidden, exceptions.RequestUnauthorized,
                 exceptions.BadRequest) as e:
             msg = 'Unrecoverable error while calling filesystem service'
             self.fail(e, msg)
             return None
-        except filesystem.ValidationFailed as e:
+        except filesystem.Superseded as e:
+            if version is None:
+                raise Recoverable('Deposit superseded by a deposit of unknown'
+                                  ' age') from e
+            # A deposit for a more recent event (or a retry of this one) has
+            # started; it is retried until it succeeds, and it brings the
+            # legacy filesystem up to date.
+            logger.info('%s: deposit for %i superseded', self.name,
+                        trigger.after.submission_id)
+            return None
+        except (filesystem.ValidationFailed, IntegrityError) as e:
             raise Recoverable('Integrity could not be verified') from e
         except exceptions.RequestFailed as e:
             raise Recoverable('An (hopefully temporary) error occurred while'
                               ' calling the filesystem service.') from e
+        finally:
+            reader.close()
 
 
@@ -18,6 +18,7 @@ from arxiv.submission.auth import get_system_token, get_compiler_scopes
 
 from arxiv.taxonomy import CATEGORIES, Category
 from ..process import Process, step, Recoverable
+from . import backpressure
 from ..domain import Trigger
 
 PackageEvent = Union[SetUploadPackage, UpdateUploadPackage]
@@ -90,11 +91,13 @@ class CheckPDFSize(Process):
         scopes = get_compiler_scopes(compilation_id)
         token = get_system_token(__name__, self.agent, scopes)
 
-        try:
-            stat = compiler.Compiler.get_status(source_id, source_state, token,
-                                                Compilation.Format.PDF)
-        except Exception as exc:
-            self.handle_compiler_exception(exc)
+        with backpressure.limit('compiler'):
+            try:
+                stat = compiler.Compiler.get_status(source_id, source_state,
+                                                    token,
+                                                    Compilation.Format.PDF)
+            except Exception as exc:
+                self.handle_compiler_exception(exc)
         if stat.status is Compilation.Status.IN_PROGRESS:
             raise Recoverable('Compilation is stil in progress; try again')
         elif stat.status is Compilation.Status.FAILED:
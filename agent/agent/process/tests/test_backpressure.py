@@ -0,0 +1,121 @@
+"""Tests for :mod:`agent.process.backpressure`."""
+
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from ..base import Failed, Recoverable, Saturated
+from .. import backpressure
+
+
+class TestServiceLimit(TestCase):
+    """Concurrency limits are adjusted based on the outcome of calls."""
+
+    def setUp(self):
+        """We have a limit for a service, with its state in a temp dir."""
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+        self.limit = backpressure.ServiceLimit('foo', self.state_dir.name,
+                                               LIMIT_INITIAL=2)
+
+    def _state(self):
+        with self.limit._state() as state:
+            return state
+
+    def test_saturated(self):
+        """No more than ``limit`` calls can be in flight at once."""
+        self.assertTrue(self.limit.acquire())
+        self.assertTrue(self.limit.acquire())
+        self.assertFalse(self.limit.acquire(), 'The service is saturated')
+        self.limit.release(None, 0)
+        self.assertTrue(self.limit.acquire(), 'A slot was freed')
+
+    def test_increase_and_decrease(self):
+        """The limit grows with fast successes, and halves on failures."""
+        for _ in range(4):
+            self.limit.acquire()
+            self.limit.release(True, 0.1)
+        self.assertGreater(self._state()['limit'], 3)
+
+        self.limit.acquire()
+        self.limit.release(False, 0.1)
+        self.assertLess(self._state()['limit'], 2)
+
+        self.limit.acquire()
+        self.limit.release(True, 60)
+        self.assertEqual(self._state()['limit'], 1, 'Slow calls also count'
+                         ' as failures, but the limit has a minimum')
+
+    def test_dead_holders_are_reclaimed(self):
+        """Slots held by processes that no longer exist are reclaimed."""
+        with self.limit._state() as state:
+            state['holders'] = {'999999999': 2}
+        self.assertTrue(self.limit.acquire())
+        self.assertEqual(self._state()['holders'], {str(os.getpid()): 1})
+
+    def test_retry_budget(self):
+        """Retries are allowed only as long as there is budget for them."""
+        limit = backpressure.ServiceLimit('bar', self.state_dir.name,
+                                          RETRY_BUDGET_MAX=2,
+                                          RETRY_BUDGET_MIN_RATE=0)
+        self.assertTrue(limit.withdraw_retry())
+        self.assertTrue(limit.withdraw_retry())
+        self.assertFalse(limit.withdraw_retry(), 'The budget is exhausted')
+        for _ in range(5):
+            limit.acquire()
+            limit.release(True, 0)
+        self.assertTrue(limit.withdraw_retry(), 'Calls earn retries')
+
+
+class TestLimit(TestCase):
+    """Calls to a service are made within its limit."""
+
+    def setUp(self):
+        """The limit state is kept in a temp dir."""
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+        config = {'BACKPRESSURE_STATE_DIR': self.state_dir.name,
+                  'FOO_LIMIT_INITIAL': '1'}
+        patcher = mock.patch(f'{backpressure.__name__}.get_application_config',
+                             return_value=config)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_saturated(self):
+        """If the service is saturated, the step is deferred."""
+        with backpressure.limit('foo'):
+            with self.assertRaises(Saturated) as caught:
+                with backpressure.limit('foo'):
+                    pass
+        self.assertTrue(backpressure.retry_allowed(caught.exception),
+                        'Deferrals do not count against the retry budget')
+
+    def test_recoverable(self):
+        """Recoverable failures are charged to the service's retry budget."""
+        with self.assertRaises(Recoverable) as caught:
+            with backpressure.limit('foo'):
+                raise Recoverable('nope')
+        self.assertEqual(caught.exception.service, 'foo')
+        with mock.patch.object(backpressure.ServiceLimit, 'withdraw_retry',
+                               return_value=False):
+            self.assertFalse(backpressure.retry_allowed(caught.exception))
+
+    def test_nested(self):
+        """A failure is charged to the service whose call failed."""
+        with self.assertRaises(Recoverable) as caught:
+            with backpressure.limit('foo'):
+                with backpressure.limit('bar'):
+                    raise Recoverable('nope')
+        self.assertEqual(caught.exception.service, 'bar')
+        with backpressure.get_limit('foo')._state() as state:
+            self.assertEqual(state['limit'], 1, 'The limit is unchanged')
+            self.assertEqual(state['holders'], {})
+
+    def test_failed(self):
+        """Unrecoverable failures do not affect the limit."""
+        with self.assertRaises(Failed):
+            with backpressure.limit('foo'):
+                raise Failed('nope')
+        with backpressure.get_limit('foo')._state() as state:
+            self.assertEqual(state['limit'], 1)
+            self.assertEqual(state['holders'], {})
@@ -2,7 +2,11 @@
 
 from unittest import TestCase, mock
 import copy
-from datetime import datetime
+import io
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from pytz import UTC
 from arxiv.integration.api import status, exceptions
 
@@ -51,8 +55,9 @@ class TestRequestPlainTextContentExtraction(TestCase):
         self.event = ConfirmPreview(creator=self.creator)
         self.process = PlainTextExtraction(self.submission.submission_id)
 
+    @mock.patch(f'{c_and_c.__name__}.poller.database')
     @mock.patch(f'{c_and_c.__name__}.PlainTextService')
-    def test_start_extraction(self, mock_plaintext):
+    def test_start_extraction(self, mock_plaintext, mock_database):
         """We attempt to start plain text extraction."""
         trigger = Trigger(event=self.event, actor=self.creator,
                           before=self.submission, after=self.submission)
@@ -64,6 +69,10 @@ class TestRequestPlainTextContentExtraction(TestCase):
         self.assertEqual(mock_plaintext.request_extraction.call_args[0][0],
                          self.submission.source_content.identifier,
                          'Request for extraction is made with source ID.')
+        args, kwargs = mock_database.track_extraction.call_args
+        self.assertEqual(args[:2], ('5678', 'a1b2c3d4'))
+        self.assertTrue(kwargs['restart'],
+                        'The outcome of an earlier extraction is forgotten')
 
     @mock.patch(f'{c_and_c.__name__}.PlainTextService')
     def test_missing_source(self, mock_plaintext):
@@ -158,6 +167,10 @@ class TestPollPlainTextContentExtraction(TestCase):
         )
         self.event = ConfirmPreview(creator=self.creator)
         self.process = PlainTextExtraction(self.submission.submission_id)
+        # These tests check the service directly; see
+        # TestPollTrackedExtraction for the shared poller.
+        self.app.config['EXTRACTION_POLLER_ENABLED'] = False
+        self.app.config['JWT_SECRET'] = 'foosecret'
 
     @mock.patch(f'{c_and_c.__name__}.PlainTextService')
     def test_poll_extraction(self, mock_plaintext):
@@ -226,6 +239,125 @@ class TestPollPlainTextContentExtraction(TestCase):
                 self.process.poll_extraction(None, trigger, events.append)
 
 
+class TestPollTrackedExtraction(TestCase):
+    """Test :func:`PlainTextExtraction.poll_extraction` with the poller."""
+
+    def setUp(self):
+        """We have a submission, and the shared poller is enabled."""
+        self.app = create_app()
+        self.app.config['EXTRACTION_POLLER_ENABLED'] = True
+        self.app.config['JWT_SECRET'] = 'foosecret'
+        self.creator = User(native_id=1234, email='something@else.com')
+        self.submission = Submission(
+            submission_id=2347441,
+            creator=self.creator,
+            owner=self.creator,
+            created=datetime.now(UTC),
+            source_content=SubmissionContent(
+                identifier='5678',
+                source_format=SubmissionContent.Format('pdf'),
+                checksum='a1b2c3d4',
+                uncompressed_size=58493,
+                compressed_size=58493
+            )
+        )
+        self.trigger = Trigger(event=ConfirmPreview(creator=self.creator),
+                               actor=self.creator, before=self.submission,
+                               after=self.submission)
+        self.process = PlainTextExtraction(self.submission.submission_id)
+
+    @mock.patch(f'{c_and_c.__name__}.poller.database')
+    @mock.patch(f'{c_and_c.__name__}.PlainTextService')
+    def test_first_poll_registers(self, mock_plaintext, mock_database):
+        """An incomplete extraction is handed over to the poller."""
+        mock_database.get_extraction.return_value = None
+        mock_plaintext.extraction_is_complete.return_value = False
+        with self.app.app_context():
+            with self.assertRaises(c_and_c.Retry) as caught:
+                self.process.poll_extraction(None, self.trigger, [].append)
+
+        self.assertEqual(caught.exception.countdown,
+                         self.app.config['EXTRACTION_POLL_MIN_INTERVAL'],
+                         'Retry when the poller first checks')
+        source_id, checksum, _ = \
+            mock_database.track_extraction.call_args[0]
+        self.assertEqual((source_id, checksum), ('5678', 'a1b2c3d4'))
+
+    @mock.patch(f'{c_and_c.__name__}.poller.database')
+    @mock.patch(f'{c_and_c.__name__}.PlainTextService')
+    def test_in_progress(self, mock_plaintext, mock_database):
+        """The service is not called while the poller is on the job."""
+        mock_database.get_extraction.return_value = (
+            'in_progress', datetime.now(UTC) + timedelta(seconds=30)
+        )
+        with self.app.app_context():
+            with self.assertRaises(c_and_c.Retry) as caught:
+                self.process.poll_extraction(None, self.trigger, [].append)
+
+        self.assertEqual(mock_plaintext.extraction_is_complete.call_count, 0)
+        self.assertGreater(caught.exception.countdown, 25)
+        self.assertLessEqual(caught.exception.countdown, 30)
+
+    @mock.patch(f'{c_and_c.__name__}.poller.database')
+    @mock.patch(f'{c_and_c.__name__}.PlainTextService')
+    def test_due(self, mock_plaintext, mock_database):
+        """A check that is due is left to the poller, a little later."""
+        mock_database.get_extraction.return_value = (
+            'in_progress', datetime.now(UTC) - timedelta(seconds=5)
+        )
+        with self.app.app_context():
+            with self.assertRaises(c_and_c.Retry) as caught:
+                self.process.poll_extraction(None, self.trigger, [].append)
+
+        self.assertEqual(mock_plaintext.extraction_is_complete.call_count, 0)
+        self.assertEqual(caught.exception.countdown,
+                         self.app.config['EXTRACTION_POLL_MIN_INTERVAL'],
+                         'Not retried immediately')
+
+    @mock.patch(f'{c_and_c.__name__}.poller.database')
+    @mock.patch(f'{c_and_c.__name__}.PlainTextService')
+    def test_poller_behind(self, mock_plaintext, mock_database):
+        """The service is checked directly if the poller is not keeping up."""
+        mock_database.get_extraction.return_value = (
+            'in_progress', datetime.now(UTC) - timedelta(seconds=3600)
+        )
+        mock_plaintext.extraction_is_complete.return_value = True
+        with self.app.app_context():
+            res = self.process.poll_extraction(None, self.trigger, [].append)
+
+        self.assertIsNone(res)
+        self.assertEqual(mock_plaintext.extraction_is_complete.call_count, 1)
+        source_id, checksum, status, _ = \
+            mock_database.update_extractions.call_args[0][0][0]
+        self.assertEqual((source_id, checksum, status),
+                         ('5678', 'a1b2c3d4', 'succeeded'),
+                         'The result is shared with other tasks')
+
+    @mock.patch(f'{c_and_c.__name__}.poller.database')
+    @mock.patch(f'{c_and_c.__name__}.PlainTextService')
+    def test_succeeded(self, mock_plaintext, mock_database):
+        """The poller found that the extraction is complete."""
+        mock_database.get_extraction.return_value = (
+            'succeeded', datetime.now(UTC)
+        )
+        with self.app.app_context():
+            res = self.process.poll_extraction(None, self.trigger, [].append)
+
+        self.assertIsNone(res)
+        self.assertEqual(mock_plaintext.extraction_is_complete.call_count, 0)
+
+    @mock.patch(f'{c_and_c.__name__}.poller.database')
+    @mock.patch(f'{c_and_c.__name__}.PlainTextService')
+    def test_failed(self, mock_plaintext, mock_database):
+        """The poller found that the extraction failed."""
+        mock_database.get_extraction.return_value = (
+            'failed', datetime.now(UTC)
+        )
+        with self.app.app_context():
+            with self.assertRaises(Failed):
+                self.process.poll_extraction(None, self.trigger, [].append)
+
+
 class TestRetrievePlainTextContentExtraction(TestCase):
     """Test :func:`PlainTextExtraction.start_extraction`."""
 
@@ -420,6 +552,170 @@ class TestCallClassifier(TestCase):
                 self.process.call_classifier(None, trigger, events.append)
 
 
+class TestRetrieveAndClassify(TestCase):
+    """Test :func:`RunAutoclassifier.retrieve_and_classify`."""
+
+    def setUp(self):
+        """We have a submission."""
+        self.app = create_app()
+        self.app.config['JWT_SECRET'] = 'foosecret'
+        self.app.config['CLASSIFIER_CACHE_PATH'] = ''
+        self.creator = User(native_id=1234, email='something@else.com')
+        self.submission = Submission(
+            submission_id=2347441,
+            creator=self.creator,
+            owner=self.creator,
+            created=datetime.now(UTC),
+            source_content=SubmissionContent(
+                identifier='5678',
+                source_format=SubmissionContent.Format('pdf'),
+                checksum='a1b2c3d4',
+                uncompressed_size=58493,
+                compressed_size=58493
+            )
+        )
+        self.event = ConfirmPreview(creator=self.creator)
+        self.process = RunAutoclassifier(self.submission.submission_id)
+
+    def test_steps(self):
+        """Content is not passed between steps."""
+        self.assertEqual([step.name for step in RunAutoclassifier.steps],
+                         ['start_extraction', 'poll_extraction',
+                          'retrieve_and_classify'])
+
+    def test_retired_steps(self):
+        """Steps from the previous release are kept only as tasks."""
+        self.assertEqual(
+            [step.name for step in RunAutoclassifier.retired_steps],
+            ['retrieve_content', 'call_classifier', 'process_result']
+        )
+
+    @mock.patch(f'{c_and_c.__name__}.Classifier')
+    def test_retired_call_classifier(self, mock_classifier):
+        """Content retrieved by a chain from the previous release is used."""
+        mock_classifier.classify.return_value = (
+            [classifier.classifier.Suggestion('astro-ph.HE', 0.9)],
+            [],
+            classifier.classifier.Counts(32345, 43, 1, 1000)
+        )
+        trigger = Trigger(event=self.event, actor=self.creator,
+                          before=self.submission, after=self.submission)
+        events = []
+        with self.app.app_context():
+            self.process.retired_call_classifier(None, trigger,
+                                                 events.append)
+            self.assertFalse(mock_classifier.classify.called)
+            self.process.retired_call_classifier(b'foo', trigger,
+                                                 events.append)
+        self.assertEqual(mock_classifier.classify.call_args[0][0], b'foo')
+        self.assertIn(AddClassifierResults, [type(e) for e in events])
+
+    @mock.patch(f'{c_and_c.__name__}.Classifier')
+    @mock.patch(f'{c_and_c.__name__}.PlainTextService')
+    def test_retrieve_and_classify(self, mock_plaintext, mock_classifier):
+        """The content stream is passed directly to the classifier."""
+        stream = mock.MagicMock()
+        mock_plaintext.retrieve_content.return_value = stream
+        mock_classifier.classify.return_value = (
+            [classifier.classifier.Suggestion('astro-ph.HE', 0.9)],
+            [],
+            classifier.classifier.Counts(32345, 43, 1, 1000)
+        )
+        trigger = Trigger(event=self.event, actor=self.creator,
+                          before=self.submission, after=self.submission)
+        events = []
+        with self.app.app_context():
+            res = self.process.retrieve_and_classify(None, trigger,
+                                                     events.append)
+
+        self.assertIsNone(res, 'No content is returned')
+        self.assertEqual(mock_plaintext.retrieve_content.call_args[0][:2],
+                         ('5678', 'a1b2c3d4'))
+        self.assertIs(mock_classifier.classify.call_args[0][0]._stream,
+                      stream, 'The content stream is passed on')
+        self.assertTrue(stream.close.called, 'The stream is closed')
+        self.assertIn(AddClassifierResults, [type(e) for e in events])
+
+    @mock.patch(f'{c_and_c.__name__}.backpressure.limit')
+    @mock.patch(f'{c_and_c.__name__}.Classifier')
+    @mock.patch(f'{c_and_c.__name__}.PlainTextService')
+    def test_plaintext_limit_held(self, mock_plaintext, mock_classifier,
+                                  mock_limit):
+        """The call to the plain text service lasts until its body is read."""
+        calls = []
+
+        @contextmanager
+        def limit(service):
+            calls.append(f'acquire {service}')
+            yield
+            calls.append(f'release {service}')
+
+        def classify(content):
+            calls.append('read')
+            return ([], [], classifier.classifier.Counts(1, 1, 1, 1))
+
+        mock_limit.side_effect = limit
+        mock_classifier.classify.side_effect = classify
+        mock_plaintext.retrieve_content.return_value = io.BytesIO(b'foo')
+        trigger = Trigger(event=self.event, actor=self.creator,
+                          before=self.submission, after=self.submission)
+        with self.app.app_context():
+            self.process.retrieve_and_classify(None, trigger, [].append)
+        self.assertEqual(calls, ['acquire plaintext', 'acquire classifier',
+                                 'read', 'release classifier',
+                                 'release plaintext'])
+
+    @mock.patch(f'{c_and_c.classifier_cache.__name__}.Classifier')
+    @mock.patch(f'{c_and_c.__name__}.Classifier')
+    @mock.patch(f'{c_and_c.__name__}.PlainTextService')
+    def test_cached(self, mock_plaintext, mock_classifier, mock_status):
+        """The same content is classified only once."""
+        mock_status.get_service_status.return_value = {'version': '1.2'}
+        c_and_c.classifier_cache._service_version.cache_clear()
+        self.addCleanup(c_and_c.classifier_cache._service_version.cache_clear)
+        mock_plaintext.retrieve_content.side_effect = \
+            lambda *a: io.BytesIO(b'the content')
+
+        def classify(content):
+            while content.read(4):
+                pass
+            return ([classifier.classifier.Suggestion('astro-ph.HE', 0.9)],
+                    [classifier.classifier.Flag('linenos', '1')],
+                    classifier.classifier.Counts(32345, 43, 1, 1000))
+
+        mock_classifier.classify.side_effect = classify
+        trigger = Trigger(event=self.event, actor=self.creator,
+                          before=self.submission, after=self.submission)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.app.config['CLASSIFIER_CACHE_PATH'] = \
+                os.path.join(tmpdir, 'cache.db')
+            events = [[], []]
+            with self.app.app_context():
+                for emitted in events:
+                    self.process.retrieve_and_classify(None, trigger,
+                                                       emitted.append)
+
+        self.assertEqual(mock_plaintext.retrieve_content.call_count, 1)
+        self.assertEqual(mock_classifier.classify.call_count, 1)
+        self.assertEqual([type(e) for e in events[0]],
+                         [type(e) for e in events[1]],
+                         'The cached result is applied in the same way')
+        self.assertEqual(events[0][0].results, events[1][0].results)
+
+    @mock.patch(f'{c_and_c.__name__}.Classifier')
+    @mock.patch(f'{c_and_c.__name__}.PlainTextService')
+    def test_retrieve_fails(self, mock_plaintext, mock_classifier):
+        """The plain text service is down."""
+        mock_plaintext.retrieve_content.side_effect = \
+            raise_http_exception(exceptions.RequestFailed, 500)
+        trigger = Trigger(event=self.event, actor=self.creator,
+                          before=self.submission, after=self.submission)
+        with self.app.app_context():
+            with self.assertRaises(Recoverable):
+                self.process.retrieve_and_classify(None, trigger, [].append)
+        self.assertEqual(mock_classifier.classify.call_count, 0)
+
+
 class TestCheckStopwordCount(TestCase):
     """Test :func:`CheckStopwordCount.check_stop_count`."""
 
@@ -0,0 +1,116 @@
+"""Tests for :mod:`agent.process.classifier_cache`."""
+
+import io
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from arxiv.submission.services.classifier.classifier import Counts, Flag, \
+    Suggestion
+
+from .. import classifier_cache
+
+
+def make_result(words: int) -> classifier_cache.Result:
+    """Make a classifier result."""
+    return ([Suggestion('astro-ph.HE', 0.9)], [Flag('linenos', '1')],
+            Counts(32345, 43, 1, words))
+
+
+class TestClassifierCache(TestCase):
+    """Results are cached by content digest and classifier version."""
+
+    def setUp(self):
+        """We have an empty cache."""
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, 'cache', 'classifier.db')
+        self.cache = classifier_cache.ClassifierCache(self.path, '1.0',
+                                                      max_entries=2)
+
+    def test_get_set(self):
+        """A result is found by source, but only for the same version."""
+        self.assertIsNone(self.cache.get('1', 'abc'))
+        self.cache.set('1', 'abc', 'd1', make_result(1000))
+        self.assertEqual(self.cache.get('1', 'abc'), make_result(1000))
+        self.assertIsNone(self.cache.get('1', 'def'))
+
+        other = classifier_cache.ClassifierCache(self.path, '2.0')
+        self.assertIsNone(other.get('1', 'abc'))
+
+    def test_same_content(self):
+        """Sources with the same content share a result."""
+        self.cache.set('1', 'abc', 'd1', make_result(1000))
+        self.cache.set('2', 'def', 'd1', make_result(1001))
+        self.assertEqual(self.cache.get('1', 'abc'), make_result(1001))
+
+    def test_evict_least_recently_used(self):
+        """The least recently used results are evicted."""
+        with mock.patch(f'{classifier_cache.__name__}.time') as mock_time:
+            for i, source_id in enumerate(['1', '2']):
+                mock_time.time.return_value = i
+                self.cache.set(source_id, 'abc', f'd{source_id}',
+                               make_result(i))
+            mock_time.time.return_value = 2
+            self.cache.get('1', 'abc')
+            mock_time.time.return_value = 3
+            self.cache.set('3', 'abc', 'd3', make_result(3))
+
+        self.assertIsNotNone(self.cache.get('1', 'abc'))
+        self.assertIsNone(self.cache.get('2', 'abc'))
+        self.assertIsNotNone(self.cache.get('3', 'abc'))
+
+
+@mock.patch(f'{classifier_cache.__name__}.Classifier')
+@mock.patch(f'{classifier_cache.__name__}.get_application_config')
+class TestGetCache(TestCase):
+    """The cache is keyed by the version reported by the classifier."""
+
+    def setUp(self):
+        """The classifier version has not yet been fetched."""
+        classifier_cache._service_version.cache_clear()
+        self.addCleanup(classifier_cache._service_version.cache_clear)
+
+    def test_not_configured(self, mock_config, mock_classifier):
+        """There is no cache unless a path is configured."""
+        mock_config.return_value = {}
+        self.assertIsNone(classifier_cache.get_cache())
+        self.assertEqual(mock_classifier.get_service_status.call_count, 0)
+
+    def test_version(self, mock_config, mock_classifier):
+        """The version is fetched from the service once per worker."""
+        mock_config.return_value = {'CLASSIFIER_CACHE_PATH': 'cache.db'}
+        mock_classifier.get_service_status.return_value = {'version': '1.2'}
+        for _ in range(2):
+            self.assertEqual(classifier_cache.get_cache().version, '1.2')
+        self.assertEqual(mock_classifier.get_service_status.call_count, 1)
+
+    def test_no_version(self, mock_config, mock_classifier):
+        """Nothing is cached if the classifier reports no version."""
+        mock_config.return_value = {'CLASSIFIER_CACHE_PATH': 'cache.db'}
+        mock_classifier.get_service_status.return_value = {}
+        self.assertIsNone(classifier_cache.get_cache())
+
+    def test_status_fails(self, mock_config, mock_classifier):
+        """Nothing is cached if the version can't be fetched, for now."""
+        mock_config.return_value = {'CLASSIFIER_CACHE_PATH': 'cache.db'}
+        mock_classifier.get_service_status.side_effect = [
+            RuntimeError('down'), {'version': '1.2'}
+        ]
+        self.assertIsNone(classifier_cache.get_cache())
+        self.assertEqual(classifier_cache.get_cache().version, '1.2')
+
+
+class TestHashingReader(TestCase):
+    """The digest is computed as the stream is read."""
+
+    def test_read(self):
+        """The digest matches the content."""
+        reader = classifier_cache.HashingReader(io.BytesIO(b'foo' * 1000))
+        while reader.read(7):
+            pass
+        self.assertTrue(reader.exhausted)
+        self.assertEqual(
+            reader.hexdigest(),
+            classifier_cache.hashlib.sha256(b'foo' * 1000).hexdigest()
+        )
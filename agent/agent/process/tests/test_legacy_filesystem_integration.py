@@ -1,5 +1,6 @@
 """Tests for :mod:`.process.legacy_filesystem_integration`."""
 
+import io
 import os
 from unittest import TestCase, mock
 from datetime import datetime, timedelta
@@ -14,6 +15,8 @@ from arxiv.submission.domain.agent import Agent, User
 from arxiv.submission.domain.flag import Flag, MetadataFlag
 from arxiv.submission.domain.submission import Submission, SubmissionContent, \
     SubmissionMetadata, Classification, Compilation, Hold
+from arxiv.submission.domain.preview import Preview
+from arxiv.submission.services.util import PipelinedReader
 
 from .. import Failed, Recoverable
 from .. import legacy_filesystem_integration as lfsi
@@ -26,6 +29,12 @@ from .util import raise_http_exception
 os.environ['JWT_SECRET'] = 'foosecret'
 
 
+def mock_filesystem_service(present: bool = False) -> mock.MagicMock:
+    """Make a mock filesystem service that does (not) have the content."""
+    return mock.MagicMock(**{'does_source_exist.return_value': present,
+                             'does_preview_exist.return_value': present})
+
+
 class TestCopySourceToLegacy(TestCase):
     """Test :class:`.CopySourceToLegacy`."""
 
@@ -63,7 +72,7 @@ class TestCopySourceToLegacy(TestCase):
         mock_filemanager = mock.MagicMock()
         mock_filemanager.get_upload_content.return_value \
             = (mock.MagicMock, {'ETag': self.checksum})
-        mock_filesystem = mock.MagicMock()
+        mock_filesystem = mock_filesystem_service()
         MockFilemanager.current_session.return_value = mock_filemanager
         MockFilesystem.current_session.return_value = mock_filesystem
 
@@ -80,7 +89,7 @@ class TestCopySourceToLegacy(TestCase):
         mock_filemanager = mock.MagicMock()
         mock_filemanager.get_upload_content.return_value \
             = (mock.MagicMock, {'ETag': 'foo=='})
-        mock_filesystem = mock.MagicMock()
+        mock_filesystem = mock_filesystem_service()
         MockFilemanager.current_session.return_value = mock_filemanager
         MockFilesystem.current_session.return_value = mock_filesystem
 
@@ -100,7 +109,7 @@ class TestCopySourceToLegacy(TestCase):
         mock_filemanager.get_upload_content.side_effect = \
             raise_http_exception(exceptions.RequestFailed,
                                  status.INTERNAL_SERVER_ERROR)
-        mock_filesystem = mock.MagicMock()
+        mock_filesystem = mock_filesystem_service()
         MockFilemanager.current_session.return_value = mock_filemanager
         MockFilesystem.current_session.return_value = mock_filesystem
 
@@ -119,7 +128,7 @@ class TestCopySourceToLegacy(TestCase):
         mock_filemanager = mock.MagicMock()
         mock_filemanager.get_upload_content.side_effect = \
             raise_http_exception(exceptions.RequestForbidden, status.FORBIDDEN)
-        mock_filesystem = mock.MagicMock()
+        mock_filesystem = mock_filesystem_service()
         MockFilemanager.current_session.return_value = mock_filemanager
         MockFilesystem.current_session.return_value = mock_filesystem
 
@@ -138,7 +147,7 @@ class TestCopySourceToLegacy(TestCase):
         mock_filemanager = mock.MagicMock()
         mock_filemanager.get_upload_content.return_value = \
             (mock.MagicMock, {'ETag': self.checksum})
-        mock_filesystem = mock.MagicMock()
+        mock_filesystem = mock_filesystem_service()
         mock_filesystem.deposit_source.side_effect = \
             raise_http_exception(exceptions.RequestFailed,
                                  status.INTERNAL_SERVER_ERROR)
@@ -153,6 +162,74 @@ class TestCopySourceToLegacy(TestCase):
         self.assertEqual(mock_filesystem.deposit_source.call_count, 1,
                          'Filesystem integration is called')
 
+    @mock.patch(f'{lfsi.__name__}.filesystem.Filesystem')
+    @mock.patch(f'{lfsi.__name__}.filemanager.Filemanager')
+    def test_already_present(self, MockFilemanager, MockFilesystem):
+        """The legacy filesystem already has the source."""
+        mock_filemanager = mock.MagicMock()
+        mock_filesystem = mock_filesystem_service(present=True)
+        MockFilemanager.current_session.return_value = mock_filemanager
+        MockFilesystem.current_session.return_value = mock_filesystem
+
+        trigger = Trigger(event=self.event, actor=self.creator,
+                          before=self.submission, after=self.submission)
+        events = []
+        self.process.copy_source_content(None, trigger, events.append)
+
+        mock_filesystem.does_source_exist.assert_called_once_with(
+            self.submission_id, self.checksum
+        )
+        self.assertEqual(mock_filemanager.get_upload_content.call_count, 0,
+                         'Content is not retrieved')
+        self.assertEqual(mock_filesystem.deposit_source.call_count, 0,
+                         'Content is not deposited')
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].reason, lfsi.SKIPPED,
+                         'The skipped copy is recorded')
+
+    @mock.patch(f'{lfsi.__name__}.filesystem.Filesystem')
+    @mock.patch(f'{lfsi.__name__}.filemanager.Filemanager')
+    def test_superseded(self, MockFilemanager, MockFilesystem):
+        """A more recent deposit for the submission has started."""
+        mock_filemanager = mock.MagicMock()
+        mock_filemanager.get_upload_content.return_value = \
+            (mock.MagicMock(), {'ETag': self.checksum})
+        mock_filesystem = mock_filesystem_service()
+        mock_filesystem.deposit_source.side_effect = filesystem.Superseded
+        MockFilemanager.current_session.return_value = mock_filemanager
+        MockFilesystem.current_session.return_value = mock_filesystem
+
+        self.event.created = datetime(2019, 1, 2, 3, 4, 5, 6, tzinfo=UTC)
+        trigger = Trigger(event=self.event, actor=self.creator,
+                          before=self.submission, after=self.submission)
+
+        self.assertIsNone(
+            self.process.copy_source_content(None, trigger, mock.MagicMock()),
+            'The process finishes without error'
+        )
+        self.assertEqual(
+            mock_filesystem.deposit_source.call_args[1]['version'],
+            1546398245000006, 'The deposit is versioned by the event time'
+        )
+
+    @mock.patch(f'{lfsi.__name__}.filesystem.Filesystem')
+    @mock.patch(f'{lfsi.__name__}.filemanager.Filemanager')
+    def test_superseded_unknown_age(self, MockFilemanager, MockFilesystem):
+        """A deposit of unknown age was superseded."""
+        mock_filemanager = mock.MagicMock()
+        mock_filemanager.get_upload_content.return_value = \
+            (mock.MagicMock(), {'ETag': self.checksum})
+        mock_filesystem = mock_filesystem_service()
+        mock_filesystem.deposit_source.side_effect = filesystem.Superseded
+        MockFilemanager.current_session.return_value = mock_filemanager
+        MockFilesystem.current_session.return_value = mock_filesystem
+
+        trigger = Trigger(actor=self.creator, before=self.submission,
+                          after=self.submission)
+
+        with self.assertRaises(Recoverable):
+            self.process.copy_source_content(None, trigger, mock.MagicMock())
+
     @mock.patch(f'{lfsi.__name__}.filesystem.Filesystem')
     @mock.patch(f'{lfsi.__name__}.filemanager.Filemanager')
     def test_integrity_check_fails(self, MockFilemanager, MockFilesystem):
@@ -161,7 +238,7 @@ class TestCopySourceToLegacy(TestCase):
         mock_reader = mock.MagicMock()
         mock_filemanager.get_upload_content.return_value = \
             (mock_reader, {'ETag': self.checksum})
-        mock_filesystem = mock.MagicMock()
+        mock_filesystem = mock_filesystem_service()
         mock_filesystem.deposit_source.side_effect \
             = filesystem.ValidationFailed
         MockFilemanager.current_session.return_value = mock_filemanager
@@ -174,8 +251,9 @@ class TestCopySourceToLegacy(TestCase):
             self.process.copy_source_content(None, trigger, mock.MagicMock())
         self.assertEqual(mock_filesystem.deposit_source.call_count, 1,
                          'Filesystem integration is called')
-        mock_filesystem.deposit_source.assert_called_with(2347441, mock_reader,
-                                                          self.checksum)
+        mock_filesystem.deposit_source.assert_called_with(
+            2347441, mock.ANY, self.checksum, version=mock.ANY
+        )
 
     @mock.patch(f'{lfsi.__name__}.filesystem.Filesystem')
     @mock.patch(f'{lfsi.__name__}.filemanager.Filemanager')
@@ -185,7 +263,7 @@ class TestCopySourceToLegacy(TestCase):
         mock_reader = mock.MagicMock()
         mock_filemanager.get_upload_content.return_value = \
             (mock_reader, {'ETag': self.checksum})
-        mock_filesystem = mock.MagicMock()
+        mock_filesystem = mock_filesystem_service()
         MockFilemanager.current_session.return_value = mock_filemanager
         MockFilesystem.current_session.return_value = mock_filesystem
 
@@ -195,9 +273,32 @@ class TestCopySourceToLegacy(TestCase):
         self.process.copy_source_content(None, trigger, mock.MagicMock())
         self.assertEqual(mock_filesystem.deposit_source.call_count, 1,
                          'Filesystem integration is called')
-        mock_filesystem.deposit_source.assert_called_with(self.submission_id,
-                                                          mock_reader,
-                                                          self.checksum)
+        mock_filesystem.deposit_source.assert_called_with(
+            self.submission_id, mock.ANY, self.checksum, version=mock.ANY
+        )
+        reader = mock_filesystem.deposit_source.call_args[0][1]
+        self.assertIsInstance(reader, PipelinedReader,
+                              'Content is read ahead while it is sent')
+        self.assertEqual(reader.expected, self.checksum)
+
+    @mock.patch(f'{lfsi.__name__}.filesystem.Filesystem')
+    @mock.patch(f'{lfsi.__name__}.filemanager.Filemanager')
+    def test_source_corrupted(self, MockFilemanager, MockFilesystem):
+        """The source does not match its checksum, and is not all sent."""
+        mock_filemanager = mock.MagicMock()
+        mock_filemanager.get_upload_content.return_value = \
+            (io.BytesIO(b'corrupted'), {'ETag': self.checksum})
+        mock_filesystem = mock_filesystem_service()
+        mock_filesystem.deposit_source.side_effect = \
+            lambda submission_id, reader, checksum, version: reader.read()
+        MockFilemanager.current_session.return_value = mock_filemanager
+        MockFilesystem.current_session.return_value = mock_filesystem
+
+        trigger = Trigger(event=self.event, actor=self.creator,
+                          before=self.submission, after=self.submission)
+
+        with self.assertRaises(Recoverable):
+            self.process.copy_source_content(None, trigger, mock.MagicMock())
 
 
 class TestCopyPDFPreviewToLegacy(TestCase):
@@ -235,7 +336,7 @@ class TestCopyPDFPreviewToLegacy(TestCase):
         )
 
         mock_preview = mock.MagicMock()
-        mock_filesystem = mock.MagicMock()
+        mock_filesystem = mock_filesystem_service()
         MockPreview.current_session.return_value = mock_preview
         MockFilesystem.current_session.return_value = mock_filesystem
 
@@ -257,7 +358,7 @@ class TestCopyPDFPreviewToLegacy(TestCase):
         mock_preview.get_preview.side_effect = \
             raise_http_exception(exceptions.RequestFailed,
                                  status.INTERNAL_SERVER_ERROR)
-        mock_filesystem = mock.MagicMock()
+        mock_filesystem = mock_filesystem_service()
         MockPreview.current_session.return_value = mock_preview
         MockFilesystem.current_session.return_value = mock_filesystem
 
@@ -276,7 +377,7 @@ class TestCopyPDFPreviewToLegacy(TestCase):
         mock_preview = mock.MagicMock()
         mock_preview.get_preview.side_effect = \
             raise_http_exception(exceptions.RequestForbidden, status.FORBIDDEN)
-        mock_filesystem = mock.MagicMock()
+        mock_filesystem = mock_filesystem_service()
         MockPreview.current_session.return_value = mock_preview
         MockFilesystem.current_session.return_value = mock_filesystem
 
@@ -295,7 +396,7 @@ class TestCopyPDFPreviewToLegacy(TestCase):
         mock_preview = mock.MagicMock()
         mock_preview.get_preview.return_value = \
             (mock.MagicMock, {'ETag': self.checksum})
-        mock_filesystem = mock.MagicMock()
+        mock_filesystem = mock_filesystem_service()
         mock_filesystem.deposit_preview.side_effect = \
             raise_http_exception(exceptions.RequestFailed,
                                  status.INTERNAL_SERVER_ERROR)
@@ -318,7 +419,7 @@ class TestCopyPDFPreviewToLegacy(TestCase):
         mock_reader = mock.MagicMock()
         mock_preview.get_preview.return_value = \
             (mock_reader, {'ETag': self.checksum})
-        mock_filesystem = mock.MagicMock()
+        mock_filesystem = mock_filesystem_service()
         mock_filesystem.deposit_preview.side_effect \
             = filesystem.ValidationFailed
         MockPreview.current_session.return_value = mock_preview
@@ -331,9 +432,9 @@ class TestCopyPDFPreviewToLegacy(TestCase):
             self.process.copy_preview(None, trigger, mock.MagicMock())
         self.assertEqual(mock_filesystem.deposit_preview.call_count, 1,
                          'Filesystem integration is called')
-        mock_filesystem.deposit_preview.assert_called_with(2347441,
-                                                           mock_reader,
-                                                           self.checksum)
+        mock_filesystem.deposit_preview.assert_called_with(
+            2347441, mock.ANY, self.checksum, version=mock.ANY
+        )
 
     @mock.patch(f'{lfsi.__name__}.filesystem.Filesystem')
     @mock.patch(f'{lfsi.__name__}.preview.PreviewService')
@@ -343,7 +444,7 @@ class TestCopyPDFPreviewToLegacy(TestCase):
         mock_reader = mock.MagicMock()
         mock_preview.get_preview.return_value = \
             (mock_reader, {'ETag': self.checksum})
-        mock_filesystem = mock.MagicMock()
+        mock_filesystem = mock_filesystem_service()
         MockPreview.current_session.return_value = mock_preview
         MockFilesystem.current_session.return_value = mock_filesystem
 
@@ -353,6 +454,64 @@ class TestCopyPDFPreviewToLegacy(TestCase):
         self.process.copy_preview(None, trigger, mock.MagicMock())
         self.assertEqual(mock_filesystem.deposit_preview.call_count, 1,
                          'Filesystem integration is called')
-        mock_filesystem.deposit_preview.assert_called_with(2347441,
-                                                           mock_reader,
-                                                           self.checksum)
\ No newline at end of file
+        mock_filesystem.deposit_preview.assert_called_with(
+            2347441, mock.ANY, self.checksum, version=mock.ANY
+        )
+        reader = mock_filesystem.deposit_preview.call_args[0][1]
+        self.assertIsInstance(reader, PipelinedReader,
+                              'Content is read ahead while it is sent')
+
+    @mock.patch(f'{lfsi.__name__}.filesystem.Filesystem')
+    @mock.patch(f'{lfsi.__name__}.preview.PreviewService')
+    def test_already_present(self, MockPreview, MockFilesystem):
+        """The legacy filesystem already has the preview."""
+        mock_preview = mock.MagicMock()
+        mock_filesystem = mock_filesystem_service(present=True)
+        MockPreview.current_session.return_value = mock_preview
+        MockFilesystem.current_session.return_value = mock_filesystem
+        self.submission.preview = Preview(
+            source_id=1234, source_checksum=self.checksum,
+            preview_checksum='foopdf==', size_bytes=1234,
+            added=datetime.now(UTC)
+        )
+
+        trigger = Trigger(event=self.event, actor=self.creator,
+                          before=self.submission, after=self.submission)
+        events = []
+        self.process.copy_preview(None, trigger, events.append)
+
+        mock_filesystem.does_preview_exist.assert_called_once_with(
+            self.submission_id, 'foopdf=='
+        )
+        self.assertEqual(mock_preview.get_preview.call_count, 0,
+                         'Preview is not retrieved')
+        self.assertEqual(mock_filesystem.deposit_preview.call_count, 0,
+                         'Preview is not deposited')
+        self.assertEqual([e.reason for e in events], [lfsi.SKIPPED])
+
+    @mock.patch(f'{lfsi.__name__}.filesystem.Filesystem')
+    @mock.patch(f'{lfsi.__name__}.preview.PreviewService')
+    def test_already_present_unknown(self, MockPreview, MockFilesystem):
+        """The preview is present, but we only find out its checksum later."""
+        mock_reader = mock.MagicMock()
+        mock_preview = mock.MagicMock()
+        mock_preview.get_preview.return_value = \
+            (mock_reader, {'ETag': 'foopdf=='})
+        mock_filesystem = mock_filesystem_service(present=True)
+        MockPreview.current_session.return_value = mock_preview
+        MockFilesystem.current_session.return_value = mock_filesystem
+
+        trigger = Trigger(event=self.event, actor=self.creator,
+                          before=self.submission, after=self.submission)
+        events = []
+        self.process.copy_preview(None, trigger, events.append)
+
+        mock_filesystem.does_preview_exist.assert_called_once_with(
+            self.submission_id, 'foopdf=='
+        )
+        self.assertEqual(mock_reader.read.call_count, 0,
+                         'Preview is not read')
+        self.assertEqual(mock_reader.close.call_count, 1)
+        self.assertEqual(mock_filesystem.deposit_preview.call_count, 0,
+                         'Preview is not deposited')
+        self.assertEqual([e.reason for e in events], [lfsi.SKIPPED])
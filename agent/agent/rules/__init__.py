@@ -56,6 +56,26 @@ def evaluate(event: Event, before: Submission, after: Submission) \
         Each item is a two-tuple, composed of a triggered :class:`.Process`
         instance and the configuration parameters with which it should be run.
 
+    """
+    for _, process, params in match(event, before, after):
+        yield process, params
+
+
+def match(event: Event, before: Submission, after: Submission) \
+        -> Iterable[Tuple[Rule, process.Process, Params]]:
+    """
+    Evaluate an event against known rules, and include the matching rules.
+
+    This is the same as :func:`evaluate`, but also provides the
+    :class:`.Rule` that triggered each process.
+
+    Returns
+    -------
+    iterable
+        Each item is a three-tuple, composed of the matching :class:`.Rule`,
+        a triggered :class:`.Process` instance, and the configuration
+        parameters with which it should be run.
+
     """
     logger.debug('evaluate event %s (%s)', event.event_id, type(event))
     for rule in REGISTRY[type(event)]:
@@ -63,7 +83,7 @@ def evaluate(event: Event, before: Submission, after: Submission) \
             logger.debug('event %s matches rule %s', event.event_id, rule.name)
             params = rule.params(event, before, after)
             process = rule.process(event.submission_id)
-            yield process, params
+            yield rule, process, params
 
 
 title_params = make_params('TITLE_SIMILARITY_WINDOW',
@@ -27,7 +27,8 @@ from arxiv.submission.services import classic
 from .. import config
 
 from .base import ProcessRunner
-from ..process import ProcessType, Process, Failed, Recoverable
+from ..process import ProcessType, Process, Failed, Recoverable, Retry, \
+    backpressure
 from ..domain import ProcessData, Trigger
 
 logger = logging.getLogger(__name__)
@@ -58,10 +59,52 @@ class AsyncProcessRunner(ProcessRunner):
         """
         cls.processes[ProcessImpl.__name__] = register_process(ProcessImpl)
 
-    def run(self, trigger: Trigger) -> None:
-        """Run a :class:`.Process` asynchronously."""
+    def run(self, trigger: Trigger, **options: Any) -> None:
+        """
+        Run a :class:`.Process` asynchronously.
+
+        Additional keyword arguments are passed along as publishing options
+        when the process is dispatched; see :func:`register_process`.
+        """
         _run = self.processes[self.process.name]
-        _run(self.process.submission_id, self.process.process_id, trigger)
+        _run(self.process.submission_id, self.process.process_id, trigger,
+             **options)
+
+    @classmethod
+    def run_batch(cls, dispatches: Iterable[Tuple[Process, Trigger]],
+                  on_dispatch: Optional[Callable[[Process, Trigger], None]]
+                  = None) -> int:
+        """
+        Dispatch several processes using a single broker connection.
+
+        Rather than acquiring a producer for every process, all of the
+        processes in ``dispatches`` are published in order over one write
+        connection to the broker.
+
+        Parameters
+        ----------
+        dispatches : iterable
+            Each item is a two-tuple of a :class:`.Process` instance and the
+            :class:`.Trigger` with which it should be run.
+        on_dispatch : callable
+            If given, is called with each process and its trigger as soon as
+            the process has been dispatched, so that the caller knows which
+            processes went out if the batch fails part of the way through.
+
+        Returns
+        -------
+        int
+            The number of processes that were dispatched.
+
+        """
+        dispatched = 0
+        with get_or_create_worker_app().connection_for_write() as connection:
+            for process, trigger in dispatches:
+                cls(process).run(trigger, connection=connection)
+                dispatched += 1
+                if on_dispatch is not None:
+                    on_dispatch(process, trigger)
+        return dispatched
 
 
 def create_worker_app() -> Celery:
@@ -160,27 +203,38 @@ def execute_async_save(*events: Event, submission_id: int = -1):
     get_or_create_worker_app().send_task('save', (*events,), kwargs)
 
 
-def make_countdown(delay: int, backoff: Optional[int] = 1,
+MAX_COUNTDOWN = 3_600
+"""Maximum retry delay (in seconds), if a step does not set ``max_delay``."""
+
+
+def make_countdown(delay: int, backoff: Optional[int] = 2,
                    max_delay: Optional[int] = None,
                    jitter: Union[int, Tuple[int, int]] = 0) \
-        -> Callable[[int], Union[int, float]]:
+        -> Callable[[int], float]:
     """
     Make a countdown callable based on the retry parameters of a step.
 
-    For use in task retry calls, to customize the retry delay.
+    For use in task retry calls, to customize the retry delay. The delay grows
+    exponentially with the number of retries ``n``, up to ``max_delay``, i.e.
+    ``min(delay * backoff ** n, max_delay)``. To keep retries from many workers
+    from arriving together, a random delay of up to that length is used ("full
+    jitter").
 
     Parameters
     ----------
     delay : int
         The base number of seconds to wait before retrying.
     backoff : int
-        If provided, the exponent applied to the delay * number of attempts.
+        If provided, the factor by which the delay is multiplied after each
+        attempt. If ``None``, the delay is constant, and is not randomized.
     max_delay : int
-        If provided, the maximum number of seconds to wait.
+        If provided, the maximum number of seconds to wait. Otherwise,
+        :const:`MAX_COUNTDOWN` is used.
     jitter : int or tuple
-        If an int, number of seconds (+/-) to alter the delay, after the
-        backoff is applied. If a two-tuple of ints,
-        a random offset will be used in the range (jitter[0], jitter[1]).
+        If an int, the delay is altered by a random number of seconds in the
+        range (-jitter, jitter), after the backoff is applied. If a two-tuple
+        of ints, a random offset will be used in the range
+        (jitter[0], jitter[1]).
 
     Returns
     -------
@@ -189,18 +243,20 @@ def make_countdown(delay: int, backoff: Optional[int] = 1,
         current retry count.
 
     """
-    if max_delay is None:
-        max_delay = math.inf
-
-    def countdown(retries: int) -> int:
-        this_delay = delay if backoff is None else (delay * retries) ** backoff
-        if jitter:
-            if type(jitter) is int:
-                this_delay += jitter
-            elif type(jitter) is tuple and len(jitter) == 2:
-                n, x = jitter
-                this_delay += random.random() * (x - n) + x
-        return min(this_delay, max_delay)
+    cap = MAX_COUNTDOWN if max_delay is None else max_delay
+    if isinstance(jitter, tuple):
+        low, high = jitter
+    else:
+        low, high = -jitter, jitter
+
+    def countdown(retries: int) -> float:
+        if backoff is None:
+            this_delay: float = delay
+        else:
+            this_delay = random.uniform(0, min(delay * backoff ** retries, cap))
+        if low or high:
+            this_delay += random.uniform(low, high)
+        return float(max(min(this_delay, cap), 0))
     return countdown
 
 
@@ -223,7 +279,8 @@ def make_task(app: Celery, Proc: ProcessType, step: Callable) -> Task:
         An asynchronous task that performs ``step``.
 
     """
-    countdown = make_countdown(step.delay, step.backoff, step.max_delay)
+    countdown = make_countdown(step.delay, step.backoff, step.max_delay,
+                               step.jitter)
 
     @app.task(name=f'{Proc.__name__}.{step.name}', bind=True,
               max_retries=step.max_retries, default_retry_delay=step.delay)
@@ -238,7 +295,13 @@ def make_task(app: Celery, Proc: ProcessType, step: Callable) -> Task:
             raise exc   # This is a deliberately unrecoverable failure.
         except Exception as exc:
             # Any other exception deserves more chances.
-            self.retry(exc=exc, countdown=countdown(self.request.retries))
+            delay = countdown(self.request.retries)
+            if isinstance(exc, Retry) and exc.countdown is not None:
+                delay = exc.countdown
+            if not backpressure.retry_allowed(exc):
+                # The retry budget for the service is exhausted; back off.
+                delay = max(delay, backpressure.get_retry_defer(exc))
+            self.retry(exc=exc, countdown=delay)
         return data
     return do_step
 
@@ -298,10 +361,13 @@ def register_process(Proc: ProcessType) -> Callable:
     # step (callable).
     process = chain(*[make_task(app, Proc, step).s() for step in Proc.steps])
     on_failure = make_failure_task(app, Proc)
+    for step in Proc.retired_steps:
+        make_task(app, Proc, step)    # Only for chains that are queued.
 
-    def execute_chain(submission_id: int, process_id: str, trigger: Trigger):
+    def execute_chain(submission_id: int, process_id: str, trigger: Trigger,
+                      **options: Any) -> None:
         logger.debug('Execute chain %s with id %s for submission %s',
                      Proc.__name__, process_id, submission_id)
         data = ProcessData(submission_id, process_id, trigger, [])
-        process.apply_async((data,), link_error=on_failure.s())
+        process.apply_async((data,), link_error=on_failure.s(), **options)
     return execute_chain
@@ -2,7 +2,10 @@
 
 from unittest import TestCase, mock
 
+from celery import Celery
+
 from ... import process
+from ...domain import ProcessData
 from ...runner import base, async_runner
 
 
@@ -99,3 +102,79 @@ class TestProcess(TestCase):
                          process.Process.Status.FAILED)
         self.assertEqual(saved_events[3][0].step, 'step_c')
         self.assertEqual(saved_events[3][1], self.submission_id)
+
+
+class TestMakeCountdown(TestCase):
+    """Retry delays grow exponentially with the number of retries."""
+
+    @mock.patch(f'{async_runner.__name__}.random.uniform')
+    def test_backoff(self, mock_uniform):
+        """The delay is multiplied by ``backoff`` after each retry."""
+        mock_uniform.side_effect = lambda low, high: high
+        countdown = async_runner.make_countdown(2, 2, max_delay=50)
+        self.assertEqual([countdown(n) for n in range(6)],
+                         [2, 4, 8, 16, 32, 50])
+
+    def test_full_jitter(self):
+        """A random delay of up to the exponential delay is used."""
+        countdown = async_runner.make_countdown(2, 3)
+        delays = [countdown(2) for _ in range(100)]
+        self.assertTrue(all(0 <= d <= 18 for d in delays))
+        self.assertGreater(len(set(delays)), 1, 'Delays are not all the same')
+
+    def test_constant(self):
+        """If ``backoff`` is ``None``, the delay is constant."""
+        self.assertEqual(async_runner.make_countdown(3, None)(10), 3)
+
+    def test_default_max_delay(self):
+        """The delay is capped even if the step doesn't set ``max_delay``."""
+        countdown = async_runner.make_countdown(2, 4)
+        self.assertLessEqual(max(countdown(n) for n in range(1000)),
+                             async_runner.MAX_COUNTDOWN)
+
+    def test_jitter(self):
+        """Jitter is applied within the given range."""
+        countdown = async_runner.make_countdown(1, None, jitter=(0, 1))
+        delays = [countdown(1) for _ in range(100)]
+        self.assertTrue(all(1 <= d <= 2 for d in delays))
+        self.assertGreater(len(set(delays)), 1, 'Delays are not all the same')
+
+
+class TestMakeTask(TestCase):
+    """Steps that raise anything but :class:`.Failed` are retried."""
+
+    def setUp(self):
+        """Given a process with a step that raises an exception."""
+        self.exception = None
+
+        class FooProcess(process.Process):
+            @process.step(delay=3, backoff=None)
+            def step_a(inst, previous, trigger, emit):
+                raise self.exception
+
+        self.app = Celery('test')
+        self.task = async_runner.make_task(self.app, FooProcess,
+                                           FooProcess.steps[0])
+        self.data = ProcessData(1234, 'foo', mock.MagicMock(), [])
+
+    def test_retry_with_countdown(self):
+        """A step that raises :class:`.Retry` may set the countdown."""
+        self.exception = process.Retry('not yet', countdown=42)
+        with mock.patch.object(self.task, 'retry') as mock_retry:
+            self.task(self.data)
+        mock_retry.assert_called_once_with(exc=self.exception, countdown=42)
+
+    def test_recoverable(self):
+        """A :class:`.Recoverable` failure is retried on the step schedule."""
+        self.exception = process.Recoverable('try again')
+        with mock.patch.object(self.task, 'retry') as mock_retry:
+            self.task(self.data)
+        mock_retry.assert_called_once_with(exc=self.exception, countdown=3)
+
+    def test_failed(self):
+        """A :class:`.Failed` step is not retried."""
+        self.exception = process.Failed('nope')
+        with mock.patch.object(self.task, 'retry') as mock_retry:
+            with self.assertRaises(process.Failed):
+                self.task(self.data)
+        self.assertFalse(mock_retry.called)
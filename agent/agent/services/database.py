@@ -1,23 +1,24 @@
 """Lightweight database integration for checkpointing."""
 
 import time
-from datetime import datetime
-from typing import Optional, Any
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Optional, Any, Dict, Iterable, List, NamedTuple, Set, \
+    Tuple
 
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from pytz import UTC
 from retry import retry
-from sqlalchemy import BigInteger, Column, DateTime, Enum, ForeignKey, \
-    ForeignKeyConstraint, Index, \
-    Integer, SmallInteger, String, Table, text, Text
+from sqlalchemy import BigInteger, Column, Date, DateTime, Enum, Float, \
+    ForeignKey, ForeignKeyConstraint, Index, MetaData, \
+    Integer, SmallInteger, String, Table, text, Text, func, inspect
 from sqlalchemy.dialects.mysql import DATETIME
 from sqlalchemy.exc import OperationalError, NoSuchTableError
 
 from arxiv.base import logging
 from arxiv.submission.domain.event import AddProcessStatus
-from ..process import Process
-from ..rules import Rule
+from arxiv.submission.domain.process import ProcessStatus
 
 db: SQLAlchemy = SQLAlchemy()
 logger = logging.getLogger(__name__)
@@ -28,7 +29,13 @@ class Unavailable(IOError):
 
 
 class Checkpoint(db.Model):
-    """Stores checkpoint information for the Kinesis consumer."""
+    """
+    Stores a bounded history of checkpoints for the Kinesis consumer.
+
+    The current position for each shard is kept in :class:`.ShardPosition`;
+    this table is retained for debugging, and is pruned as new checkpoints
+    are stored.
+    """
 
     __tablename__ = 'checkpoint'
     __bind_key__ = 'agent'
@@ -39,25 +46,159 @@ class Checkpoint(db.Model):
     shard_id = Column(String(255), index=True, nullable=False)
 
 
+class ShardPosition(db.Model):
+    """Stores the current checkpoint position for each shard."""
+
+    __tablename__ = 'shard_positions'
+    __bind_key__ = 'agent'
+
+    shard_id = Column(String(255), primary_key=True)
+    position = Column(String(255), nullable=False)
+    updated = Column(DATETIME(6), nullable=False,
+                     default=lambda: datetime.now(UTC))
+
+
 class ProcessStatusEvent(db.Model):
-    """Stores events related to processes."""
+    """
+    Stores events related to processes.
+
+    Events are retained for a limited time; see :func:`compact_events`.
+    """
 
     __tablename__ = 'process_status_events'
     __bind_key__ = 'agent'
 
     id = Column(Integer, primary_key=True)
     created = Column(DATETIME(6), index=True, nullable=False)
-    received = Column(DATETIME(6), index=True, nullable=False,
+    received = Column(DATETIME(6), nullable=False,
                       default=lambda: datetime.now(UTC))
     event_id = Column(String(255), index=True, nullable=False)
     submission_id = Column(Integer, index=True)
     process_id = Column(String(100), index=True, nullable=False)
-    process = Column(String(100), index=True, nullable=False)
-    status = Column(String(50), index=True, nullable=True)
+    process = Column(String(100), nullable=False)
+    status = Column(String(50), nullable=True)
     reason = Column(Text, nullable=True)
-    agent_type = Column(Enum('System', 'User', 'Client'), index=True,
-                        nullable=False)
-    agent_id = Column(String(100), index=True, nullable=False)
+    agent_type = Column(Enum('System', 'User', 'Client'), nullable=False)
+    agent_id = Column(String(100), nullable=False)
+
+    __table_args__ = (
+        Index('process_status_events_process_created', 'process', 'created'),
+    )
+
+
+class ProcessStatusRollup(db.Model):
+    """
+    Daily summary of process status events, for a process and status.
+
+    Durations are measured from the first event for a process instance to
+    the event with this status, and are only populated for statuses that
+    end a process.
+    """
+
+    __tablename__ = 'process_status_rollups'
+    __bind_key__ = 'agent'
+
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)
+    process = Column(String(100), nullable=False)
+    status = Column(String(50), nullable=True)
+    count = Column(Integer, nullable=False, default=0)
+    durations = Column(Integer, nullable=False, default=0)
+    """Number of durations summarized by the percentiles."""
+    duration_p50 = Column(Float, nullable=True)
+    duration_p95 = Column(Float, nullable=True)
+
+    __table_args__ = (
+        Index('process_status_rollups_day_process_status', 'day', 'process',
+              'status', unique=True),
+        Index('process_status_rollups_process_day', 'process', 'day'),
+    )
+
+
+class ProcessStart(db.Model):
+    """
+    Start time of a process instance whose first events have been compacted.
+
+    Kept until the process ends, so that its duration can be measured when
+    the events on a later day are compacted. See :func:`compact_events`.
+    """
+
+    __tablename__ = 'process_starts'
+    __bind_key__ = 'agent'
+
+    process_id = Column(String(100), primary_key=True)
+    started = Column(DATETIME(6), index=True, nullable=False)
+
+
+class Rollup(NamedTuple):
+    """Summary of the events for a process and status on a single day."""
+
+    day: date
+    process: str
+    status: Optional[str]
+    count: int
+    duration_p50: Optional[float]
+    """Median duration (in seconds) of processes ending in this status."""
+    duration_p95: Optional[float]
+    """95th percentile duration (in seconds)."""
+
+
+FINAL_STATUSES = {
+    ProcessStatus.Status.FAILED_TO_START.value,
+    ProcessStatus.Status.FAILED.value,
+    ProcessStatus.Status.FAILED_TO_END.value,
+    ProcessStatus.Status.SUCCEEDED.value,
+    ProcessStatus.Status.TERMINATED.value,
+}
+"""Statuses that end a process."""
+
+MAX_PROCESS_DAYS = 30
+"""Days after which the start of a process that has not ended is forgotten."""
+
+
+class Dispatch(db.Model):
+    """
+    Records that a process was dispatched in response to an event.
+
+    Used to avoid dispatching the same process more than once when records
+    are replayed by the consumer, e.g. after a restart.
+    """
+
+    __tablename__ = 'dispatches'
+    __bind_key__ = 'agent'
+
+    id = Column(Integer, primary_key=True)
+    event_id = Column(String(40), nullable=False)
+    rule = Column(String(255), nullable=False)
+    process_id = Column(String(100), nullable=False)
+    created = Column(DATETIME(6), index=True, nullable=False,
+                     default=lambda: datetime.now(UTC))
+
+    __table_args__ = (Index('dispatches_event_rule', 'event_id', 'rule'),)
+
+
+class Extraction(db.Model):
+    """
+    Tracks the status of a plain text extraction that a process is awaiting.
+
+    See :mod:`agent.poller`.
+    """
+
+    __tablename__ = 'extractions'
+    __bind_key__ = 'agent'
+
+    IN_PROGRESS = 'in_progress'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    source_id = Column(String(100), primary_key=True)
+    checksum = Column(String(100), primary_key=True)
+    status = Column(String(20), nullable=False, default=IN_PROGRESS)
+    checks = Column(Integer, nullable=False, default=0)
+    """Number of times the status has been checked."""
+    next_check = Column(DATETIME(6), index=True, nullable=False)
+    created = Column(DATETIME(6), index=True, nullable=False,
+                     default=lambda: datetime.now(UTC))
 
 
 def init_app(app: Flask) -> None:
@@ -85,12 +226,85 @@ def create_all() -> None:
         raise Unavailable('Caught op error') from e
 
 
+OBSOLETE_INDEXES = {
+    'process_status_events': [
+        'ix_process_status_events_received',
+        'ix_process_status_events_process',
+        'ix_process_status_events_status',
+        'ix_process_status_events_agent_type',
+        'ix_process_status_events_agent_id',
+    ]
+}
+"""Indexes that were dropped from the models, by table."""
+
+
+def upgrade_indexes() -> List[str]:
+    """
+    Bring the indexes of existing tables in line with the models.
+
+    :func:`create_all` only creates tables that don't exist yet, so indexes
+    that are added to or dropped from the models of existing tables are
+    handled here: any index in :const:`OBSOLETE_INDEXES` is dropped, and any
+    index of the models that is missing is created. This is safe to run more
+    than once. The equivalent DDL for MySQL is:
+
+    .. code-block:: sql
+
+       DROP INDEX ix_process_status_events_received
+           ON process_status_events;
+       DROP INDEX ix_process_status_events_process ON process_status_events;
+       DROP INDEX ix_process_status_events_status ON process_status_events;
+       DROP INDEX ix_process_status_events_agent_type
+           ON process_status_events;
+       DROP INDEX ix_process_status_events_agent_id
+           ON process_status_events;
+       CREATE INDEX process_status_events_process_created
+           ON process_status_events (process, created);
+
+    Returns
+    -------
+    list
+        Descriptions of the changes that were made.
+
+    """
+    changes = []
+    try:
+        engine = db.get_engine(bind='agent')
+        tables = set(inspect(engine).get_table_names())
+        for table in db.get_tables_for_bind('agent'):
+            if table.name not in tables:
+                continue
+            # Reflect the table as it is, apart from the models' metadata.
+            reflected = Table(table.name, MetaData(), autoload_with=engine)
+            existing = set()
+            for index in reflected.indexes:
+                if index.name in OBSOLETE_INDEXES.get(table.name, []):
+                    index.drop(engine)
+                    changes.append(f'Dropped index {index.name} on'
+                                   f' {table.name}')
+                else:
+                    existing.add(index.name)
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(engine)
+                    changes.append(f'Created index {index.name} on'
+                                   f' {table.name}')
+    except OperationalError as e:
+        raise Unavailable('Caught op error') from e
+    return changes
+
+
 @retry(Unavailable, tries=10, backoff=2)
 def tables_exist() -> bool:
     """Determine whether or not these database tables exist."""
     try:
         db.session.query("1").from_statement(text("SELECT 1 FROM checkpoint limit 1")).all()
+        db.session.query("1").from_statement(text("SELECT 1 FROM shard_positions limit 1")).all()
         db.session.query("1").from_statement(text("SELECT 1 FROM process_status_events limit 1")).all()
+        db.session.query("1").from_statement(text("SELECT 1 FROM process_status_rollups limit 1")).all()
+        db.session.query("1").from_statement(text("SELECT 1 FROM dispatches limit 1")).all()
+        db.session.query("1").from_statement(text("SELECT 1 FROM extractions limit 1")).all()
+        db.session.query("1").from_statement(text("SELECT 1 FROM process_starts limit 1")).all()
     except (NoSuchTableError, OperationalError) as e:
         return False
     except Exception as e:
@@ -102,6 +316,11 @@ def tables_exist() -> bool:
 def get_latest_position(shard_id: str) -> str:
     """Get the latest checkpointed position."""
     try:
+        current = db.session.query(ShardPosition).get(shard_id)
+        if current is not None:
+            return current.position
+        # Fall back to the checkpoint history, e.g. if the consumer last ran
+        # before positions were stored per shard.
         result = db.session.query(Checkpoint.position) \
             .filter(Checkpoint.shard_id == shard_id) \
             .order_by(Checkpoint.id.desc()) \
@@ -115,10 +334,32 @@ def get_latest_position(shard_id: str) -> str:
 
 
 @retry(Unavailable, tries=3, backoff=2)
-def store_position(position: str, shard_id: str) -> None:
-    """Store a new checkpoint position."""
+def store_position(position: str, shard_id: str, history: int = 100) -> None:
+    """
+    Store a new checkpoint position.
+
+    The position for the shard is updated in place, and the checkpoint is
+    added to the history for the shard. Only the ``history`` most recent
+    checkpoints are retained for each shard.
+    """
+    created = datetime.now(UTC)
     try:
-        db.session.add(Checkpoint(position=position, shard_id=shard_id))
+        db.session.merge(ShardPosition(shard_id=shard_id, position=position,
+                                       updated=created))
+        db.session.add(Checkpoint(position=position, shard_id=shard_id,
+                                  created=created))
+        db.session.flush()
+        oldest = db.session.query(Checkpoint.id) \
+            .filter(Checkpoint.shard_id == shard_id) \
+            .order_by(Checkpoint.id.desc()) \
+            .offset(max(history - 1, 0)) \
+            .limit(1) \
+            .scalar()
+        if oldest is not None:
+            db.session.query(Checkpoint) \
+                .filter(Checkpoint.shard_id == shard_id) \
+                .filter(Checkpoint.id < oldest) \
+                .delete(synchronize_session=False)
         db.session.commit()
     except OperationalError as e:
         db.session.rollback()
@@ -134,7 +375,7 @@ def store_event(event: AddProcessStatus) -> None:
             submission_id=event.submission_id,
             process_id=event.process_id,
             process=event.process,
-            status=event.status,
+            status=ProcessStatus.Status(event.status).value,
             reason=event.reason,
             agent_type=event.creator.agent_type,
             agent_id=event.creator.native_id
@@ -145,6 +386,415 @@ def store_event(event: AddProcessStatus) -> None:
         raise Unavailable('Caught op error') from e
 
 
+@retry(Unavailable, tries=3, backoff=2)
+def get_dispatched(keys: Iterable[Tuple[str, str]],
+                   ttl: int) -> Set[Tuple[str, str]]:
+    """
+    Get the ``(event_id, rule)`` pairs that have already been dispatched.
+
+    Parameters
+    ----------
+    keys : iterable
+        Each item is an ``(event_id, rule)`` two-tuple.
+    ttl : int
+        Number of seconds for which a dispatch is remembered. Dispatches
+        older than this are ignored.
+
+    Returns
+    -------
+    set
+        The subset of ``keys`` that were dispatched within the last ``ttl``
+        seconds.
+
+    """
+    keys = set(keys)
+    if not keys:
+        return set()
+    cutoff = datetime.now(UTC) - timedelta(seconds=ttl)
+    try:
+        rows = db.session.query(Dispatch.event_id, Dispatch.rule) \
+            .filter(Dispatch.event_id.in_({e for e, _ in keys})) \
+            .filter(Dispatch.created >= cutoff) \
+            .all()
+    except OperationalError as e:
+        raise Unavailable('Caught op error') from e
+    return {(event_id, rule) for event_id, rule in rows} & keys
+
+
+@retry(Unavailable, tries=3, backoff=2)
+def store_dispatched(dispatched: Iterable[Tuple[str, str, str]]) -> None:
+    """
+    Store a batch of dispatches.
+
+    Parameters
+    ----------
+    dispatched : iterable
+        Each item is an ``(event_id, rule, process_id)`` three-tuple.
+
+    """
+    created = datetime.now(UTC)
+    try:
+        db.session.bulk_insert_mappings(Dispatch, [
+            {'event_id': event_id, 'rule': rule, 'process_id': process_id,
+             'created': created}
+            for event_id, rule, process_id in dispatched
+        ])
+        db.session.commit()
+    except OperationalError as e:
+        db.session.rollback()
+        raise Unavailable('Caught op error') from e
+
+
+@retry(Unavailable, tries=3, backoff=2)
+def expire_dispatched(ttl: int) -> None:
+    """Delete dispatches that are older than ``ttl`` seconds."""
+    cutoff = datetime.now(UTC) - timedelta(seconds=ttl)
+    try:
+        db.session.query(Dispatch) \
+            .filter(Dispatch.created < cutoff) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+    except OperationalError as e:
+        db.session.rollback()
+        raise Unavailable('Caught op error') from e
+
+
+@retry(Unavailable, tries=3, backoff=2)
+def get_extraction(source_id: str, checksum: str) \
+        -> Optional[Tuple[str, datetime]]:
+    """
+    Get the status of an extraction that is being tracked.
+
+    Returns
+    -------
+    str or None
+        The status of the extraction, or ``None`` if it is not tracked.
+    :class:`datetime`
+        When the status of the extraction will next be checked.
+
+    """
+    try:
+        result = db.session.query(Extraction.status, Extraction.next_check) \
+            .filter(Extraction.source_id == source_id) \
+            .filter(Extraction.checksum == checksum) \
+            .first()
+    except OperationalError as e:
+        raise Unavailable('Caught op error') from e
+    if result is None:
+        return None
+    status, next_check = result
+    return status, _aware(next_check)
+
+
+@retry(Unavailable, tries=3, backoff=2)
+def track_extraction(source_id: str, checksum: str, next_check: datetime,
+                     restart: bool = False) -> None:
+    """
+    Start tracking an extraction, if it is not tracked already.
+
+    If ``restart`` is ``True`` (i.e. a new extraction has been requested), an
+    extraction that is already tracked starts over, whatever its status.
+    """
+    try:
+        extraction = db.session.query(Extraction).get((source_id, checksum))
+        if extraction is None:
+            db.session.add(Extraction(source_id=source_id, checksum=checksum,
+                                      next_check=next_check))
+        elif restart:
+            extraction.status = Extraction.IN_PROGRESS
+            extraction.checks = 0
+            extraction.next_check = next_check
+            extraction.created = datetime.now(UTC)
+        db.session.commit()
+    except OperationalError as e:
+        db.session.rollback()
+        raise Unavailable('Caught op error') from e
+
+
+@retry(Unavailable, tries=3, backoff=2)
+def get_due_extractions(limit: int) -> List[Tuple[str, str, int]]:
+    """Get in-progress extractions that are due to be checked."""
+    try:
+        return [tuple(row) for row in db.session.query(Extraction.source_id,
+                                                       Extraction.checksum,
+                                                       Extraction.checks)
+                .filter(Extraction.status == Extraction.IN_PROGRESS)
+                .filter(Extraction.next_check <= datetime.now(UTC))
+                .order_by(Extraction.next_check)
+                .limit(limit)
+                .all()]
+    except OperationalError as e:
+        raise Unavailable('Caught op error') from e
+
+
+@retry(Unavailable, tries=3, backoff=2)
+def get_next_extraction_check() -> Optional[datetime]:
+    """Get the time of the next scheduled check of an extraction, if any."""
+    try:
+        next_check = db.session.query(func.min(Extraction.next_check)) \
+            .filter(Extraction.status == Extraction.IN_PROGRESS) \
+            .scalar()
+    except OperationalError as e:
+        raise Unavailable('Caught op error') from e
+    return None if next_check is None else _aware(next_check)
+
+
+@retry(Unavailable, tries=3, backoff=2)
+def update_extractions(updates: Iterable[Tuple[str, str, str, datetime]]) \
+        -> None:
+    """
+    Update the status of tracked extractions.
+
+    Parameters
+    ----------
+    updates : iterable
+        Items are ``(source_id, checksum, status, next_check)`` tuples.
+
+    """
+    try:
+        for source_id, checksum, status, next_check in updates:
+            extraction = db.session.query(Extraction) \
+                .get((source_id, checksum))
+            if extraction is None:
+                extraction = Extraction(source_id=source_id,
+                                        checksum=checksum, checks=0)
+                db.session.add(extraction)
+            extraction.status = status
+            extraction.checks = (extraction.checks or 0) + 1
+            extraction.next_check = next_check
+        db.session.commit()
+    except OperationalError as e:
+        db.session.rollback()
+        raise Unavailable('Caught op error') from e
+
+
+@retry(Unavailable, tries=3, backoff=2)
+def expire_extractions(ttl: int) -> None:
+    """Stop tracking extractions that started more than ``ttl`` seconds ago."""
+    cutoff = datetime.now(UTC) - timedelta(seconds=ttl)
+    try:
+        db.session.query(Extraction) \
+            .filter(Extraction.created < cutoff) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+    except OperationalError as e:
+        db.session.rollback()
+        raise Unavailable('Caught op error') from e
+
+
+def _aware(value: datetime) -> datetime:
+    """Make sure that a datetime from the database has a timezone."""
+    return value if value.tzinfo is not None else value.replace(tzinfo=UTC)
+
+
+@retry(Unavailable, tries=3, backoff=2)
+def compact_events(retention: int, max_days: Optional[int] = None,
+                   batch_size: int = 1000) -> int:
+    """
+    Roll up process status events older than ``retention`` days.
+
+    Events are summarized one (UTC) day at a time, oldest first, so that the
+    rollup for a day is stored in the same transaction that deletes the
+    events for that day. Only whole days are compacted. Events are streamed
+    from the database ``batch_size`` rows at a time, rather than loaded for
+    the whole day at once.
+
+    The start times of processes that have not ended by the end of the day
+    are stored (as :class:`ProcessStart`) in the same transaction, so that
+    the durations of processes that span days are measured from their start,
+    even if the next day is compacted by a later run. Starts older than
+    :const:`MAX_PROCESS_DAYS` are dropped.
+
+    This can take a long time when there is a backlog of events (e.g. the
+    first time that it runs), so it is run as a job of its own; see
+    :mod:`agent.compact`.
+
+    Parameters
+    ----------
+    retention : int
+        Number of days for which events are retained.
+    max_days : int
+        If provided, at most this many days are compacted.
+    batch_size : int
+        Number of rows to fetch at a time.
+
+    Returns
+    -------
+    int
+        The number of events that were compacted.
+
+    """
+    cutoff = datetime.now(UTC).replace(hour=0, minute=0, second=0,
+                                       microsecond=0) \
+        - timedelta(days=retention)
+    compacted = 0
+    days = 0
+    try:
+        # Start times of process instances, carried over from earlier days.
+        started = {process_id: _aware(created) for process_id, created
+                   in db.session.query(ProcessStart.process_id,
+                                       ProcessStart.started)}
+        stored = set(started)
+        while max_days is None or days < max_days:
+            # Compacted days are deleted, so the oldest remaining event is
+            # on the next day with anything to compact.
+            oldest = db.session.query(func.min(ProcessStatusEvent.created)) \
+                .scalar()
+            if oldest is None:
+                break
+            day = _aware(oldest).replace(hour=0, minute=0, second=0,
+                                         microsecond=0)
+            if day >= cutoff:
+                break
+            end = day + timedelta(days=1)
+            in_day = (ProcessStatusEvent.created >= day,
+                      ProcessStatusEvent.created < end)
+            events = db.session.query(ProcessStatusEvent.created,
+                                      ProcessStatusEvent.process_id,
+                                      ProcessStatusEvent.process,
+                                      ProcessStatusEvent.status) \
+                .filter(*in_day) \
+                .order_by(ProcessStatusEvent.created) \
+                .yield_per(batch_size)
+            count = _store_rollups(day.date(), events, started)
+            if count == 0:      # Nothing in range; don't go round again.
+                break
+            db.session.query(ProcessStatusEvent) \
+                .filter(*in_day) \
+                .delete(synchronize_session=False)
+            stale = end - timedelta(days=MAX_PROCESS_DAYS)
+            for process_id, created in list(started.items()):
+                if created < stale:
+                    del started[process_id]
+            _store_starts(started, stored, batch_size)
+            db.session.commit()
+            stored = set(started)
+            compacted += count
+            days += 1
+    except OperationalError as e:
+        db.session.rollback()
+        raise Unavailable('Caught op error') from e
+    return compacted
+
+
+def _store_rollups(day: date,
+                   events: Iterable[Tuple[datetime, str, str, str]],
+                   started: Dict[str, datetime]) -> int:
+    counts: Dict[Tuple[str, str], int] = defaultdict(int)
+    durations: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+    ended = set()
+    total = 0
+    for created, process_id, process, status in events:
+        created = _aware(created)
+        total += 1
+        counts[(process, status)] += 1
+        if process_id not in started:
+            started[process_id] = created
+        if status in FINAL_STATUSES:
+            duration = (created - started[process_id]).total_seconds()
+            durations[(process, status)].append(duration)
+            ended.add(process_id)
+    for process_id in ended:
+        started.pop(process_id, None)
+
+    for (process, status), count in counts.items():
+        values = sorted(durations.get((process, status), []))
+        p50 = _percentile(values, 50)
+        p95 = _percentile(values, 95)
+        rollup = db.session.query(ProcessStatusRollup) \
+            .filter(ProcessStatusRollup.day == day) \
+            .filter(ProcessStatusRollup.process == process) \
+            .filter(ProcessStatusRollup.status == status) \
+            .first()
+        if rollup is None:
+            db.session.add(ProcessStatusRollup(
+                day=day, process=process, status=status, count=count,
+                durations=len(values), duration_p50=p50, duration_p95=p95
+            ))
+            continue
+        # Events can arrive after their day was compacted. Percentiles can't
+        # be merged exactly, so we use a weighted average of the two.
+        rollup.count += count
+        if values:
+            n = rollup.durations + len(values)
+            rollup.duration_p50 = _weighted(rollup.duration_p50,
+                                            rollup.durations, p50, len(values))
+            rollup.duration_p95 = _weighted(rollup.duration_p95,
+                                            rollup.durations, p95, len(values))
+            rollup.durations = n
+    return total
+
+
+def _store_starts(started: Dict[str, datetime], stored: Set[str],
+                  batch_size: int) -> None:
+    """Bring the stored :class:`ProcessStart` rows in line with ``started``."""
+    ended = list(stored - set(started))
+    for i in range(0, len(ended), batch_size):
+        db.session.query(ProcessStart) \
+            .filter(ProcessStart.process_id.in_(ended[i:i + batch_size])) \
+            .delete(synchronize_session=False)
+    db.session.add_all([
+        ProcessStart(process_id=process_id, started=created)
+        for process_id, created in started.items() if process_id not in stored
+    ])
+
+
+def _percentile(values: List[float], percent: int) -> Optional[float]:
+    """Get the nearest-rank percentile of sorted ``values``."""
+    if not values:
+        return None
+    rank = max(int(round(percent / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def _weighted(a: Optional[float], a_n: int, b: float, b_n: int) -> float:
+    if a is None or a_n == 0:
+        return b
+    return (a * a_n + b * b_n) / (a_n + b_n)
+
+
+@retry(Unavailable, tries=3, backoff=2)
+def get_rollups(process: Optional[str] = None, start: Optional[date] = None,
+                end: Optional[date] = None) -> List[Rollup]:
+    """
+    Get daily summaries of process status events.
+
+    Parameters
+    ----------
+    process : str
+        If provided, only rollups for this process are returned.
+    start : :class:`date`
+        If provided, only rollups for this day or later are returned.
+    end : :class:`date`
+        If provided, only rollups for days before this day are returned.
+
+    Returns
+    -------
+    list
+        Items are :class:`.Rollup` instances, ordered by day and process.
+
+    """
+    try:
+        query = db.session.query(ProcessStatusRollup.day,
+                                 ProcessStatusRollup.process,
+                                 ProcessStatusRollup.status,
+                                 ProcessStatusRollup.count,
+                                 ProcessStatusRollup.duration_p50,
+                                 ProcessStatusRollup.duration_p95)
+        if process is not None:
+            query = query.filter(ProcessStatusRollup.process == process)
+        if start is not None:
+            query = query.filter(ProcessStatusRollup.day >= start)
+        if end is not None:
+            query = query.filter(ProcessStatusRollup.day < end)
+        rows = query.order_by(ProcessStatusRollup.day,
+                              ProcessStatusRollup.process,
+                              ProcessStatusRollup.status).all()
+    except OperationalError as e:
+        raise Unavailable('Caught op error') from e
+    return [Rollup(*row) for row in rows]
+
+
 def await_connection(max_wait: int = -1) -> None:
     """Wait for the database to be available."""
     logger.info('Waiting for database server to be available')
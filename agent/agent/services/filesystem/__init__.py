@@ -1,3 +1,3 @@
 """Integration with the legacy filesystem shim."""
 
-from .filesystem import Filesystem, ValidationFailed
+from .filesystem import Filesystem, ValidationFailed, Superseded
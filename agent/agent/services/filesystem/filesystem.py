@@ -1,13 +1,21 @@
 """Integration with the legacy filesystem shim."""
 
+import time
+from base64 import b64encode
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from hashlib import md5
 from http import HTTPStatus as status
-from typing import Tuple, List, Any, Union, Optional, IO
+from typing import Tuple, List, Any, Union, Optional, IO, Deque
 
+import requests
 from urllib3.util.retry import Retry
 
 from arxiv.base import logging
 from arxiv.integration.api import service
-from arxiv.integration.api.exceptions import NotFound
+from arxiv.integration.api.exceptions import NotFound, RequestFailed, \
+    ConnectionFailed
+from arxiv.submission.services import transport
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +24,11 @@ class ValidationFailed(Exception):
     """Validation of the deposit failed."""
 
 
-class Filesystem(service.HTTPIntegration):
+class Superseded(Exception):
+    """A deposit of the same content, with the same or a newer version, won."""
+
+
+class Filesystem(transport.HTTPIntegration):
     """Represents an interface to the legacy filesystem."""
 
     SERVICE = 'legacy-filesystem'
@@ -27,6 +39,25 @@ class Filesystem(service.HTTPIntegration):
 
         service_name = "filesystem"
 
+    def __init__(self, endpoint: str, verify: bool = True,
+                 headers: dict = {}, chunk_size: int = 8 * 1024 * 1024,
+                 upload_workers: int = 4, chunk_retries: int = 3,
+                 chunk_backoff: float = 0.5, **extra: Any) -> None:
+        """
+        Set parameters for chunked uploads.
+
+        Content larger than ``chunk_size`` bytes is sent in chunks of that
+        size, up to ``upload_workers`` at a time. Each chunk is tried up to
+        ``chunk_retries`` more times if it fails, waiting ``chunk_backoff``
+        seconds (doubling with each try) in between.
+        """
+        super(Filesystem, self).__init__(endpoint, verify=verify,
+                                         headers=headers, **extra)
+        self._chunk_size = int(chunk_size)
+        self._upload_workers = int(upload_workers)
+        self._chunk_retries = int(chunk_retries)
+        self._chunk_backoff = float(chunk_backoff)
+
     def get_retry_config(self) -> Retry:
         """
         Configure to only retry on connection errors.
@@ -53,44 +84,154 @@ class Filesystem(service.HTTPIntegration):
         return bool(response.status_code == status.OK)
 
     def deposit_source(self, submission_id: int, pointer: IO[bytes],
-                       checksum: str) -> None:
+                       checksum: str, version: Optional[int] = None) -> None:
         """
         Deposit a source package for ``submission_id``.
 
-        Verifies the integrity of the transferred file by comparing the content
-        of the ``ETag`` response  header to ``checksum``.
+        See :meth:`deposit`.
         """
-        response = self.request('post', f'/{submission_id}/source',
-                                data=pointer, expected_code=[status.CREATED])
-        etag = response.headers.get('ETag')
-        if etag != checksum:
-            raise ValidationFailed(f'Expected {checksum}, got {etag}')
+        self.deposit('source', submission_id, pointer, checksum, version)
 
     def deposit_preview(self, submission_id: int, pointer: IO[bytes],
-                        checksum: str) -> None:
+                        checksum: str, version: Optional[int] = None) -> None:
         """
         Deposit a PDF preview for ``submission_id``.
 
+        See :meth:`deposit`.
+        """
+        self.deposit('preview', submission_id, pointer, checksum, version)
+
+    def deposit(self, kind: str, submission_id: int, pointer: IO[bytes],
+                checksum: str, version: Optional[int] = None) -> None:
+        """
+        Deposit a source package or PDF preview for ``submission_id``.
+
+        If the filesystem already has content with ``checksum`` (e.g. from an
+        identical deposit for another submission), it is deposited by
+        checksum, and ``pointer`` is not read. Otherwise, the content is sent;
+        content that is larger than the configured chunk size (or of unknown
+        size) is sent in chunks (see :meth:`upload`).
+
         Verifies the integrity of the transferred file by comparing the content
         of the ``ETag`` response  header to ``checksum``.
+
+        If ``version`` is provided (e.g. the time of the event that the content
+        belongs to), the filesystem refuses the deposit if a deposit with a
+        newer version has already started, and abandons it if one starts in
+        the meantime; either way, :class:`Superseded` is raised. Without a
+        version, the deposit that starts last wins.
         """
-        response = self.request('post', f'/{submission_id}/preview',
-                                data=pointer, expected_code=[status.CREATED])
+        extra = {} if version is None else {'version': version}
+        response = self.request('post', f'/{submission_id}/{kind}',
+                                params={'checksum': checksum, **extra},
+                                expected_code=[status.CREATED,
+                                               status.CONFLICT,
+                                               status.PRECONDITION_FAILED])
+        if response.status_code == status.PRECONDITION_FAILED:
+            size = _size(pointer)
+            if size is not None and size <= self._chunk_size:
+                response = self.request('post', f'/{submission_id}/{kind}',
+                                        data=pointer, params=extra,
+                                        expected_code=[status.CREATED,
+                                                       status.CONFLICT])
+            else:
+                response = self.upload(kind, submission_id, pointer,
+                                       checksum, version)
+        if response.status_code == status.CONFLICT:
+            raise Superseded(f'Deposit of {kind} for {submission_id} was'
+                             ' superseded')
+        # A chunked upload that does not match has no ETag at all.
         etag = response.headers.get('ETag')
         if etag != checksum:
             raise ValidationFailed(f'Expected {checksum}, got {etag}')
 
+    def upload(self, kind: str, submission_id: int, pointer: IO[bytes],
+               checksum: str,
+               version: Optional[int] = None) -> requests.Response:
+        """
+        Send a source package or PDF preview in chunks, and commit it.
+
+        If an upload of the same content was started earlier (e.g. by an
+        attempt that failed part of the way through), chunks that the
+        filesystem has already acknowledged with the same checksum are not
+        sent again. Chunks are read from ``pointer`` in order, and sent in
+        parallel; a chunk that fails is retried on its own. At most two
+        chunks per worker are held in memory at a time. ``version`` is passed
+        with the commit; see :meth:`deposit`.
+
+        Returns
+        -------
+        :class:`requests.Response`
+            The response to the commit: 201 Created with the checksum of the
+            deposited content in the ``ETag`` header, 409 Conflict if the
+            deposit was superseded, or 412 Precondition Failed if the content
+            as a whole does not match ``checksum`` (in which case the upload
+            is kept, and only the chunks that differ are sent next time).
+
+        """
+        path = f'/{submission_id}/{kind}/uploads/{checksum}'
+        response = self.request('post', path,
+                                expected_code=[status.CREATED, status.OK])
+        # Checksums of the chunks that were acknowledged, by range.
+        acknowledged = {(start, end): chunk_checksum for start, end,
+                        chunk_checksum in response.json()['chunks']}
+        if acknowledged:
+            logger.info('Resuming upload of %s for %s; already have %s',
+                        kind, submission_id, response.json()['received'])
+        offset = 0
+        with ThreadPoolExecutor(max_workers=self._upload_workers) as pool:
+            pending: Deque[Future] = deque()
+            for chunk in iter(lambda: _read(pointer, self._chunk_size), b''):
+                end = offset + len(chunk)
+                if acknowledged.get((offset, end)) != _checksum(chunk):
+                    pending.append(pool.submit(self._put_chunk, path, offset,
+                                               chunk))
+                offset = end
+                while len(pending) >= 2 * self._upload_workers:
+                    pending.popleft().result()
+            for future in pending:
+                future.result()
+        params = {'size': offset}
+        if version is not None:
+            params['version'] = version
+        return self.request('post', f'{path}/commit', params=params,
+                            expected_code=[status.CREATED, status.CONFLICT,
+                                           status.PRECONDITION_FAILED])
+
+    def _put_chunk(self, path: str, offset: int, chunk: bytes) -> None:
+        headers = {
+            'Content-Range': f'bytes {offset}-{offset + len(chunk) - 1}/*',
+            'Content-MD5': _checksum(chunk)
+        }
+        for attempt in range(self._chunk_retries + 1):
+            try:
+                self.request('put', path, data=chunk, headers=headers)
+                return
+            except NotFound:    # The upload is gone; no use trying again.
+                raise
+            except (RequestFailed, ConnectionFailed) as e:
+                if attempt == self._chunk_retries:
+                    raise
+                logger.warning('Chunk at %i of %s failed (%s); retrying',
+                               offset, path, e)
+                time.sleep(self._chunk_backoff * 2 ** attempt)
+
     def does_source_exist(self, submission_id: int,
-                          checksum: Optional[str] = None) -> bool:
+                          checksum: Optional[str] = None,
+                          verify: bool = False) -> bool:
         """
         Verify that the source for a submission exists.
 
         If ``checksum`` is provided, verifies the integrity of the remote
         file by comparing the content of the ``ETag`` response  header to
-        ``checksum``.
+        ``checksum``. The service normally reports the checksum that it
+        recorded when the file was deposited; if ``verify`` is ``True``, it
+        recomputes the checksum from the file itself.
         """
+        params = {'verify': 'true'} if verify else None
         try:
-            response = self.request('head', f'/{submission_id}/source')
+            response = self.request('head', f'/{submission_id}/source',
+                                    params=params)
         except NotFound:
             return False
         if checksum is not None:
@@ -100,16 +241,21 @@ class Filesystem(service.HTTPIntegration):
         return bool(response.status_code == status.OK)
 
     def does_preview_exist(self, submission_id: int,
-                           checksum: Optional[str] = None) -> bool:
+                           checksum: Optional[str] = None,
+                           verify: bool = False) -> bool:
         """
         Verify that the preview for a submission exists.
 
         If ``checksum`` is provided, verifies the integrity of the remote
         file by comparing the content of the ``ETag`` response  header to
-        ``checksum``.
+        ``checksum``. The service normally reports the checksum that it
+        recorded when the file was deposited; if ``verify`` is ``True``, it
+        recomputes the checksum from the file itself.
         """
+        params = {'verify': 'true'} if verify else None
         try:
-            response = self.request('head', f'/{submission_id}/preview')
+            response = self.request('head', f'/{submission_id}/preview',
+                                    params=params)
         except NotFound:
             return False
         if checksum is not None:
@@ -118,3 +264,36 @@ class Filesystem(service.HTTPIntegration):
                 raise ValidationFailed(f'Expected {checksum}, got {etag}')
         return bool(response.status_code == status.OK)
 
+
+def _checksum(chunk: bytes) -> str:
+    """Get the checksum of a chunk, as in the ``Content-MD5`` header."""
+    return b64encode(md5(chunk).digest()).decode('utf-8')
+
+
+def _size(pointer: IO[bytes]) -> Optional[int]:
+    """Get the number of bytes left in ``pointer``, if we can tell."""
+    size: Optional[int] = getattr(pointer, 'len', None)
+    if size is not None:
+        return int(size) - pointer.tell()
+    try:
+        if not pointer.seekable():
+            return None
+        position = pointer.tell()
+        end = pointer.seek(0, 2)
+        pointer.seek(position)
+    except (AttributeError, OSError):
+        return None
+    return int(end - position)
+
+
+def _read(pointer: IO[bytes], size: int) -> bytes:
+    """Read ``size`` bytes from ``pointer``, or as many as are left."""
+    parts = []
+    remaining = size
+    while remaining > 0:
+        data = pointer.read(remaining)
+        if not data:
+            break
+        parts.append(data)
+        remaining -= len(data)
+    return b''.join(parts)
@@ -8,11 +8,12 @@ import tempfile
 import time
 from base64 import urlsafe_b64encode
 from hashlib import md5
-from unittest import TestCase
+from http import HTTPStatus
+from unittest import TestCase, mock
 
 from flask import Flask
 
-from . import Filesystem, ValidationFailed
+from . import Filesystem, ValidationFailed, Superseded
 
 
 class TestFilesystemIntegration(TestCase):
@@ -166,3 +167,131 @@ class TestFilesystemIntegration(TestCase):
 
 
 
+
+
+class TestDeposit(TestCase):
+    """Content is sent only if the filesystem doesn't already have it."""
+
+    def setUp(self):
+        """Create a Flask app for context."""
+        self.app = Flask('foo')
+        self.app.config.update({
+            'FILESYSTEM_ENDPOINT': 'http://foohost:1234',
+            'FILESYSTEM_VERIFY': False
+        })
+
+    @mock.patch('arxiv.integration.api.service.requests.Session')
+    def test_deposit_by_checksum(self, mock_Session):
+        """The filesystem already has the content."""
+        mock_post = mock.MagicMock(return_value=mock.MagicMock(
+            status_code=HTTPStatus.CREATED, headers={'ETag': 'foochx=='}
+        ))
+        mock_Session.return_value = mock.MagicMock(post=mock_post)
+        pointer = mock.MagicMock()
+        with self.app.app_context():
+            fs = Filesystem.current_session()
+            fs.deposit_source(1234, pointer, 'foochx==')
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(mock_post.call_args[1]['params'],
+                         {'checksum': 'foochx=='})
+        self.assertEqual(pointer.read.call_count, 0, 'Content is not sent')
+
+    @mock.patch('arxiv.integration.api.service.requests.Session')
+    def test_deposit_content(self, mock_Session):
+        """The filesystem does not have the content."""
+        mock_post = mock.MagicMock(side_effect=[
+            mock.MagicMock(status_code=HTTPStatus.PRECONDITION_FAILED,
+                           headers={}),
+            mock.MagicMock(status_code=HTTPStatus.CREATED,
+                           headers={'ETag': 'foochx=='})
+        ])
+        mock_Session.return_value = mock.MagicMock(post=mock_post)
+        pointer = io.BytesIO(b'foocontent')
+        with self.app.app_context():
+            fs = Filesystem.current_session()
+            fs.deposit_preview(1234, pointer, 'foochx==')
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertIs(mock_post.call_args[1]['data'], pointer)
+
+    @mock.patch('arxiv.integration.api.service.requests.Session')
+    def test_superseded(self, mock_Session):
+        """A newer deposit was started."""
+        mock_post = mock.MagicMock(return_value=mock.MagicMock(
+            status_code=HTTPStatus.CONFLICT, headers={}
+        ))
+        mock_Session.return_value = mock.MagicMock(post=mock_post)
+        with self.app.app_context():
+            fs = Filesystem.current_session()
+            with self.assertRaises(Superseded):
+                fs.deposit_source(1234, io.BytesIO(b''), 'foochx==')
+
+    @mock.patch('arxiv.integration.api.service.requests.Session')
+    def test_deposit_in_chunks(self, mock_Session):
+        """Large content is sent in chunks, resuming an earlier upload."""
+        self.app.config.update({'FILESYSTEM_CHUNK_SIZE': 4,
+                                'FILESYSTEM_CHUNK_BACKOFF': 0})
+        mock_post = mock.MagicMock(side_effect=[
+            mock.MagicMock(status_code=HTTPStatus.PRECONDITION_FAILED,
+                           headers={}),
+            mock.MagicMock(status_code=HTTPStatus.OK,
+                           json=mock.MagicMock(
+                               return_value={
+                                   'received': [[0, 8]],
+                                   'chunks': [[0, 4, '62L2uTBttXXC1ZaxJ5YnpA=='],
+                                              [4, 8, 'wrong']]
+                               }
+                           )),
+            mock.MagicMock(status_code=HTTPStatus.CREATED,
+                           headers={'ETag': 'foochx=='})
+        ])
+        responses = [mock.MagicMock(status_code=HTTPStatus.BAD_GATEWAY)]
+        mock_put = mock.MagicMock(side_effect=lambda *a, **k: (
+            responses.pop() if responses
+            else mock.MagicMock(status_code=HTTPStatus.OK)
+        ))
+        mock_Session.return_value = mock.MagicMock(post=mock_post,
+                                                   put=mock_put)
+        with self.app.app_context():
+            fs = Filesystem.current_session()
+            fs.deposit_source(1234, io.BytesIO(b'0123456789'), 'foochx==',
+                              version=42)
+
+        self.assertEqual(mock_post.call_args_list[0][1]['params'],
+                         {'checksum': 'foochx==', 'version': 42})
+        url, kwargs = mock_post.call_args
+        self.assertTrue(url[0].endswith('/1234/source/uploads/foochx==/commit'))
+        self.assertEqual(kwargs['params'], {'size': 10, 'version': 42},
+                         'The version is passed with the commit')
+        self.assertEqual(mock_put.call_count, 3,
+                         'The acknowledged chunk is skipped, one that was'
+                         ' acknowledged with other content is sent again, and'
+                         ' a chunk that failed is tried again')
+        sent = {kwargs['headers']['Content-Range']: kwargs['data']
+                for _, kwargs in mock_put.call_args_list}
+        self.assertEqual(sent, {'bytes 4-7/*': b'4567', 'bytes 8-9/*': b'89'})
+
+    @mock.patch('arxiv.integration.api.service.requests.Session')
+    def test_upload_does_not_match(self, mock_Session):
+        """The content sent in chunks does not match its checksum."""
+        self.app.config.update({'FILESYSTEM_CHUNK_SIZE': 4})
+        mock_post = mock.MagicMock(side_effect=[
+            mock.MagicMock(status_code=HTTPStatus.PRECONDITION_FAILED,
+                           headers={}),
+            mock.MagicMock(status_code=HTTPStatus.CREATED,
+                           json=mock.MagicMock(
+                               return_value={'received': [], 'chunks': []}
+                           )),
+            mock.MagicMock(status_code=HTTPStatus.PRECONDITION_FAILED,
+                           headers={})
+        ])
+        mock_Session.return_value = mock.MagicMock(
+            post=mock_post,
+            put=mock.MagicMock(return_value=mock.MagicMock(
+                status_code=HTTPStatus.OK
+            ))
+        )
+        with self.app.app_context():
+            fs = Filesystem.current_session()
+            with self.assertRaises(ValidationFailed):
+                fs.deposit_source(1234, io.BytesIO(b'0123456789'),
+                                  'foochx==')
@@ -0,0 +1,265 @@
+"""Tests for :mod:`.consumer`."""
+
+from datetime import datetime, timedelta
+from unittest import TestCase, mock
+
+from pytz import UTC
+
+from arxiv.submission import Submission, User
+from arxiv.submission.domain.event import SetTitle
+from arxiv.submission.serializer import dumps
+
+from .. import consumer
+
+
+def run_batch(dispatches, on_dispatch=None):
+    """Stand in for :meth:`.AsyncProcessRunner.run_batch`."""
+    for process, trigger in dispatches:
+        if on_dispatch is not None:
+            on_dispatch(process, trigger)
+    return len(dispatches)
+
+
+class TestProcessRecords(TestCase):
+    """Records in a batch are evaluated, and then dispatched together."""
+
+    def setUp(self):
+        """We have a consumer and a batch of records."""
+        self.consumer = consumer.SubmissionEventConsumer(
+            stream_name='SubmissionEvents',
+            shard_id='0',
+            config={}
+        )
+        self.consumer.sleep_time = 0
+        self.consumer.checkpointer = mock.MagicMock()
+        creator = User(1234, username='foo', email='foo@bar.com')
+        now = datetime.now(UTC)
+        self.records = []
+        for i in range(3):
+            event = SetTitle(creator=creator, title='the title',
+                             created=now + timedelta(seconds=i),
+                             submission_id=i)
+            submission = Submission(creator=creator, owner=creator,
+                                    created=event.created, submission_id=i)
+            data = dumps({'event': event, 'before': submission,
+                          'after': submission})
+            self.records.append({'SequenceNumber': str(i),
+                                 'Data': data.encode('utf-8')})
+        self.consumer.get_records = mock.MagicMock(
+            return_value=('next', {'Records': self.records})
+        )
+        self.rule = mock.MagicMock()
+        self.rule.name = 'Do the thing'
+        patcher = mock.patch(f'{consumer.__name__}.database')
+        self.mock_database = patcher.start()
+        self.mock_database.get_dispatched.return_value = set()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch(f'{consumer.__name__}.rules.match')
+    @mock.patch(f'{consumer.__name__}.AsyncProcessRunner')
+    def test_process_records(self, mock_Runner, mock_evaluate):
+        """Triggered processes are dispatched once per batch."""
+        mock_evaluate.side_effect = lambda event, *a: [
+            (self.rule, mock.MagicMock(), {})
+        ]
+        mock_Runner.run_batch.side_effect = run_batch
+
+        next_start, processed = self.consumer.process_records('start')
+
+        self.assertEqual(next_start, 'next')
+        self.assertEqual(processed, 3)
+        self.assertEqual(mock_Runner.run_batch.call_count, 1,
+                         'Processes are dispatched in a single batch')
+        pending, = mock_Runner.run_batch.call_args[0]
+        self.assertEqual(len(pending), 3)
+        self.assertEqual([t.event.submission_id for _, t in pending],
+                         [0, 1, 2], 'Dispatch order follows record order')
+        self.assertEqual(self.consumer._pending, [],
+                         'Nothing is left pending after the batch')
+
+    @mock.patch(f'{consumer.__name__}.rules.match')
+    @mock.patch(f'{consumer.__name__}.AsyncProcessRunner')
+    def test_checkpoint_dispatches_pending(self, mock_Runner, mock_evaluate):
+        """Pending processes are dispatched before checkpointing."""
+        mock_evaluate.return_value = [(self.rule, mock.MagicMock(), {})]
+        calls = []
+        mock_Runner.run_batch.side_effect = \
+            lambda pending, **kw: calls.append('dispatch') or len(pending)
+        self.consumer.checkpointer.checkpoint.side_effect = \
+            lambda position: calls.append('checkpoint')
+
+        self.consumer.process_record(self.records[0])
+        self.consumer.position = self.records[0]['SequenceNumber']
+        self.consumer._checkpoint()
+
+        self.assertEqual(calls, ['dispatch', 'checkpoint'])
+
+    @mock.patch(f'{consumer.__name__}.rules.match')
+    @mock.patch(f'{consumer.__name__}.AsyncProcessRunner')
+    def test_skip_already_dispatched(self, mock_Runner, mock_match):
+        """Processes already dispatched for an event and rule are skipped."""
+        mock_match.side_effect = lambda event, *a: [
+            (self.rule, mock.MagicMock(), {})
+        ]
+        mock_Runner.run_batch.side_effect = run_batch
+        event_ids = []
+        for record in self.records:
+            self.consumer.process_record(record)
+        for _, _, trigger in self.consumer._pending:
+            event_ids.append(trigger.event.event_id)
+        self.mock_database.get_dispatched.return_value = \
+            {(event_ids[1], self.rule.name)}
+
+        self.consumer._dispatch_pending()
+
+        self.assertEqual(self.mock_database.get_dispatched.call_count, 1,
+                         'Dispatches are looked up once for the batch')
+        pending, = mock_Runner.run_batch.call_args[0]
+        self.assertEqual([t.event.event_id for _, t in pending],
+                         [event_ids[0], event_ids[2]])
+        stored, = self.mock_database.store_dispatched.call_args[0]
+        self.assertEqual([(e, r) for e, r, _ in stored],
+                         [(event_ids[0], self.rule.name),
+                          (event_ids[2], self.rule.name)])
+
+
+    @mock.patch('retry.api.time.sleep', mock.MagicMock())
+    @mock.patch(f'{consumer.__name__}.rules.match')
+    @mock.patch(f'{consumer.__name__}.AsyncProcessRunner')
+    def test_partial_failure(self, mock_Runner, mock_match):
+        """A retry after a partial failure only dispatches the rest."""
+        mock_match.side_effect = lambda event, *a: [
+            (self.rule, mock.MagicMock(), {})
+        ]
+        attempts = []
+
+        def flaky_run_batch(dispatches, on_dispatch=None):
+            attempts.append([t.event.submission_id for _, t in dispatches])
+            if len(attempts) == 1:
+                on_dispatch(*dispatches[0])
+                raise RuntimeError('Connection lost')
+            return run_batch(dispatches, on_dispatch)
+
+        mock_Runner.run_batch.side_effect = flaky_run_batch
+        for record in self.records:
+            self.consumer.process_record(record)
+        self.consumer._dispatch_pending()
+
+        self.assertEqual(attempts, [[0, 1, 2], [1, 2]])
+        stored, = self.mock_database.store_dispatched.call_args[0]
+        self.assertEqual(len(stored), 3)
+
+    @mock.patch('retry.api.time.sleep', mock.MagicMock())
+    @mock.patch(f'{consumer.__name__}.rules.match')
+    @mock.patch(f'{consumer.__name__}.AsyncProcessRunner')
+    def test_dispatch_fails(self, mock_Runner, mock_match):
+        """If dispatching keeps failing, the batch is kept for later."""
+        mock_match.side_effect = lambda event, *a: [
+            (self.rule, mock.MagicMock(), {})
+        ]
+
+        def failing_run_batch(dispatches, on_dispatch=None):
+            if len(dispatches) == 3:
+                on_dispatch(*dispatches[0])
+            raise RuntimeError('Connection lost')
+
+        mock_Runner.run_batch.side_effect = failing_run_batch
+        for record in self.records:
+            self.consumer.process_record(record)
+        with self.assertRaises(RuntimeError):
+            self.consumer._dispatch_pending()
+
+        self.assertEqual(mock_Runner.run_batch.call_count, 5,
+                         'Retries are bounded')
+        self.assertEqual(len(self.consumer._pending), 3,
+                         'The batch is pending again')
+        stored, = self.mock_database.store_dispatched.call_args[0]
+        self.assertEqual([e for e, _, _ in stored],
+                         [self.consumer._pending[0][2].event.event_id],
+                         'The process that went out is recorded')
+
+
+class TestProcessRecordsInParallel(TestProcessRecords):
+    """Records are partitioned by submission and processed concurrently."""
+
+    def setUp(self):
+        """The consumer is configured with several workers."""
+        super(TestProcessRecordsInParallel, self).setUp()
+        self.consumer._workers = 3
+
+    @mock.patch(f'{consumer.__name__}.rules.match')
+    @mock.patch(f'{consumer.__name__}.AsyncProcessRunner')
+    def test_failure_holds_position(self, mock_Runner, mock_evaluate):
+        """Position does not advance past a record that was not processed."""
+        def evaluate(event, *args):
+            if event.submission_id == 1:
+                raise RuntimeError('Nope')
+            return [(self.rule, mock.MagicMock(), {})]
+
+        mock_evaluate.side_effect = evaluate
+        mock_Runner.run_batch.side_effect = run_batch
+
+        with self.assertRaises(RuntimeError):
+            self.consumer.process_records('start')
+        self.assertEqual(self.consumer.position, '0',
+                         'Position is held at the last record for which all'
+                         ' preceding records were processed')
+
+
+class TestDatabaseCheckpointManager(TestCase):
+    """Checkpoints are coalesced before they are stored."""
+
+    def setUp(self):
+        """We have a checkpoint manager for a shard."""
+        patcher = mock.patch(f'{consumer.__name__}.database')
+        self.mock_database = patcher.start()
+        self.mock_database.get_latest_position.return_value = '0'
+        self.addCleanup(patcher.stop)
+
+    def test_coalesce_by_count(self):
+        """Positions are stored after ``every`` checkpoints."""
+        checkpointer = consumer.DatabaseCheckpointManager('0', interval=3600,
+                                                          every=3)
+        for i in range(1, 8):
+            checkpointer.checkpoint(str(i))
+
+        self.assertEqual(checkpointer.position, '7')
+        self.assertEqual(
+            [c[0][0] for c in self.mock_database.store_position.call_args_list],
+            ['3', '6']
+        )
+
+    def test_coalesce_by_interval(self):
+        """Positions are stored once ``interval`` seconds have elapsed."""
+        checkpointer = consumer.DatabaseCheckpointManager('0', interval=10,
+                                                          every=100)
+        with mock.patch(f'{consumer.__name__}.time') as mock_time:
+            mock_time.monotonic.return_value = checkpointer._last_stored + 1
+            checkpointer.checkpoint('1')
+            self.assertEqual(self.mock_database.store_position.call_count, 0)
+            mock_time.monotonic.return_value = checkpointer._last_stored + 11
+            checkpointer.checkpoint('2')
+        self.mock_database.store_position.assert_called_once_with(
+            '2', '0', history=100
+        )
+
+    def test_flush(self):
+        """The latest position is stored on flush, but only once."""
+        checkpointer = consumer.DatabaseCheckpointManager('0', interval=3600,
+                                                          every=100)
+        checkpointer.flush()
+        self.assertEqual(self.mock_database.store_position.call_count, 0,
+                         'Nothing new to store')
+        checkpointer.checkpoint('1')
+        checkpointer.flush()
+        checkpointer.flush()
+        self.mock_database.store_position.assert_called_once_with(
+            '1', '0', history=100
+        )
+
+    def test_store_fails(self):
+        """A failure to store the position is raised as a CheckpointError."""
+        self.mock_database.store_position.side_effect = RuntimeError
+        checkpointer = consumer.DatabaseCheckpointManager('0')
+        with self.assertRaises(consumer.consumer.CheckpointError):
+            checkpointer.checkpoint('1')
@@ -0,0 +1,240 @@
+"""Tests for :mod:`agent.services.database`."""
+
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from flask import Flask
+from pytz import UTC
+
+from ..services import database
+
+
+class DatabaseTestCase(TestCase):
+    """Base class for tests that use an in-memory agent database."""
+
+    def setUp(self):
+        """We have an empty agent database."""
+        self.app = Flask('test')
+        self.app.config['SQLALCHEMY_BINDS'] = {'agent': 'sqlite://'}
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        database.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        self.addCleanup(self.context.pop)
+        database.create_all()
+
+
+class TestStorePosition(DatabaseTestCase):
+    """Checkpoint positions are stored once per shard, with some history."""
+
+    def test_store_position(self):
+        """The latest position is updated in place for each shard."""
+        self.assertIsNone(database.get_latest_position('0'))
+        for i in range(5):
+            database.store_position(str(i), '0')
+        database.store_position('foo', '1')
+
+        self.assertEqual(database.get_latest_position('0'), '4')
+        self.assertEqual(database.get_latest_position('1'), 'foo')
+        self.assertEqual(database.db.session.query(database.ShardPosition)
+                         .count(), 2, 'There is one position per shard')
+
+    def test_history_is_bounded(self):
+        """Only the most recent checkpoints are retained for each shard."""
+        for i in range(10):
+            database.store_position(str(i), '0', history=3)
+        database.store_position('foo', '1', history=3)
+
+        history = database.db.session.query(database.Checkpoint.position) \
+            .filter(database.Checkpoint.shard_id == '0') \
+            .order_by(database.Checkpoint.id) \
+            .all()
+        self.assertEqual([p for p, in history], ['7', '8', '9'])
+        self.assertEqual(database.db.session.query(database.Checkpoint)
+                         .filter(database.Checkpoint.shard_id == '1')
+                         .count(), 1, 'Other shards are not affected')
+
+    def test_legacy_position(self):
+        """The checkpoint history is used if there is no shard position."""
+        database.db.session.add(database.Checkpoint(position='2',
+                                                    shard_id='0'))
+        database.db.session.commit()
+        self.assertEqual(database.get_latest_position('0'), '2')
+
+
+class TestCompactEvents(DatabaseTestCase):
+    """Old process status events are compacted into daily rollups."""
+
+    def setUp(self):
+        """We have some old and new process status events."""
+        super(TestCompactEvents, self).setUp()
+
+        today = datetime.now(UTC).replace(hour=12, minute=0, second=0,
+                                          microsecond=0)
+        self.old_day = (today - timedelta(days=10)).date()
+        for i in range(4):
+            started = today - timedelta(days=10)
+            self._add(started, f'p{i}', 'pending')
+            self._add(started + timedelta(seconds=10 * (i + 1)), f'p{i}',
+                      'succeeded' if i < 3 else 'failed')
+        self._add(today, 'p5', 'pending')
+        database.db.session.commit()
+
+    def _add(self, created, process_id, status):
+        database.db.session.add(database.ProcessStatusEvent(
+            created=created,
+            event_id=f'{process_id}{status}',
+            process_id=process_id,
+            process='RunAutoclassifier',
+            status=status,
+            agent_type='System',
+            agent_id='agent'
+        ))
+
+    def test_compact_events(self):
+        """Events older than the retention period are rolled up."""
+        self.assertEqual(database.compact_events(5), 8)
+        self.assertEqual(database.db.session
+                         .query(database.ProcessStatusEvent).count(), 1,
+                         'Recent events are retained')
+        rollups = database.get_rollups(process='RunAutoclassifier')
+        self.assertEqual(
+            [(r.day, r.status, r.count) for r in rollups],
+            [(self.old_day, 'failed', 1), (self.old_day, 'pending', 4),
+             (self.old_day, 'succeeded', 3)]
+        )
+        failed, pending, succeeded = rollups
+        self.assertIsNone(pending.duration_p50)
+        self.assertEqual(succeeded.duration_p50, 20.0)
+        self.assertEqual(succeeded.duration_p95, 30.0)
+        self.assertEqual(failed.duration_p95, 40.0)
+
+        self.assertEqual(database.compact_events(5), 0, 'Nothing left to do')
+        self.assertEqual(database.get_rollups(start=self.old_day
+                                              + timedelta(days=1)), [])
+
+    def test_late_events_are_merged(self):
+        """Events that arrive after their day was compacted are added."""
+        database.compact_events(5)
+        self._add(datetime.combine(self.old_day, datetime.min.time()),
+                  'p6', 'pending')
+        database.db.session.commit()
+        database.compact_events(5)
+        pending, = [r for r in database.get_rollups()
+                    if r.status == 'pending']
+        self.assertEqual(pending.count, 5)
+
+    def test_max_days(self):
+        """A backlog of events can be compacted a few days at a time."""
+        self._add(datetime.combine(self.old_day - timedelta(days=3),
+                                   datetime.min.time()), 'p6', 'pending')
+        database.db.session.commit()
+        self.assertEqual(database.compact_events(5, max_days=1, batch_size=2),
+                         1, 'Only the oldest day is compacted')
+        self.assertEqual(database.compact_events(5, max_days=1, batch_size=2),
+                         8)
+        self.assertEqual(database.compact_events(5, max_days=1), 0)
+
+    def test_process_spans_days(self):
+        """A process that ends on a later day is measured from its start."""
+        start = datetime.combine(self.old_day, datetime.max.time()) \
+            .replace(microsecond=0)
+        self._add(start, 'p6', 'pending')
+        self._add(start + timedelta(seconds=10), 'p6', 'failed')
+        database.db.session.commit()
+
+        database.compact_events(5, max_days=1)
+        self.assertEqual(
+            database.db.session.query(database.ProcessStart.process_id)
+            .all(), [('p6',)], 'The start of the process is kept'
+        )
+        database.compact_events(5, max_days=1)
+        failed, = [r for r in database.get_rollups()
+                   if r.day > self.old_day]
+        self.assertEqual(failed.duration_p50, 10.0)
+        self.assertEqual(
+            database.db.session.query(database.ProcessStart).count(), 0,
+            'The start is forgotten once the process ends'
+        )
+
+    def test_stale_starts_are_dropped(self):
+        """The starts of processes that never end are not kept forever."""
+        self._add(datetime.combine(self.old_day - timedelta(days=40),
+                                   datetime.min.time()), 'p6', 'pending')
+        database.db.session.commit()
+        database.compact_events(5)
+        self.assertEqual(
+            database.db.session.query(database.ProcessStart).count(), 0
+        )
+
+
+class TestUpgradeIndexes(DatabaseTestCase):
+    """Indexes of existing tables are brought in line with the models."""
+
+    def test_upgrade_indexes(self):
+        """Obsolete indexes are dropped, and new ones created."""
+        engine = database.db.get_engine(bind='agent')
+        engine.execute('CREATE INDEX ix_process_status_events_status'
+                       ' ON process_status_events (status)')
+        engine.execute('DROP INDEX process_status_events_process_created')
+
+        self.assertEqual(database.upgrade_indexes(), [
+            'Dropped index ix_process_status_events_status on'
+            ' process_status_events',
+            'Created index process_status_events_process_created on'
+            ' process_status_events'
+        ])
+        self.assertEqual(database.upgrade_indexes(), [], 'Nothing left to do')
+
+
+class TestExtractions(DatabaseTestCase):
+    """Plain text extractions are tracked until they are complete."""
+
+    def test_track_and_update(self):
+        """Due extractions are returned in order, until they are updated."""
+        now = datetime.now(UTC)
+        self.assertIsNone(database.get_extraction('1', 'abc'))
+        database.track_extraction('1', 'abc', now - timedelta(seconds=5))
+        database.track_extraction('2', 'def', now - timedelta(seconds=10))
+        database.track_extraction('3', 'ghi', now + timedelta(seconds=60))
+        database.track_extraction('1', 'abc', now + timedelta(seconds=60))
+
+        self.assertEqual(database.get_due_extractions(10),
+                         [('2', 'def', 0), ('1', 'abc', 0)],
+                         'Tracking an extraction again has no effect')
+        self.assertEqual(database.get_due_extractions(1), [('2', 'def', 0)])
+
+        database.update_extractions([
+            ('1', 'abc', 'succeeded', now),
+            ('2', 'def', 'in_progress', now + timedelta(seconds=30))
+        ])
+        self.assertEqual(database.get_due_extractions(10), [])
+        status, next_check = database.get_extraction('1', 'abc')
+        self.assertEqual(status, 'succeeded')
+        self.assertEqual(next_check, now)
+        self.assertEqual(database.get_next_extraction_check(),
+                         now + timedelta(seconds=30),
+                         'Only extractions in progress are scheduled')
+
+    def test_restart_extraction(self):
+        """A finished extraction starts over if it is requested again."""
+        now = datetime.now(UTC)
+        database.track_extraction('1', 'abc', now)
+        database.update_extractions([('1', 'abc', 'failed', now)])
+        database.track_extraction('1', 'abc', now + timedelta(seconds=60))
+        self.assertEqual(database.get_extraction('1', 'abc')[0], 'failed')
+
+        database.track_extraction('1', 'abc', now - timedelta(seconds=1),
+                                  restart=True)
+        self.assertEqual(database.get_extraction('1', 'abc'),
+                         ('in_progress', now - timedelta(seconds=1)))
+        self.assertEqual(database.get_due_extractions(10), [('1', 'abc', 0)])
+
+    def test_expire(self):
+        """Extractions are forgotten after a while."""
+        database.track_extraction('1', 'abc', datetime.now(UTC))
+        database.expire_extractions(3600)
+        self.assertIsNotNone(database.get_extraction('1', 'abc'))
+        database.expire_extractions(-1)
+        self.assertIsNone(database.get_extraction('1', 'abc'))
@@ -0,0 +1,73 @@
+"""Tests for :mod:`agent.poller`."""
+
+from datetime import datetime, timedelta
+from unittest import mock
+
+from pytz import UTC
+
+from arxiv.integration.api import exceptions
+from arxiv.submission.services.plaintext import ExtractionFailed
+
+from .. import poller
+from ..services import database
+from .test_database import DatabaseTestCase
+
+
+class TestPollOnce(DatabaseTestCase):
+    """The poller checks due extractions in a batch."""
+
+    def setUp(self):
+        """We have a few extractions in progress."""
+        super(TestPollOnce, self).setUp()
+        self.app.config['JWT_SECRET'] = 'foosecret'
+        past = datetime.now(UTC) - timedelta(seconds=1)
+        for source_id in ('1', '2', '3', '4'):
+            database.track_extraction(source_id, 'abc', past)
+        self.poller = poller.ExtractionPoller(batch_size=10, min_interval=2,
+                                              max_interval=60, factor=2)
+
+    @mock.patch(f'{poller.__name__}.PlainTextService')
+    def test_poll_once(self, mock_plaintext):
+        """Results are recorded, and incomplete extractions are put off."""
+        def is_complete(source_id, checksum, token):
+            if source_id == '2':
+                raise ExtractionFailed('Nope', mock.MagicMock())
+            if source_id == '3':
+                raise exceptions.ConnectionFailed('Down')
+            return source_id == '1'
+
+        mock_plaintext.extraction_is_complete.side_effect = is_complete
+        self.assertEqual(self.poller.poll_once(), 4)
+
+        self.assertEqual(database.get_extraction('1', 'abc')[0], 'succeeded')
+        self.assertEqual(database.get_extraction('2', 'abc')[0], 'failed')
+        for source_id in ('3', '4'):
+            status, next_check = database.get_extraction(source_id, 'abc')
+            self.assertEqual(status, 'in_progress')
+            self.assertGreater(next_check,
+                               datetime.now(UTC) + timedelta(seconds=3))
+        self.assertEqual(self.poller.poll_once(), 0, 'Nothing else is due')
+        self.assertGreater(self.poller.seconds_until_due(), 3)
+
+    def test_interval(self):
+        """The interval between checks grows geometrically, up to a limit."""
+        self.assertEqual([self.poller.interval(n) for n in range(7)],
+                         [2, 4, 8, 16, 32, 60, 60])
+
+    def test_notify_complete(self):
+        """A completed extraction is no longer checked."""
+        poller.notify_complete('1', 'abc')
+        poller.notify_complete('2', 'abc', failed=True)
+        self.assertEqual(poller.get_status('1', 'abc')[0], poller.SUCCEEDED)
+        self.assertEqual(poller.get_status('2', 'abc')[0], poller.FAILED)
+        self.assertEqual(len(database.get_due_extractions(10)), 2)
+
+    @mock.patch(f'{poller.__name__}.get_system_token')
+    def test_run_survives_errors(self, mock_get_token):
+        """The poller keeps going if a check raises something unexpected."""
+        mock_get_token.side_effect = RuntimeError('No secret')
+        stop = mock.MagicMock()
+        stop.is_set.side_effect = [False, False, True]
+        self.poller.run(self.app, stop)
+        self.assertEqual(mock_get_token.call_count, 2)
+        stop.wait.assert_called_with(self.poller.min_interval)
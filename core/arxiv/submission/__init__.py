@@ -193,8 +193,8 @@ from .core import save, load, load_fast, SaveError
 from .domain.agent import Agent, User, System, Client
 from .domain.event import Event, InvalidEvent
 from .domain.submission import Submission, SubmissionMetadata, Author
-from .services import classic, StreamPublisher, Compiler, PlainTextService,\
-    Classifier, PreviewService
+from .services import classic, health, StreamPublisher, Compiler, \
+    PlainTextService, Classifier, PreviewService
 
 logger = logging.getLogger(__name__)
 
@@ -210,6 +210,9 @@ def init_app(app: Flask) -> None:
     StreamPublisher.init_app(app)
     PreviewService.init_app(app)
     classic.init_app(app)
+    health.init_app(app)
+    health.register('stream', _stream_is_available)
+    health.register('classic', classic.is_available)
 
     template_folder = os.path.join(os.path.dirname(os.path.realpath(__file__)),
                                    'templates')
@@ -229,6 +232,12 @@ def init_app(app: Flask) -> None:
         logger.info('All upstream services are available; ready to start')
 
 
+
+def _stream_is_available() -> bool:
+    """Check whether the event stream is accepting records."""
+    return StreamPublisher.current_session().is_available()
+
+
 class IAwaitable(Protocol):
     """An object that provides an ``is_available`` predicate."""
 
@@ -42,3 +42,9 @@ def get_compiler_scopes(resource: str) -> List[str]:
     """Get minimal auth scopes necessary for compilation integration."""
     return [auth.scopes.READ_COMPILE.for_resource(resource),
             auth.scopes.CREATE_COMPILE.for_resource(resource)]
+
+
+def get_fulltext_scopes(resource: str) -> List[str]:
+    """Get minimal auth scopes necessary for plain text extraction."""
+    return [auth.scopes.READ_FULLTEXT.for_resource(resource),
+            auth.scopes.CREATE_FULLTEXT.for_resource(resource)]
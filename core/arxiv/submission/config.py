@@ -105,6 +105,35 @@ if not KINESIS_VERIFY:
 # See https://kubernetes.io/docs/concepts/services-networking/service/#environment-variables
 # for details on service DNS and environment variables in k8s.
 
+# Shared transport for HTTP service integrations. These may be overridden for
+# an individual service, e.g. ``COMPILER_MAX_IN_FLIGHT``. See
+# :mod:`arxiv.submission.services.transport`.
+HTTP_POOL_MAXSIZE = int(environ.get('HTTP_POOL_MAXSIZE', '10'))
+"""Maximum number of idle connections kept open to each service host."""
+
+HTTP_KEEPALIVE = int(environ.get('HTTP_KEEPALIVE', '60'))
+"""Idle seconds before TCP keep-alive probes are sent; ``0`` to disable."""
+
+HTTP_MAX_IN_FLIGHT = int(environ.get('HTTP_MAX_IN_FLIGHT', '0'))
+"""Maximum concurrent requests to each service; ``0`` for no limit."""
+
+HTTP_IN_FLIGHT_TIMEOUT = float(environ.get('HTTP_IN_FLIGHT_TIMEOUT', '10'))
+"""Seconds to wait for a request slot before failing."""
+
+# Health checks and circuit breakers for upstream services. See
+# :mod:`arxiv.submission.services.health`.
+HEALTH_CHECK_INTERVAL = float(environ.get('HEALTH_CHECK_INTERVAL', '10'))
+"""Seconds between background health checks; ``0`` to disable."""
+
+HEALTH_CHECK_TTL = float(environ.get('HEALTH_CHECK_TTL', '30'))
+"""Seconds for which the result of a health check is used."""
+
+CIRCUIT_BREAKER_THRESHOLD = int(environ.get('CIRCUIT_BREAKER_THRESHOLD', '5'))
+"""Consecutive failures after which calls to a service fail fast."""
+
+CIRCUIT_BREAKER_RESET = float(environ.get('CIRCUIT_BREAKER_RESET', '30'))
+"""Seconds after which a trial call is allowed through an open breaker."""
+
 # Integration with the file manager service.
 FILEMANAGER_HOST = environ.get('FILEMANAGER_SERVICE_HOST', 'arxiv.org')
 """Hostname or addreess of the filemanager service."""
@@ -1,9 +1,8 @@
 """Data structs related to compilation."""
 
-import io
 from datetime import datetime
 from enum import Enum
-from typing import Optional, NamedTuple, Dict
+from typing import Optional, NamedTuple, Dict, IO
 
 from dataclasses import dataclass, field
 
@@ -126,7 +125,7 @@ class Compilation:
 class CompilationProduct:
     """Content of a compilation product itself."""
 
-    stream: io.BytesIO
+    stream: IO[bytes]
     """Readable buffer with the product content."""
 
     content_type: str
@@ -148,7 +147,7 @@ class CompilationProduct:
 class CompilationLog:
     """Content of a compilation log."""
 
-    stream: io.BytesIO
+    stream: IO[bytes]
     """Readable buffer with the product content."""
 
     status: Optional[Compilation] = field(default=None)
@@ -1,6 +1,7 @@
 """Upload-related data structures."""
 
-from typing import NamedTuple, List, Optional, Dict, MutableMapping, Iterable
+from typing import NamedTuple, List, Optional, Dict, MutableMapping, \
+    Iterable, Sequence
 import io
 from datetime import datetime
 import dateutil.parser
@@ -110,7 +111,7 @@ class Upload(NamedTuple):
     """Size in bytes of the uncompressed upload workspace."""
     compressed_size: Optional[int] = None
     """Size in bytes of the compressed upload package."""
-    files: List[FileStatus] = []
+    files: Sequence[FileStatus] = []
     errors: List[FileError] = []
 
     @property
@@ -379,7 +379,10 @@ class _CompilationChecker(BaseChecker):
             prod = c.get_product(self.submission.source_content.identifier,
                                  self.submission.source_content.checksum,
                                  self.token)
-            self.finish(prod.stream, prod.checksum)
+            try:
+                self.finish(prod.stream, prod.checksum)
+            finally:
+                prod.stream.close()
             status = SUCCEEDED
         elif comp is not None and comp.is_failed:
             status = FAILED
@@ -393,7 +396,8 @@ class _CompilationChecker(BaseChecker):
                 log = c.get_log(self.submission.source_content.identifier,
                                 self.submission.source_content.checksum,
                                 self.token)
-                log_output = log.stream.read().decode('utf-8')
+                with log.stream:
+                    log_output = log.stream.read().decode('utf-8')
             except NotFound:
                 log_output = None
             extra.update({'log_output': log_output})
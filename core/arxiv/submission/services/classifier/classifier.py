@@ -1,6 +1,7 @@
 """Classifier service integration."""
 
-from typing import Tuple, List, Any, Union, NamedTuple, Optional
+from typing import Tuple, List, Any, Union, NamedTuple, Optional, IO, \
+    Iterator
 from math import exp, log
 from functools import wraps
 
@@ -8,6 +9,8 @@ from arxiv.base import logging
 from arxiv.taxonomy import Category
 from arxiv.integration.api import status, service
 
+from .. import transport
+
 logger = logging.getLogger(__name__)
 
 
@@ -34,7 +37,7 @@ class Counts(NamedTuple):
     words: int
 
 
-class Classifier(service.HTTPIntegration):
+class Classifier(transport.HTTPIntegration):
     """Represents an interface to the classifier service."""
 
     VERSION = '0.0'
@@ -42,6 +45,12 @@ class Classifier(service.HTTPIntegration):
 
     ClassifierResponse = Tuple[List[Suggestion], List[Flag], Optional[Counts]]
 
+    REACHABLE = list(range(200, 500))
+    """Status codes indicating that the classifier is reachable."""
+
+    CHUNK_SIZE = 64 * 1024
+    """Bytes read at a time when streaming content to the classifier."""
+
     class Meta:
         """Configuration for :class:`Classifier`."""
 
@@ -53,13 +62,21 @@ class Classifier(service.HTTPIntegration):
     def is_available(self, **kwargs: Any) -> bool:
         """Check our connection to the classifier service."""
         timeout: float = kwargs.get('timeout', 0.2)
+        # Any response short of a server error means that the service is up;
+        # we don't want to run a classification just to find out.
         try:
-            self.classify(b'ruok?', timeout=timeout)
+            self.request('head', '', timeout=timeout,
+                         expected_code=self.REACHABLE)
         except Exception as e:
             logger.error('Encountered error calling classifier: %s', e)
             return False
         return True
 
+    def get_service_status(self, timeout: float = 0.2) -> dict:
+        """Get the status of the classifier service, including its version."""
+        data: dict = self.json('get', 'status', timeout=timeout)[0]
+        return data
+
     @classmethod
     def probability(cls, logodds: float) -> float:
         """Convert log odds to a probability."""
@@ -84,15 +101,17 @@ class Classifier(service.HTTPIntegration):
                            probability=self.probability(datum['logodds']))
                 for datum in data['classifier']]
 
-    def classify(self, content: bytes, timeout: float = 1.) \
-            -> ClassifierResponse:
+    def classify(self, content: Union[bytes, IO[bytes]],
+                 timeout: float = 1.) -> ClassifierResponse:
         """
         Make a classification request to the classifier service.
 
         Parameters
         ----------
-        content : bytes
-            Raw text content from an e-print.
+        content : bytes or file-like
+            Raw text content from an e-print. If a readable stream is passed,
+            it is sent in chunks (using chunked transfer encoding) as it is
+            read, so that the content is never held in memory all at once.
 
         Returns
         -------
@@ -104,5 +123,17 @@ class Classifier(service.HTTPIntegration):
             Feature counts, if provided.
 
         """
-        data, _, _ = self.json('post', '', data=content, timeout=timeout)
+        body: Union[bytes, Iterator[bytes]] = content
+        if not isinstance(content, bytes):
+            body = _chunks(content, self.CHUNK_SIZE)
+        data, _, _ = self.json('post', '', data=body, timeout=timeout)
         return self._suggestions(data), self._flags(data), self._counts(data)
+
+
+def _chunks(stream: IO[bytes], size: int) -> Iterator[bytes]:
+    """Read ``stream`` in chunks of (at most) ``size`` bytes."""
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            return
+        yield chunk
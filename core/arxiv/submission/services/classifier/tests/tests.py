@@ -1,5 +1,6 @@
 """Tests for classic classifier service integration."""
 
+import io
 import os
 import json
 from unittest import TestCase, mock
@@ -98,6 +99,27 @@ class TestClassifier(TestCase):
         self.assertEqual(counts.stops, 804)
         self.assertEqual(counts.words, 2860)
 
+    @mock.patch('arxiv.integration.api.service.requests.Session')
+    def test_classifier_streams_content(self, mock_Session):
+        """Content from a readable stream is sent in chunks."""
+        with open(SAMPLE_PATH) as f:
+            data = json.load(f)
+        sent = []
+        mock_post = mock.MagicMock(
+            side_effect=lambda *a, **k: sent.extend(k['data']) or
+            mock.MagicMock(status_code=status.OK,
+                           json=mock.MagicMock(return_value=data))
+        )
+        mock_Session.return_value = mock.MagicMock(post=mock_post)
+        content = io.BytesIO(b'x' * (classifier.Classifier.CHUNK_SIZE + 10))
+        with self.app.app_context():
+            cl = classifier.Classifier.current_session()
+            suggestions, flags, counts = cl.classify(content)
+
+        self.assertEqual([len(chunk) for chunk in sent],
+                         [classifier.Classifier.CHUNK_SIZE, 10])
+        self.assertEqual(len(suggestions), 3, "There are three suggestions")
+
     @mock.patch('arxiv.integration.api.service.requests.Session')
     def test_classifier_withlinenos(self, mock_Session):
         """The classifier returns classification suggestions."""
@@ -140,6 +162,24 @@ class TestClassifier(TestCase):
         self.assertEqual(counts.stops, 3774)
         self.assertEqual(counts.words, 34211)
 
+    @mock.patch('arxiv.integration.api.service.requests.Session')
+    def test_get_service_status(self, mock_Session):
+        """The classifier reports its status and version."""
+        mock_get = mock.MagicMock(
+            return_value=mock.MagicMock(
+                status_code=status.OK,
+                json=mock.MagicMock(return_value={'version': '1.2.0'})
+            )
+        )
+        mock_Session.return_value = mock.MagicMock(get=mock_get)
+        with self.app.app_context():
+            cl = classifier.Classifier.current_session()
+            data = cl.get_service_status()
+
+        self.assertEqual(data['version'], '1.2.0')
+        self.assertEqual(mock_get.call_args[0][0],
+                         'http://foohost:1234/status')
+
 
 class TestClassifierModule(TestCase):
     """Tests for :mod:`classifier`."""
@@ -7,13 +7,16 @@ that the user can preview their submission. Additionally, we want to show the
 submitter the TeX log so that they can identify any potential problems with
 their sources.
 """
-import io
 import json
 import re
+from base64 import urlsafe_b64encode
 from collections import defaultdict
 from enum import Enum
 from functools import wraps
-from typing import Tuple, Optional, List, Union, NamedTuple, Mapping, Any
+from hashlib import md5
+from tempfile import SpooledTemporaryFile
+from typing import Tuple, Optional, List, Union, NamedTuple, Mapping, Any, \
+    IO, cast
 from urllib.parse import urlparse, urlunparse, urlencode
 
 import dateutil.parser
@@ -25,18 +28,25 @@ from arxiv.integration.api import status, service
 
 from ...domain.compilation import Compilation, CompilationProduct, \
     CompilationLog
+from .. import transport
 
 
 logger = logging.getLogger(__name__)
 
 PDF = Compilation.Format.PDF
 
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+"""Products and logs larger than this (in bytes) are spooled to disk."""
+
+CHUNK_SIZE = 64 * 1024
+"""Bytes read from the response body at a time."""
+
 
 class CompilationFailed(RuntimeError):
     """The compilation service failed to compile the source package."""
 
 
-class Compiler(service.HTTPIntegration):
+class Compiler(transport.HTTPIntegration):
     """Encapsulates a connection with the compiler service."""
 
     SERVICE = 'compiler'
@@ -193,13 +203,16 @@ class Compiler(service.HTTPIntegration):
         Returns
         -------
         :class:`CompilationProduct`
-            The compilation product itself.
+            The compilation product itself. The content is spooled to a
+            temporary file (on disk, if it is large), and its checksum is
+            computed as it is received.
 
         """
         endpoint = f'/{source_id}/{checksum}/{output_format.value}/product'
         response = self.request('get', endpoint, token, stream=True)
+        stream, checksum = spool(response)
         return CompilationProduct(content_type=output_format.content_type,
-                                  stream=io.BytesIO(response.content))
+                                  stream=stream, checksum=checksum)
 
     def get_log(self, source_id: str, checksum: str, token: str,
                 output_format: Compilation.Format = PDF) -> CompilationLog:
@@ -223,7 +236,37 @@ class Compiler(service.HTTPIntegration):
         """
         endpoint = f'/{source_id}/{checksum}/{output_format.value}/log'
         response = self.request('get', endpoint, token, stream=True)
-        return CompilationLog(stream=io.BytesIO(response.content))
+        stream, checksum = spool(response)
+        return CompilationLog(stream=stream, checksum=checksum)
+
+
+def spool(response: requests.Response) -> Tuple[IO[bytes], str]:
+    """
+    Spool the body of a streaming response, computing its checksum.
+
+    Returns
+    -------
+    :class:`tempfile.SpooledTemporaryFile`
+        The body content, positioned at the start. Content larger than
+        :const:`SPOOL_MAX_SIZE` is kept on disk rather than in memory.
+    str
+        URL-safe base64-encoded MD5 hash of the body content.
+
+    """
+    stream = cast(IO[bytes],
+                  SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode='w+b'))
+    hash_md5 = md5()
+    try:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            hash_md5.update(chunk)
+            stream.write(chunk)
+    except Exception:
+        stream.close()
+        raise
+    finally:
+        response.close()
+    stream.seek(0)
+    return stream, urlsafe_b64encode(hash_md5.digest()).decode('utf-8')
 
 
 def get_task_id(source_id: str, checksum: str,
@@ -1,5 +1,7 @@
 """Tests for :mod:`.compiler`."""
 
+from base64 import urlsafe_b64encode
+from hashlib import md5
 from unittest import TestCase, mock
 
 from flask import Flask
@@ -235,3 +237,54 @@ class TestGetTaskStatus(TestCase):
             cp = compiler.Compiler.current_session()
             with self.assertRaises(exceptions.NotFound):
                 cp.get_status(source_id, checksum, 'footok', output_format)
+
+
+class TestGetProduct(TestCase):
+    """Tests for :mod:`compiler.get_product` with mocked responses."""
+
+    def setUp(self):
+        """Create an app for context."""
+        self.app = Flask('test')
+        self.app.config.update({
+            'COMPILER_ENDPOINT': 'http://foohost:1234',
+            'COMPILER_VERIFY': False
+        })
+
+    @mock.patch(f'{compiler.__name__}.SPOOL_MAX_SIZE', 10)
+    @mock.patch('arxiv.integration.api.service.requests.Session')
+    def test_get_product(self, mock_Session):
+        """The product is spooled, and its checksum is computed."""
+        content = b'%PDF-1.4 not really a PDF'
+        response = mock.MagicMock(
+            status_code=status.OK,
+            iter_content=lambda size: iter([content[:10], content[10:]])
+        )
+        mock_Session.return_value = mock.MagicMock(
+            get=mock.MagicMock(return_value=response)
+        )
+        with self.app.app_context():
+            cp = compiler.Compiler.current_session()
+            product = cp.get_product('42', 'asdf1234=', 'footoken')
+
+        self.assertEqual(product.stream.read(), content)
+        self.assertEqual(product.checksum,
+                         urlsafe_b64encode(md5(content).digest()).decode())
+        self.assertTrue(product.stream._rolled, 'Large content is on disk')
+        self.assertTrue(response.close.called, 'The response is released')
+        product.stream.close()
+
+    @mock.patch('arxiv.integration.api.service.requests.Session')
+    def test_get_log(self, mock_Session):
+        """The log is spooled."""
+        mock_Session.return_value = mock.MagicMock(
+            get=mock.MagicMock(return_value=mock.MagicMock(
+                status_code=status.OK,
+                iter_content=lambda size: iter([b'foo log'])
+            ))
+        )
+        with self.app.app_context():
+            cp = compiler.Compiler.current_session()
+            log = cp.get_log('42', 'asdf1234=', 'footoken')
+
+        self.assertEqual(log.stream.read(), b'foo log')
+        self.assertFalse(log.stream._rolled, 'Small content is in memory')
@@ -1,8 +1,14 @@
 """Provides an integration with the file management service."""
 
-from collections import defaultdict
+import json
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from collections.abc import Sequence
+from datetime import datetime, timedelta, timezone
 from http import HTTPStatus as status
-from typing import Tuple, List, IO, Mapping, Any
+from typing import Tuple, List, IO, Mapping, Any, Dict, Iterator, Optional, \
+    Union, cast
 
 import dateutil.parser
 from werkzeug.datastructures import FileStorage
@@ -10,16 +16,145 @@ from werkzeug.datastructures import FileStorage
 from arxiv.base import logging
 from arxiv.base.globals import get_application_config
 from arxiv.integration.api import service
+from arxiv.integration.api.exceptions import BadResponse
 
 from ...domain import SubmissionContent
 from ...domain.uploads import Upload, FileStatus, FileError, UploadStatus, \
     UploadLifecycleStates
-from ..util import ReadWrapper
+from .. import transport
+from ..util import ReadWrapper, MultipartEncoder
 
 logger = logging.getLogger(__name__)
 
-
-class Filemanager(service.HTTPIntegration):
+_ISO_8601 = re.compile(r'^(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})'
+                       r'(?:\.(\d{1,6})\d*)?(Z|[+-]\d{2}:?\d{2})?$')
+
+
+def parse_datetime(value: str) -> datetime:
+    """
+    Parse a timestamp from the file management service.
+
+    Timestamps are ISO-8601, which we can parse much faster than
+    :func:`dateutil.parser.parse`; anything else is handed off to dateutil.
+    """
+    match = _ISO_8601.match(value)
+    if match is None:
+        return dateutil.parser.parse(value)
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    tzinfo: Optional[timezone] = None
+    if offset == 'Z':
+        tzinfo = timezone.utc
+    elif offset is not None:
+        sign = -1 if offset[0] == '-' else 1
+        offset = offset[1:].replace(':', '')
+        tzinfo = timezone(sign * timedelta(hours=int(offset[:2]),
+                                           minutes=int(offset[2:])))
+    return datetime(int(year), int(month), int(day), int(hour), int(minute),
+                    int(second),
+                    int(fraction.ljust(6, '0')) if fraction else 0,
+                    tzinfo=tzinfo)
+
+
+class FileStatusList(Sequence):
+    """
+    The files in an upload workspace, parsed only as they are needed.
+
+    Workspaces can contain thousands of files, and callers often want only
+    the first file of a particular type (or just the number of files).
+    """
+
+    def __init__(self, data: List[dict],
+                 errors: Mapping[str, List[FileError]]) -> None:
+        """Set the raw file data from the response."""
+        self._data = data
+        self._errors = errors
+        self._files: List[FileStatus] = []
+        self._lock = threading.Lock()
+
+    def _parse(self, index: int) -> None:
+        with self._lock:
+            for fdata in self._data[len(self._files):index + 1]:
+                self._files.append(FileStatus(
+                    name=fdata['name'],
+                    path=fdata['public_filepath'],
+                    size=fdata['size'],
+                    file_type=fdata['type'],
+                    modified=parse_datetime(fdata['modified_datetime']),
+                    errors=self._errors.get(fdata['public_filepath'], [])
+                ))
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        """Get a file (or files) by position."""
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self._data):
+            raise IndexError('File index out of range')
+        if index >= len(self._files):
+            self._parse(index)
+        return self._files[index]
+
+    def __iter__(self) -> Iterator[FileStatus]:
+        """Generate files in order, parsing only as far as needed."""
+        for index in range(len(self._data)):
+            yield self[index]
+
+    def __len__(self) -> int:
+        """Get the number of files, without parsing them."""
+        return len(self._data)
+
+    def __eq__(self, other: object) -> bool:
+        """Compare with another sequence of files."""
+        if not isinstance(other, (list, Sequence)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        """Represent the files, parsing all of them."""
+        return f'FileStatusList({list(self)!r})'
+
+    def __reduce__(self) -> Tuple[type, Tuple[List[FileStatus]]]:
+        """Pickle as a plain list of files."""
+        return list, (list(self),)
+
+
+class _StatusCache:
+    """Upload status responses, by upload ID, to revalidate with an ETag."""
+
+    def __init__(self, maxsize: int = 256) -> None:
+        self.maxsize = maxsize
+        self._entries: Dict[str, Tuple[str, Upload]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, upload_id: str) -> Optional[Tuple[str, Upload]]:
+        with self._lock:
+            entry = self._entries.get(upload_id)
+            if entry is not None:
+                self._entries.move_to_end(upload_id)  # type: ignore
+            return entry
+
+    def set(self, upload_id: str, etag: str, upload: Upload) -> None:
+        with self._lock:
+            self._entries[upload_id] = (etag, upload)
+            self._entries.move_to_end(upload_id)  # type: ignore
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)  # type: ignore
+
+    def discard(self, upload_id: str) -> None:
+        with self._lock:
+            self._entries.pop(upload_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+STATUS_CACHE = _StatusCache()
+"""Shared by all :class:`.Filemanager` sessions in the process."""
+
+
+class Filemanager(transport.HTTPIntegration):
     """Encapsulates a connection with the file management service."""
 
     SERVICE = 'filemanager'
@@ -90,33 +225,23 @@ class Filemanager(service.HTTPIntegration):
     def _parse_upload_status(self, data: dict) -> Upload:
         file_errors: Mapping[str, List[FileError]] = defaultdict(list)
         non_file_errors = []
-        filepaths = [fdata['public_filepath'] for fdata in data['files']]
+        filepaths = {fdata['public_filepath'] for fdata in data['files']}
         for etype, filepath, message in data['errors']:
             if filepath and filepath in filepaths:
                 file_errors[filepath].append(FileError(etype.upper(), message))
             else:   # This includes messages for files that were removed.
                 non_file_errors.append(FileError(etype.upper(), message))
 
-
         return Upload(
-            started=dateutil.parser.parse(data['start_datetime']),
-            completed=dateutil.parser.parse(data['completion_datetime']),
-            created=dateutil.parser.parse(data['created_datetime']),
-            modified=dateutil.parser.parse(data['modified_datetime']),
+            started=parse_datetime(data['start_datetime']),
+            completed=parse_datetime(data['completion_datetime']),
+            created=parse_datetime(data['created_datetime']),
+            modified=parse_datetime(data['modified_datetime']),
             status=UploadStatus(data['readiness']),
             lifecycle=UploadLifecycleStates(data['upload_status']),
             locked=bool(data['lock_state'] == 'LOCKED'),
             identifier=data['upload_id'],
-            files=[
-                FileStatus(
-                    name=fdata['name'],
-                    path=fdata['public_filepath'],
-                    size=fdata['size'],
-                    file_type=fdata['type'],
-                    modified=dateutil.parser.parse(fdata['modified_datetime']),
-                    errors=file_errors[fdata['public_filepath']]
-                ) for fdata in data['files']
-            ],
+            files=FileStatusList(data['files'], file_errors),
             errors=non_file_errors,
             compressed_size=data['upload_compressed_size'],
             size=data['upload_total_size'],
@@ -129,12 +254,15 @@ class Filemanager(service.HTTPIntegration):
         response = self.request('get', path, token, stream=True)
         stream = ReadWrapper(response.iter_content,
                              int(response.headers['Content-Length']))
-        return stream, response.headers
+        return cast(IO[bytes], stream), response.headers
 
     def upload_package(self, pointer: FileStorage, token: str) -> Upload:
         """
         Stream an upload to the file management service.
 
+        The upload is sent as it is read from ``pointer`` (see
+        :class:`.MultipartEncoder`), rather than being buffered in memory.
+
         If the file is an archive (zip, tar-ball, etc), it will be unpacked.
         A variety of processing and sanitization routines are performed, and
         any errors or warnings (including deleted files) will be included in
@@ -155,8 +283,10 @@ class Filemanager(service.HTTPIntegration):
             Response headers.
 
         """
-        files = {'file': (pointer.filename, pointer, pointer.mimetype)}
-        data, _, _ = self.json('post', '/', token, files=files,
+        body = MultipartEncoder({}, {'file': (pointer.filename, pointer,
+                                              pointer.mimetype)})
+        data, _, _ = self.json('post', '/', token, data=body,
+                               headers={'Content-Type': body.content_type},
                                expected_code=[status.CREATED,
                                               status.OK],
                                timeout=30, allow_2xx_redirects=False)
@@ -175,14 +305,34 @@ class Filemanager(service.HTTPIntegration):
 
         Returns
         -------
-        dict
+        :class:`.Upload`
             A description of the upload package.
-        dict
-            Response headers.
+
+        Notes
+        -----
+        The most recent status of each upload workspace is cached, and is
+        revalidated using its ETag; if the workspace has not changed, the
+        response is not parsed again.
 
         """
-        data, _, _ = self.json('get', f'/{upload_id}', token)
-        return self._parse_upload_status(data)
+        cached = STATUS_CACHE.get(upload_id)
+        headers = {'If-None-Match': cached[0]} if cached is not None else {}
+        response = self.request('get', f'/{upload_id}', token,
+                                expected_code=[status.OK, status.NOT_MODIFIED],
+                                headers=headers)
+        if response.status_code == status.NOT_MODIFIED and cached is not None:
+            return cached[1]
+        try:
+            data = response.json()
+        except json.decoder.JSONDecodeError as e:
+            raise BadResponse('Could not decode', response) from e
+        upload = self._parse_upload_status(data)
+        etag = response.headers.get('ETag')
+        if etag:
+            STATUS_CACHE.set(upload_id, etag, upload)
+        else:
+            STATUS_CACHE.discard(upload_id)
+        return upload
 
     def add_file(self, upload_id: str, pointer: FileStorage, token: str,
                  ancillary: bool = False) -> Upload:
@@ -214,9 +364,12 @@ class Filemanager(service.HTTPIntegration):
             Response headers.
 
         """
-        files = {'file': (pointer.filename, pointer, pointer.mimetype)}
-        data, _, _ = self.json('post', f'/{upload_id}', token,
-                               data={'ancillary': ancillary}, files=files,
+        body = MultipartEncoder({'ancillary': ancillary},
+                                {'file': (pointer.filename, pointer,
+                                          pointer.mimetype)})
+        STATUS_CACHE.discard(upload_id)
+        data, _, _ = self.json('post', f'/{upload_id}', token, data=body,
+                               headers={'Content-Type': body.content_type},
                                expected_code=[status.CREATED, status.OK],
                                timeout=30, allow_2xx_redirects=False)
         return self._parse_upload_status(data)
@@ -235,6 +388,7 @@ class Filemanager(service.HTTPIntegration):
             Auth token to include in the request.
 
         """
+        STATUS_CACHE.discard(upload_id)
         data, _, _ = self.json('post', f'/{upload_id}/delete_all', token)
         return self._parse_upload_status(data)
 
@@ -286,6 +440,7 @@ class Filemanager(service.HTTPIntegration):
             Response headers.
 
         """
+        STATUS_CACHE.discard(upload_id)
         data, _, _ = self.json('delete', f'/{upload_id}/{file_path}', token)
         return self._parse_upload_status(data)
 
@@ -0,0 +1,170 @@
+"""Tests for :mod:`.filemanager` with mocked responses."""
+
+import io
+from datetime import datetime, timedelta, timezone
+from unittest import TestCase, mock
+
+from flask import Flask
+from werkzeug.datastructures import FileStorage
+
+from arxiv.integration.api import status
+
+from .. import filemanager
+from ...util import MultipartEncoder
+from ....domain.uploads import FileError
+
+
+def make_status(n_files: int) -> dict:
+    """Make an upload status response with ``n_files`` files."""
+    return {
+        'start_datetime': '2019-01-02T03:04:05.123456+00:00',
+        'completion_datetime': '2019-01-02T03:04:06+00:00',
+        'created_datetime': '2019-01-02T03:04:05Z',
+        'modified_datetime': '2019-01-02T03:04:06-05:00',
+        'readiness': 'READY',
+        'upload_status': 'ACTIVE',
+        'lock_state': 'UNLOCKED',
+        'upload_id': 5,
+        'checksum': 'a1b2c3d4=',
+        'source_format': 'tex',
+        'upload_compressed_size': 1234,
+        'upload_total_size': 5678,
+        'files': [{'name': f'file{i}.tex',
+                   'public_filepath': f'src/file{i}.tex',
+                   'size': i,
+                   'type': 'PDF' if i == n_files - 1 else 'TEX',
+                   'modified_datetime': '2019-01-02T03:04:05+00:00'}
+                  for i in range(n_files)],
+        'errors': [['warn', 'src/file0.tex', 'Hmm'], ['fatal', '', 'Oops']]
+    }
+
+
+class TestParseDatetime(TestCase):
+    """Timestamps are parsed without dateutil where possible."""
+
+    def test_iso_8601(self):
+        """ISO-8601 timestamps are parsed correctly."""
+        self.assertEqual(
+            filemanager.parse_datetime('2019-01-02T03:04:05.12+05:30'),
+            datetime(2019, 1, 2, 3, 4, 5, 120000,
+                     tzinfo=timezone(timedelta(hours=5, minutes=30)))
+        )
+        self.assertEqual(filemanager.parse_datetime('2019-01-02T03:04:05Z'),
+                         datetime(2019, 1, 2, 3, 4, 5, tzinfo=timezone.utc))
+        self.assertEqual(filemanager.parse_datetime('2019-01-02 03:04:05'),
+                         datetime(2019, 1, 2, 3, 4, 5))
+
+    @mock.patch(f'{filemanager.__name__}.dateutil')
+    def test_other(self, mock_dateutil):
+        """Anything else is parsed by dateutil."""
+        filemanager.parse_datetime('Jan 2, 2019')
+        mock_dateutil.parser.parse.assert_called_once_with('Jan 2, 2019')
+
+
+class TestFileStatusList(TestCase):
+    """Files are parsed only as they are needed."""
+
+    def test_lazy(self):
+        """Only files up to the one requested are parsed."""
+        files = filemanager.FileStatusList(make_status(100)['files'], {})
+        self.assertEqual(len(files), 100)
+        self.assertEqual(files._files, [], 'Nothing parsed yet')
+        self.assertEqual(files[2].name, 'file2.tex')
+        self.assertEqual(len(files._files), 3)
+        self.assertEqual(files[-1].name, 'file99.tex')
+        self.assertEqual([f.size for f in files], list(range(100)))
+        self.assertEqual([f.size for f in files[1:3]], [1, 2])
+        with self.assertRaises(IndexError):
+            files[100]
+
+
+class TestGetUploadStatus(TestCase):
+    """Upload status is revalidated with the ETag of the last response."""
+
+    def setUp(self):
+        """Create an app for context."""
+        self.app = Flask('test')
+        self.app.config.update({
+            'FILEMANAGER_ENDPOINT': 'http://foohost:1234',
+            'FILEMANAGER_VERIFY': False
+        })
+        filemanager.STATUS_CACHE.clear()
+        self.addCleanup(filemanager.STATUS_CACHE.clear)
+
+    @mock.patch('arxiv.integration.api.service.requests.Session')
+    def test_get_upload_status(self, mock_Session):
+        """The status is parsed once, until it changes."""
+        mock_get = mock.MagicMock(side_effect=[
+            mock.MagicMock(status_code=status.OK, headers={'ETag': 'v1'},
+                           json=mock.MagicMock(return_value=make_status(3))),
+            mock.MagicMock(status_code=status.NOT_MODIFIED, headers={}),
+            mock.MagicMock(status_code=status.OK, headers={'ETag': 'v2'},
+                           json=mock.MagicMock(return_value=make_status(4)))
+        ])
+        mock_Session.return_value = mock.MagicMock(get=mock_get)
+        with self.app.app_context():
+            fm = filemanager.Filemanager.current_session()
+            first = fm.get_upload_status('5', 'footoken')
+            second = fm.get_upload_status('5', 'footoken')
+            third = fm.get_upload_status('5', 'footoken')
+
+        self.assertIs(first, second, 'The cached status is used')
+        self.assertEqual(mock_get.call_args_list[1][1]['headers'],
+                         {'If-None-Match': 'v1', 'Authorization': 'footoken'})
+        self.assertEqual(first.file_count, 3)
+        self.assertEqual(third.file_count, 4)
+        self.assertEqual(first.files[0].errors, [FileError('WARN', 'Hmm')])
+        self.assertEqual(first.errors, [FileError('FATAL', 'Oops')])
+        self.assertEqual(first.modified.utcoffset(), timedelta(hours=-5))
+
+    @mock.patch('arxiv.integration.api.service.requests.Session')
+    def test_has_single_file(self, mock_Session):
+        """Files are parsed only until a match is found."""
+        mock_Session.return_value = mock.MagicMock(get=mock.MagicMock(
+            return_value=mock.MagicMock(
+                status_code=status.OK,
+                headers={'ETag': 'v1'},
+                json=mock.MagicMock(return_value=make_status(1000))
+            )
+        ))
+        with self.app.app_context():
+            fm = filemanager.Filemanager.current_session()
+            self.assertTrue(fm.has_single_file('5', 'footoken', 'TEX'))
+        _, upload = filemanager.STATUS_CACHE.get('5')
+        self.assertEqual(len(upload.files._files), 1)
+
+
+class TestUploadPackage(TestCase):
+    """Uploads are streamed to the file manager."""
+
+    def setUp(self):
+        """Create an app for context."""
+        self.app = Flask('test')
+        self.app.config.update({
+            'FILEMANAGER_ENDPOINT': 'http://foohost:1234',
+            'FILEMANAGER_VERIFY': False
+        })
+
+    @mock.patch('arxiv.integration.api.service.requests.Session')
+    def test_upload_package(self, mock_Session):
+        """The package is sent as a streaming multipart body."""
+        mock_post = mock.MagicMock(return_value=mock.MagicMock(
+            status_code=status.CREATED, headers={},
+            json=mock.MagicMock(return_value=make_status(1))
+        ))
+        mock_Session.return_value = mock.MagicMock(post=mock_post)
+        pointer = FileStorage(io.BytesIO(b'foocontent'), filename='foo.tar',
+                              content_type='application/tar')
+        with self.app.app_context():
+            fm = filemanager.Filemanager.current_session()
+            upload = fm.upload_package(pointer, 'footoken')
+
+        self.assertEqual(upload.file_count, 1)
+        body = mock_post.call_args[1]['data']
+        self.assertIsInstance(body, MultipartEncoder)
+        self.assertEqual(mock_post.call_args[1]['headers']['Content-Type'],
+                         body.content_type)
+        content = body.read()
+        self.assertEqual(len(content), body.len)
+        self.assertIn(b'filename="foo.tar"', content)
+        self.assertIn(b'\r\n\r\nfoocontent\r\n', content)
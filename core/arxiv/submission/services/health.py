@@ -0,0 +1,221 @@
+"""
+Cached health checks and circuit breakers for upstream services.
+
+Calling ``is_available()`` on an integration makes a live request to the
+service. Status endpoints and processes that need to know whether a service is
+up should use :func:`is_available` in this module instead, which returns the
+result of the most recent probe of the service if it is fresh enough.
+
+Probes are registered with :func:`register`. Once :func:`is_available` is
+called from an application context, a background thread probes each
+registered service every ``HEALTH_CHECK_INTERVAL`` seconds. Results are
+considered fresh for ``HEALTH_CHECK_TTL`` seconds; a stale result is replaced
+by probing the service on the spot.
+
+Each service also has a :class:`.CircuitBreaker`. The breaker opens after
+``CIRCUIT_BREAKER_THRESHOLD`` consecutive failures (of probes or, for HTTP
+integrations, of requests via :mod:`.transport`), and while it is open calls
+fail fast instead of waiting for a timeout. After ``CIRCUIT_BREAKER_RESET``
+seconds a single trial call is allowed through; if it succeeds, or a probe
+succeeds, the breaker closes again.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from flask import Flask, current_app
+
+from arxiv.base import logging
+
+logger = logging.getLogger(__name__)
+
+Probe = Callable[[], bool]
+
+
+class CircuitBreaker:
+    """Tracks consecutive failures of a service, and fails fast if needed."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name: str, threshold: int = 5,
+                 reset_after: float = 30.) -> None:
+        """Start out closed."""
+        self.name = name
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened = 0.
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Determine whether a call to the service should be attempted."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            # While open, and while a trial call is underway, calls are
+            # refused; but if the trial call never reports back we try again.
+            if time.monotonic() - self._opened < self.reset_after:
+                return False
+            self.state = self.HALF_OPEN
+            self._opened = time.monotonic()
+            return True
+
+    def record_success(self) -> None:
+        """Record a successful call, and close the breaker."""
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info('Circuit for %s is closed', self.name)
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        """Record a failed call, and open the breaker if necessary."""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN \
+                    or self.failures >= self.threshold:
+                if self.state == self.CLOSED:
+                    logger.error('Circuit for %s is open after %i failures',
+                                 self.name, self.failures)
+                self.state = self.OPEN
+                self._opened = time.monotonic()
+
+
+class Monitor:
+    """Probes registered services, and caches the results."""
+
+    def __init__(self, interval: float = 10., ttl: float = 30.,
+                 threshold: int = 5, reset_after: float = 30.) -> None:
+        """Set the default parameters for checks and breakers."""
+        self.interval = interval
+        self.ttl = ttl
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._probes: Dict[str, Probe] = {}
+        self._results: Dict[str, bool] = {}
+        self._checked: Dict[str, float] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._thread: Optional[threading.Thread] = None
+
+    def configure(self, config: Dict[str, Any]) -> None:
+        """Update parameters from an application config."""
+        self.interval = float(config.get('HEALTH_CHECK_INTERVAL',
+                                         self.interval))
+        self.ttl = float(config.get('HEALTH_CHECK_TTL', self.ttl))
+        self.threshold = int(config.get('CIRCUIT_BREAKER_THRESHOLD',
+                                        self.threshold))
+        self.reset_after = float(config.get('CIRCUIT_BREAKER_RESET',
+                                            self.reset_after))
+        with self._lock:
+            for breaker in self._breakers.values():
+                breaker.threshold = self.threshold
+                breaker.reset_after = self.reset_after
+
+    def register(self, name: str, probe: Probe) -> None:
+        """Register a probe for a service."""
+        with self._lock:
+            self._probes[name] = probe
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        """Get the circuit breaker for a service."""
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(name, self.threshold,
+                                                      self.reset_after)
+            return self._breakers[name]
+
+    @property
+    def probing(self) -> bool:
+        """Whether a probe is underway in the current thread."""
+        return bool(getattr(self._local, 'probing', False))
+
+    def probe(self, name: str) -> bool:
+        """Probe a service now, and store the result."""
+        probe = self._probes[name]
+        self._local.probing = True
+        try:
+            available = bool(probe())
+        except Exception as e:
+            logger.error('Health check for %s failed: %s', name, e)
+            available = False
+        finally:
+            self._local.probing = False
+        if available:
+            self.breaker(name).record_success()
+        else:
+            self.breaker(name).record_failure()
+        with self._lock:
+            self._results[name] = available
+            self._checked[name] = time.monotonic()
+        return available
+
+    def is_available(self, name: str) -> bool:
+        """Get the most recent result for a service, probing if stale."""
+        with self._lock:
+            checked = self._checked.get(name)
+            result = self._results.get(name)
+        if name not in self._probes:
+            raise KeyError(f'No health check registered for {name}')
+        if checked is not None and time.monotonic() - checked < self.ttl:
+            return bool(result) and self.breaker(name).state \
+                != CircuitBreaker.OPEN
+        return self.probe(name)
+
+    def start(self, app: Flask) -> None:
+        """Start probing in the background, if not already started."""
+        if self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, args=(app,),
+                                            name='health-monitor')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self, app: Flask) -> None:
+        while True:
+            for name in list(self._probes):
+                with app.app_context():
+                    self.probe(name)
+            time.sleep(self.interval)
+
+
+monitor = Monitor()
+
+
+def init_app(app: Flask) -> None:
+    """Set default configuration parameters for an application instance."""
+    app.config.setdefault('HEALTH_CHECK_INTERVAL', 10)
+    app.config.setdefault('HEALTH_CHECK_TTL', 30)
+    app.config.setdefault('CIRCUIT_BREAKER_THRESHOLD', 5)
+    app.config.setdefault('CIRCUIT_BREAKER_RESET', 30)
+    monitor.configure(app.config)
+
+
+def register(name: str, probe: Probe) -> None:
+    """Register a probe for a service. See :meth:`.Monitor.register`."""
+    monitor.register(name, probe)
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Get the circuit breaker for a service."""
+    return monitor.breaker(name)
+
+
+def is_available(name: str) -> bool:
+    """
+    Check whether a service is available, using a cached result if possible.
+
+    If called in an application context, this also makes sure that services
+    are being probed in the background.
+    """
+    if current_app:
+        monitor.start(current_app._get_current_object())
+    return monitor.is_available(name)
@@ -15,12 +15,13 @@ service itself.
 """
 
 from enum import Enum
-from typing import Any, IO
+from typing import Any, IO, cast
 
 from arxiv.base import logging
 from arxiv.integration.api import status, exceptions, service
 from arxiv.taxonomy import Category
 
+from .. import transport
 from ..util import ReadWrapper
 
 logger = logging.getLogger(__name__)
@@ -34,7 +35,7 @@ class ExtractionInProgress(exceptions.RequestFailed):
     """An extraction is already in progress."""
 
 
-class PlainTextService(service.HTTPIntegration):
+class PlainTextService(transport.HTTPIntegration):
     """Represents an interface to the plain text extraction service."""
 
     SERVICE = 'plaintext'
@@ -146,7 +147,8 @@ class PlainTextService(service.HTTPIntegration):
         Returns
         -------
         :class:`io.BytesIO`
-            Raw content stream.
+            Raw content stream. The response body is read from the service as
+            the stream is consumed.
 
         Raises
         ------
@@ -159,9 +161,10 @@ class PlainTextService(service.HTTPIntegration):
         expected_code = [status.OK, status.SEE_OTHER]
         response = self.request('get', self.endpoint(source_id, checksum),
                                 token, expected_code=expected_code,
-                                headers={'Accept': 'text/plain'})
+                                headers={'Accept': 'text/plain'},
+                                stream=True)
         if response.status_code == status.SEE_OTHER:
             raise ExtractionInProgress('Extraction is in progress', response)
         stream = ReadWrapper(response.iter_content,
                              int(response.headers['Content-Length']))
-        return stream
+        return cast(IO[bytes], stream)
@@ -3,7 +3,7 @@
 import io
 from datetime import datetime
 from http import HTTPStatus as status
-from typing import Tuple, Any, IO, Callable, Iterator, Optional
+from typing import Tuple, Any, IO, Callable, Iterator, Optional, cast
 from urllib3.util.retry import Retry
 
 from backports.datetime_fromisoformat import MonkeyPatch
@@ -14,6 +14,7 @@ from arxiv.base import logging
 from arxiv.integration.api import service, exceptions
 
 from ...domain.preview import Preview
+from .. import transport
 from ..util import ReadWrapper
 
 
@@ -31,7 +32,7 @@ class PreviewMeta(TypedDict):
     checksum: str
 
 
-class PreviewService(service.HTTPIntegration):
+class PreviewService(transport.HTTPIntegration):
     """Represents an interface to the submission preview."""
 
     VERSION = '17057e6'
@@ -91,11 +92,11 @@ class PreviewService(service.HTTPIntegration):
 
         """
         response = self.request('get', f'/{source_id}/{checksum}/content',
-                                token)
+                                token, stream=True)
         preview_checksum = str(response.headers['ETag'])
         stream = ReadWrapper(response.iter_content,
                              int(response.headers['Content-Length']))
-        return stream, preview_checksum
+        return cast(IO[bytes], stream), preview_checksum
 
     def get_metadata(self, source_id: int, checksum: str, token: str) \
             -> Preview:
@@ -68,15 +68,15 @@ class StreamPublisher(metaclass=MetaIntegration):
         return g.stream    # type: ignore
 
     def is_available(self, **kwargs: Any) -> bool:
-        """Test our ability to put records."""
-        data = bytes(dumps({}), encoding='utf-8')
+        """Check that the stream exists and is accepting records."""
         try:
-            self.client.put_record(StreamName=self.stream, Data=data,
-                                   PartitionKey=self.partition_key)
+            description = self.client.describe_stream(StreamName=self.stream,
+                                                      Limit=1)
         except Exception as e:
-            logger.error('Encountered error while putting to stream: %s', e)
+            logger.error('Encountered error while describing stream: %s', e)
             return False
-        return True
+        status = description['StreamDescription']['StreamStatus']
+        return bool(status in ('ACTIVE', 'UPDATING'))
 
     def _create_stream(self) -> None:
         try:
@@ -99,10 +99,8 @@ class StreamPublisher(metaclass=MetaIntegration):
     def initialize(self) -> None:
         """Perform initial checks, e.g. at application start-up."""
         logger.info('initialize Kinesis stream')
-        data = bytes(dumps({}), encoding='utf-8')
         try:
-            self.client.put_record(StreamName=self.stream, Data=data,
-                                   PartitionKey=self.partition_key)
+            self.client.describe_stream(StreamName=self.stream, Limit=1)
             logger.info('storage service is already available')
         except ClientError as exc:
             if exc.response['Error']['Code'] == 'ResourceNotFoundException':
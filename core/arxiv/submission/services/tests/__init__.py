@@ -0,0 +1 @@
+"""Tests for :mod:`arxiv.submission.services`."""
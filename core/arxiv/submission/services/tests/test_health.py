@@ -0,0 +1,85 @@
+"""Tests for :mod:`arxiv.submission.services.health`."""
+
+from unittest import TestCase, mock
+
+from .. import health
+
+
+class TestCircuitBreaker(TestCase):
+    """The breaker opens after repeated failures, and recovers."""
+
+    def setUp(self):
+        """We have a breaker that opens after three failures."""
+        self.breaker = health.CircuitBreaker('foo', threshold=3,
+                                             reset_after=30)
+
+    def test_opens(self):
+        """Calls are refused after ``threshold`` consecutive failures."""
+        for _ in range(2):
+            self.breaker.record_failure()
+            self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, health.CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    @mock.patch(f'{health.__name__}.time')
+    def test_half_open(self, mock_time):
+        """After ``reset_after`` seconds, a single trial call is allowed."""
+        mock_time.monotonic.return_value = 100
+        for _ in range(3):
+            self.breaker.record_failure()
+        mock_time.monotonic.return_value = 131
+        self.assertTrue(self.breaker.allow(), 'The trial call is allowed')
+        self.assertFalse(self.breaker.allow(), 'Other calls are not')
+
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, health.CircuitBreaker.OPEN,
+                         'The breaker opens again if the trial fails')
+        mock_time.monotonic.return_value = 162
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, health.CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+
+class TestMonitor(TestCase):
+    """Health check results are cached."""
+
+    def setUp(self):
+        """We have a monitor with a probe for a service."""
+        self.monitor = health.Monitor(interval=0, ttl=30, threshold=2)
+        self.probe = mock.MagicMock(return_value=True)
+        self.monitor.register('foo', self.probe)
+
+    @mock.patch(f'{health.__name__}.time')
+    def test_cached(self, mock_time):
+        """The service is only probed again once the result is stale."""
+        mock_time.monotonic.return_value = 100
+        self.assertTrue(self.monitor.is_available('foo'))
+        mock_time.monotonic.return_value = 129
+        self.assertTrue(self.monitor.is_available('foo'))
+        self.assertEqual(self.probe.call_count, 1)
+        mock_time.monotonic.return_value = 131
+        self.monitor.is_available('foo')
+        self.assertEqual(self.probe.call_count, 2)
+
+    def test_probe_fails(self):
+        """A probe that raises an exception counts as a failure."""
+        self.probe.side_effect = RuntimeError
+        self.assertFalse(self.monitor.probe('foo'))
+        self.assertFalse(self.monitor.probe('foo'))
+        self.assertEqual(self.monitor.breaker('foo').state,
+                         health.CircuitBreaker.OPEN)
+        self.probe.side_effect = None
+        self.assertTrue(self.monitor.probe('foo'))
+        self.assertEqual(self.monitor.breaker('foo').state,
+                         health.CircuitBreaker.CLOSED,
+                         'A successful probe closes the breaker')
+
+    def test_probing(self):
+        """Probes can tell that they are probes."""
+        self.probe.side_effect = lambda: self.monitor.probing
+        self.assertTrue(self.monitor.probe('foo'))
+        self.assertFalse(self.monitor.probing)
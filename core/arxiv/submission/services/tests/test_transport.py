@@ -0,0 +1,128 @@
+"""Tests for :mod:`arxiv.submission.services.transport`."""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from unittest import TestCase
+
+from flask import Flask
+
+from arxiv.integration.api.exceptions import ConnectionFailed
+
+from .. import transport
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    delay = 0.
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+class FooService(transport.HTTPIntegration):
+    class Meta:
+        service_name = 'foo'
+
+
+class TestTransport(TestCase):
+    """Requests go through the shared transport."""
+
+    def setUp(self):
+        """Start a local HTTP server."""
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.endpoint = 'http://127.0.0.1:%i/' % self.server.server_port
+        transport.METRICS.reset()
+        _Handler.delay = 0.
+
+    def test_connections_are_shared(self):
+        """Sessions re-use connections from the shared pool."""
+        for i in range(5):
+            service = FooService(self.endpoint)
+            service.json('get', f'/things/{i}')
+            service._session.close()
+
+        metrics = transport.get_metrics()
+        connections = metrics['connections'][self.endpoint.rstrip('/')]
+        self.assertEqual(connections['opened'], 1,
+                         'A single connection is used for all sessions')
+        latency = metrics['latency'][('foo', 'GET', '/things/{id}')]
+        self.assertEqual(latency['count'], 5,
+                         'Latency is recorded per endpoint')
+        self.assertEqual(metrics['in_flight']['foo'], 0)
+
+    def test_max_in_flight(self):
+        """Requests fail if they can't get a slot in time."""
+        _Handler.delay = 0.5
+        errors = []
+
+        def request():
+            service = FooService(self.endpoint, max_in_flight=1,
+                                 in_flight_timeout=0.1)
+            try:
+                service.json('get', '/slow')
+            except ConnectionFailed as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=request) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(errors), 1, 'Only one request gets a slot')
+        self.assertEqual(transport.get_metrics()['rejected']['foo'], 1)
+
+    def test_circuit_breaker(self):
+        """Requests fail fast while the circuit for the service is open."""
+        breaker = transport.health.get_breaker('foo')
+        self.addCleanup(breaker.record_success)
+        for _ in range(breaker.threshold):
+            breaker.record_failure()
+        service = FooService(self.endpoint)
+        with self.assertRaises(ConnectionFailed):
+            service.json('get', '/things')
+        self.assertNotIn(('foo', 'GET', '/things'),
+                         transport.get_metrics()['latency'],
+                         'No request was made')
+
+    def test_init_app(self):
+        """Shared defaults can be overridden per service."""
+        app = Flask('test')
+        app.config['HTTP_MAX_IN_FLIGHT'] = 4
+        app.config['FOO_ENDPOINT'] = self.endpoint
+        app.config['FOO_POOL_MAXSIZE'] = 2
+        FooService.init_app(app)
+        service = FooService.get_session(app)
+
+        self.assertEqual(service._adapter.limiter.max_in_flight, 4)
+        self.assertEqual(service._adapter.poolmanager.connection_pool_kw
+                         ['maxsize'], 2)
+
+
+class TestEndpoint(TestCase):
+    """Request paths are labeled with a low-cardinality endpoint."""
+
+    def test_endpoint(self):
+        """Path segments with digits are replaced, and the query dropped."""
+        self.assertEqual(transport._endpoint('/upload/1234/content?a=1'),
+                         '/upload/{id}/content')
+        self.assertEqual(transport._endpoint('/status'), '/status')
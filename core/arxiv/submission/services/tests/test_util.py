@@ -0,0 +1,221 @@
+"""Tests for :mod:`arxiv.submission.services.util`."""
+
+import io
+import shutil
+import time
+from base64 import urlsafe_b64encode
+from hashlib import md5
+from unittest import TestCase
+
+import requests
+from werkzeug.formparser import parse_form_data
+
+from ..util import ReadWrapper, MultipartEncoder, PipelinedReader, \
+    IntegrityError, chunk_size_for, MIN_CHUNK_SIZE, MAX_CHUNK_SIZE
+
+
+def iter_chunks(content: bytes):
+    """Make a stand-in for :meth:`requests.Response.iter_content`."""
+    def iter_content(size):
+        for i in range(0, len(content), size):
+            yield content[i:i + size]
+    return iter_content
+
+
+class TestReadWrapper(TestCase):
+    """The wrapper behaves like a raw, readable stream."""
+
+    def setUp(self):
+        """We have some content, in chunks of 10 bytes."""
+        self.content = bytes(range(256)) * 4
+        self.stream = ReadWrapper(iter_chunks(self.content),
+                                  len(self.content), size=10)
+
+    def test_read_honours_size(self):
+        """``read(n)`` returns at most ``n`` bytes, in order."""
+        parts = []
+        while True:
+            part = self.stream.read(7)
+            if not part:
+                break
+            self.assertLessEqual(len(part), 7)
+            parts.append(part)
+        self.assertEqual(b''.join(parts), self.content)
+        self.assertEqual(self.stream.tell(), len(self.content))
+
+    def test_read_all(self):
+        """``read()`` returns the rest of the stream."""
+        self.assertEqual(self.stream.read(15), self.content[:10])
+        self.assertEqual(self.stream.read(), self.content[10:])
+        self.assertEqual(self.stream.read(), b'')
+
+    def test_readinto(self):
+        """``readinto`` fills the buffer across chunks."""
+        buffer = bytearray(25)
+        self.assertEqual(self.stream.readinto(buffer), 25)
+        self.assertEqual(bytes(buffer), self.content[:25])
+        out = io.BytesIO()
+        shutil.copyfileobj(self.stream, out)
+        self.assertEqual(out.getvalue(), self.content[25:])
+
+    def test_buffered(self):
+        """The wrapper can be used with :class:`io.BufferedReader`."""
+        content = b'first line\nsecond line\n'
+        stream = io.BufferedReader(ReadWrapper(iter_chunks(content),
+                                               len(content), size=4))
+        self.assertEqual(list(stream), [b'first line\n', b'second line\n'])
+
+    def test_iter(self):
+        """Iteration generates the (remaining) chunks."""
+        self.stream.read(5)
+        self.assertEqual(b''.join(self.stream), self.content[5:])
+
+    def test_request_body(self):
+        """Requests streams the remaining content, with a known length."""
+        self.stream.readinto(bytearray(100))
+        request = requests.Request('POST', 'http://foo/', data=self.stream)
+        prepared = request.prepare()
+        self.assertEqual(prepared.headers['Content-Length'],
+                         str(len(self.content) - 100))
+        self.assertIs(prepared.body, self.stream)
+
+    def test_chunk_size(self):
+        """Chunk sizes grow with the size of the content, within limits."""
+        self.assertEqual(chunk_size_for(100), MIN_CHUNK_SIZE)
+        self.assertEqual(chunk_size_for(16 * 2 * MIN_CHUNK_SIZE),
+                         2 * MIN_CHUNK_SIZE)
+        self.assertEqual(chunk_size_for(10 ** 10), MAX_CHUNK_SIZE)
+
+
+class TestMultipartEncoder(TestCase):
+    """The encoder streams a multipart body that servers can parse."""
+
+    def parse(self, body: bytes, content_type: str):
+        """Parse a multipart body like a Flask application would."""
+        environ = {'wsgi.input': io.BytesIO(body),
+                   'CONTENT_LENGTH': str(len(body)),
+                   'CONTENT_TYPE': content_type,
+                   'REQUEST_METHOD': 'POST'}
+        _, form, files = parse_form_data(environ)
+        return form, files
+
+    def test_encode(self):
+        """Fields and files are encoded, and the length is known."""
+        content = bytes(range(256)) * 1000
+        encoder = MultipartEncoder(
+            {'ancillary': False},
+            {'file': ('the "source".tar.gz', io.BytesIO(content),
+                      'application/gzip')},
+            chunk_size=1000
+        )
+        chunks = list(encoder)
+        body = b''.join(chunks)
+
+        self.assertEqual(encoder.len, len(body))
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), 1000)
+        form, files = self.parse(body, encoder.content_type)
+        self.assertEqual(form['ancillary'], 'False')
+        self.assertEqual(files['file'].read(), content)
+        self.assertEqual(files['file'].mimetype, 'application/gzip')
+        self.assertEqual(files['file'].filename, 'the %22source%22.tar.gz')
+
+    def test_unknown_length(self):
+        """Requests uses chunked encoding if the length is not known."""
+        class Unseekable(io.RawIOBase):
+            def __init__(self, data):
+                self.data = io.BytesIO(data)
+
+            def readable(self):
+                return True
+
+            def readinto(self, buffer):
+                return self.data.readinto(buffer)
+
+        encoder = MultipartEncoder({}, {'file': ('foo.txt',
+                                                 Unseekable(b'foo'), None)})
+        self.assertIsNone(encoder.len)
+        prepared = requests.Request('POST', 'http://foo/', data=encoder,
+                                    headers={'Content-Type':
+                                             encoder.content_type}).prepare()
+        self.assertEqual(prepared.headers['Transfer-Encoding'], 'chunked')
+        form, files = self.parse(b''.join(encoder), encoder.content_type)
+        self.assertEqual(files['file'].read(), b'foo')
+        self.assertEqual(files['file'].mimetype, 'application/octet-stream')
+
+    def test_request_body(self):
+        """Requests streams the body with a ``Content-Length``."""
+        encoder = MultipartEncoder({}, {'file': ('foo.txt',
+                                                 io.BytesIO(b'foo'), None)})
+        prepared = requests.Request('POST', 'http://foo/', data=encoder,
+                                    headers={'Content-Type':
+                                             encoder.content_type}).prepare()
+        self.assertEqual(prepared.headers['Content-Length'], str(encoder.len))
+        self.assertIs(prepared.body, encoder)
+
+
+class TestPipelinedReader(TestCase):
+    """The reader reads ahead on another thread, and checks the content."""
+
+    def setUp(self):
+        """We have some content, in chunks of 10 bytes."""
+        self.content = bytes(range(256)) * 4
+        self.checksum = \
+            urlsafe_b64encode(md5(self.content).digest()).decode('utf-8')
+        self.source = ReadWrapper(iter_chunks(self.content),
+                                  len(self.content), size=10)
+
+    def test_read(self):
+        """The content is read in full, and its checksum computed."""
+        stream = PipelinedReader(self.source, self.checksum, buffer_size=64,
+                                 buffers=2)
+        self.assertEqual(stream.len, len(self.content))
+        self.assertEqual(stream.read(100), self.content[:64],
+                         'Reads do not span buffers')
+        out = io.BytesIO()
+        shutil.copyfileobj(stream, out, 7)
+        self.assertEqual(out.getvalue(), self.content[64:])
+        self.assertEqual(stream.tell(), len(self.content))
+        self.assertEqual(stream.checksum, self.checksum)
+        self.assertEqual(stream.read(), b'')
+
+    def test_checksum_mismatch(self):
+        """The last of content that does not match is never returned."""
+        stream = PipelinedReader(self.source, 'foochx==', buffer_size=64)
+        out = io.BytesIO()
+        with self.assertRaises(IntegrityError):
+            shutil.copyfileobj(stream, out)
+        self.assertEqual(out.getvalue(), self.content[:-64])
+
+    def test_source_fails(self):
+        """An error reading the source is raised to the consumer."""
+        def iter_content(size):
+            yield self.content[:size]
+            raise ConnectionError('foo')
+
+        stream = PipelinedReader(ReadWrapper(iter_content, 1000),
+                                 buffer_size=10)
+        with self.assertRaises(ConnectionError):
+            stream.read()
+
+    def test_read_ahead(self):
+        """The source is read ahead, up to the size of the ring."""
+        stream = PipelinedReader(self.source, buffer_size=64, buffers=2)
+        self.assertEqual(self.source.tell(), 0, 'Reading starts on demand')
+        stream.read(1)
+        time.sleep(0.2)
+        self.assertEqual(self.source.tell(), 64 * 5,
+                         'One buffer is being read, two are in the ring, one'
+                         ' is held back, and one is waiting for room')
+        stream.close()
+        stream._thread.join(1)
+        self.assertFalse(stream._thread.is_alive(),
+                         'The reading thread stops when the reader is closed')
+
+    def test_request_body(self):
+        """Requests streams the content with a ``Content-Length``."""
+        stream = PipelinedReader(self.source)
+        prepared = requests.Request('POST', 'http://foo/',
+                                    data=stream).prepare()
+        self.assertEqual(prepared.headers['Content-Length'],
+                         str(len(self.content)))
+        self.assertIs(prepared.body, stream)
@@ -0,0 +1,354 @@
+"""
+Shared, pooled HTTP transport for service integrations.
+
+By default, each :class:`arxiv.integration.api.service.HTTPIntegration`
+instance creates its own :class:`requests.Session`, and a new instance is
+created for each application context. This means that connections are rarely
+re-used, and that there is no bound on the number of connections that a single
+slow service can tie up.
+
+:class:`.HTTPIntegration` in this module routes requests through connection
+pools that are shared by all sessions in the process (one per host), and
+limits the number of requests that may be in flight to each service at once.
+The following parameters may be set per service (e.g.
+``COMPILER_MAX_IN_FLIGHT``), or for all services (e.g.
+``HTTP_MAX_IN_FLIGHT``):
+
+``POOL_MAXSIZE`` : int
+    Maximum number of idle connections kept open to a host.
+``KEEPALIVE`` : int
+    Seconds before TCP keep-alive probes are sent on an idle connection. If
+    ``0``, TCP keep-alive is not enabled.
+``MAX_IN_FLIGHT`` : int
+    Maximum number of concurrent requests to the service. If ``0``, no limit
+    is applied.
+``IN_FLIGHT_TIMEOUT`` : float
+    Seconds to wait for a request slot before giving up with
+    :class:`.ConnectionFailed`.
+
+Request metrics are collected in-process, and can be obtained with
+:func:`get_metrics`.
+
+Requests also pass through the :class:`.health.CircuitBreaker` for the
+service: connection failures, timeouts, and 5xx responses count as failures,
+and while the breaker is open requests fail fast with
+:class:`.ConnectionFailed`. Integrations are registered for background health
+checks when :meth:`.HTTPIntegration.init_app` is called.
+"""
+
+import re
+import socket
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple, \
+    Union
+from urllib.parse import urlparse
+
+from flask import Flask, current_app
+from requests import PreparedRequest, Response
+from requests.exceptions import ConnectionError, Timeout
+from requests.adapters import HTTPAdapter
+from urllib3 import PoolManager
+from urllib3.connection import HTTPConnection
+
+from arxiv.base import logging
+from arxiv.integration.api import service
+from arxiv.integration.api.exceptions import ConnectionFailed
+
+from . import health
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS: Dict[str, Any] = {
+    'POOL_MAXSIZE': 10,
+    'KEEPALIVE': 60,
+    'MAX_IN_FLIGHT': 0,
+    'IN_FLIGHT_TIMEOUT': 10.
+}
+"""Default transport parameters."""
+
+BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30.,
+           float('inf'))
+"""Upper bounds (in seconds) of the request latency histogram buckets."""
+
+_ID = re.compile(r'^([^/]*\d[^/]*)$')
+
+
+class Metrics:
+    """Thread-safe collector for request metrics."""
+
+    def __init__(self) -> None:
+        """Initialize empty metrics."""
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Discard all collected metrics."""
+        with self._lock:
+            self._in_flight: Dict[str, int] = defaultdict(int)
+            self._waits: Dict[str, List[float]] = \
+                defaultdict(lambda: [0, 0., 0.])
+            self._rejected: Dict[str, int] = defaultdict(int)
+            self._latency: Dict[Tuple[str, str, str], List[Any]] = \
+                defaultdict(lambda: [[0] * len(BUCKETS), 0, 0.])
+
+    def started(self, service_name: str, waited: float) -> None:
+        """Record that a request started after waiting ``waited`` seconds."""
+        with self._lock:
+            self._in_flight[service_name] += 1
+            waits = self._waits[service_name]
+            waits[0] += 1
+            waits[1] += waited
+            waits[2] = max(waits[2], waited)
+
+    def rejected(self, service_name: str) -> None:
+        """Record that a request timed out waiting for a slot."""
+        with self._lock:
+            self._rejected[service_name] += 1
+
+    def finished(self, service_name: str, method: str, endpoint: str,
+                 duration: float) -> None:
+        """Record the latency of a completed request."""
+        with self._lock:
+            self._in_flight[service_name] -= 1
+            buckets, _, _ = latency = \
+                self._latency[(service_name, method, endpoint)]
+            for i, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    buckets[i] += 1
+                    break
+            latency[1] += 1
+            latency[2] += duration
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get a copy of the current metrics."""
+        with self._lock:
+            return {
+                'in_flight': dict(self._in_flight),
+                'wait': {name: {'count': count, 'total': total, 'max': peak}
+                         for name, (count, total, peak)
+                         in self._waits.items()},
+                'rejected': dict(self._rejected),
+                'latency': {
+                    key: {'buckets': dict(zip(BUCKETS, buckets)),
+                          'count': count, 'total': total}
+                    for key, (buckets, count, total)
+                    in self._latency.items()
+                }
+            }
+
+
+class Limiter:
+    """Limits the number of requests in flight to a service."""
+
+    def __init__(self, service_name: str, max_in_flight: int,
+                 timeout: float) -> None:
+        """Set up a semaphore, if there is a limit."""
+        self.service_name = service_name
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self._semaphore: Optional[threading.BoundedSemaphore] = None
+        if max_in_flight > 0:
+            self._semaphore = threading.BoundedSemaphore(max_in_flight)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Wait for a request slot."""
+        start = time.monotonic()
+        if self._semaphore is not None \
+                and not self._semaphore.acquire(timeout=self.timeout):
+            METRICS.rejected(self.service_name)
+            raise ConnectionFailed(f'Too many requests in flight to'
+                                   f' {self.service_name}')
+        METRICS.started(self.service_name, time.monotonic() - start)
+        try:
+            yield
+        finally:
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+
+class PooledAdapter(HTTPAdapter):
+    """
+    Transport adapter that uses a shared connection pool.
+
+    Each service gets its own adapter (so that retry behavior can differ),
+    but the connections themselves belong to the shared pool for the host.
+    """
+
+    def __init__(self, pool: PoolManager, limiter: Limiter,
+                 **kwargs: Any) -> None:
+        """Set the shared pool and the limiter for the service."""
+        self._pool = pool
+        self.limiter = limiter
+        super(PooledAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        """Use the shared pool rather than creating a new one."""
+        self.poolmanager = self._pool
+
+    def send(self, request: PreparedRequest, stream: bool = False,
+             timeout: Union[None, float, Tuple[float, float],
+                            Tuple[float, None]] = None,
+             verify: Union[bool, str] = True,
+             cert: Union[None, bytes, str,
+                         Tuple[Union[bytes, str], Union[bytes, str]]] = None,
+             proxies: Optional[Mapping[str, str]] = None) -> Response:
+        """Send a request, subject to the in-flight limit for the service."""
+        service_name = self.limiter.service_name
+        method = request.method or ''
+        endpoint = _endpoint(request.path_url)
+        # Health probes bypass the breaker; the monitor records their outcome.
+        breaker = None if health.monitor.probing \
+            else health.get_breaker(service_name)
+        if breaker is not None and not breaker.allow():
+            raise ConnectionFailed(f'Circuit for {service_name} is open')
+        with self.limiter.slot():
+            start = time.monotonic()
+            try:
+                response = super(PooledAdapter, self).send(
+                    request, stream=stream, timeout=timeout, verify=verify,
+                    cert=cert, proxies=proxies
+                )
+            except (ConnectionError, Timeout):
+                if breaker is not None:
+                    breaker.record_failure()
+                raise
+            finally:
+                METRICS.finished(service_name, method, endpoint,
+                                 time.monotonic() - start)
+        if breaker is not None:
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+        return response
+
+    def close(self) -> None:
+        """Leave the shared pool open when a session is closed."""
+        for proxy in self.proxy_manager.values():
+            proxy.clear()
+
+
+class HTTPIntegration(service.HTTPIntegration):
+    """An HTTP integration that uses the shared transport."""
+
+    class Meta:
+        """Configuration for the integration; set ``service_name``."""
+
+        service_name = "base"
+
+    def __init__(self, endpoint: str, verify: bool = True,
+                 headers: dict = {}, **extra: Any) -> None:
+        """Mount the shared transport for the service endpoint."""
+        params = {key: extra.pop(key.lower(), default)
+                  for key, default in DEFAULTS.items()}
+        super(HTTPIntegration, self).__init__(endpoint, verify=verify,
+                                              headers=headers, **extra)
+        o = urlparse(endpoint)
+        self._adapter = PooledAdapter(
+            get_pool(o.scheme, o.netloc, int(params['POOL_MAXSIZE']),
+                     int(params['KEEPALIVE'])),
+            get_limiter(self.Meta.service_name,
+                        int(params['MAX_IN_FLIGHT']),
+                        float(params['IN_FLIGHT_TIMEOUT'])),
+            max_retries=self._retry
+        )
+        self._session.mount(f'{o.scheme}://', self._adapter)
+
+    @classmethod
+    def init_app(cls, app: Flask) -> None:
+        """Set default transport parameters for the service."""
+        super(HTTPIntegration, cls).init_app(app)
+        name = cls.Meta.service_name.upper()
+        for key, default in DEFAULTS.items():
+            app.config.setdefault(f'{name}_{key}',
+                                  app.config.get(f'HTTP_{key}', default))
+        health.init_app(app)
+        health.register(cls.Meta.service_name, partial(_probe, cls))
+
+
+_pools: Dict[Tuple[str, str, int, int], PoolManager] = {}
+_limiters: Dict[str, Limiter] = {}
+_lock = threading.Lock()
+
+METRICS = Metrics()
+
+
+def get_pool(scheme: str, netloc: str, maxsize: int,
+             keepalive: int) -> PoolManager:
+    """Get the shared connection pool for a host."""
+    key = (scheme, netloc, maxsize, keepalive)
+    with _lock:
+        if key not in _pools:
+            logger.debug('New connection pool for %s://%s', scheme, netloc)
+            _pools[key] = PoolManager(num_pools=1, maxsize=maxsize,
+                                      socket_options=_socket_options(keepalive))
+        return _pools[key]
+
+
+def get_limiter(service_name: str, max_in_flight: int,
+                timeout: float) -> Limiter:
+    """Get the in-flight limiter for a service."""
+    with _lock:
+        limiter = _limiters.get(service_name)
+        if limiter is None or limiter.max_in_flight != max_in_flight \
+                or limiter.timeout != timeout:
+            limiter = Limiter(service_name, max_in_flight, timeout)
+            _limiters[service_name] = limiter
+        return limiter
+
+
+def get_metrics() -> Dict[str, Any]:
+    """
+    Get request metrics for all services.
+
+    Returns
+    -------
+    dict
+        ``in_flight`` is the number of requests currently in flight, and
+        ``rejected`` the number of requests that timed out waiting for a
+        slot, per service. ``wait`` summarizes the time spent waiting for a
+        slot, per service. ``latency`` is a histogram of request durations
+        per service, method, and endpoint. ``connections`` has the number of
+        connections opened and idle in each shared pool.
+
+    """
+    metrics = METRICS.snapshot()
+    metrics['connections'] = {}
+    with _lock:
+        for (scheme, netloc, _, _), pool in _pools.items():
+            for key in pool.pools.keys():
+                host_pool = pool.pools[key]
+                metrics['connections'][f'{scheme}://{netloc}'] = {
+                    'opened': host_pool.num_connections,
+                    'idle': host_pool.pool.qsize() if host_pool.pool else 0
+                }
+    return metrics
+
+
+def _probe(cls: type) -> bool:
+    """Check whether the service for an integration class is available."""
+    name = cls.Meta.service_name.upper()    # type: ignore
+    timeout = current_app.config.get(f'{name}_STATUS_TIMEOUT')
+    kwargs = {} if timeout is None else {'timeout': float(timeout)}
+    return bool(cls.current_session().is_available(**kwargs))  # type: ignore
+
+
+def _endpoint(path: str) -> str:
+    """Get a low-cardinality label for a request path."""
+    path = path.split('?', 1)[0]
+    return '/'.join(_ID.sub('{id}', part) for part in path.split('/'))
+
+
+def _socket_options(keepalive: int) -> List[Tuple[int, int, int]]:
+    options = list(HTTPConnection.default_socket_options)
+    if keepalive > 0:
+        options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE,
+                            keepalive))
+    return options
@@ -1,18 +1,88 @@
 """Helpers for service modules."""
 
 import io
-from typing import Callable, Iterator, Any, Optional
+import queue
+import threading
+import time
+import uuid
+from base64 import urlsafe_b64encode
+from collections import deque
+from hashlib import md5
+from typing import Callable, Iterator, Any, Optional, Union, Mapping, \
+    Tuple, IO, Deque, List, cast
 
-from typing_extensions import Literal
+from typing_extensions import Literal, Protocol
 
+WritableBuffer = Any
+"""
+Anything that :class:`memoryview` can write into, e.g. a :class:`bytearray`.
 
-class ReadWrapper(io.BytesIO):
-    """Wraps a response body streaming iterator to provide ``read()``."""
+As for typeshed, this is ``Any``; :meth:`io.RawIOBase.readinto` may be passed
+any object that supports the buffer protocol.
+"""
+
+
+class Readable(Protocol):
+    """A stream of bytes that can be read, e.g. a file."""
+
+    def read(self, __size: int = ...) -> bytes:
+        """Read up to ``size`` bytes (or the rest of the stream)."""
+        ...
+
+
+MIN_CHUNK_SIZE = 64 * 1024
+"""Smallest chunk (in bytes) read from a response body at a time."""
+
+MAX_CHUNK_SIZE = 1024 * 1024
+"""Largest chunk (in bytes) read from a response body at a time."""
+
+
+def chunk_size_for(content_size_bytes: int) -> int:
+    """
+    Choose a chunk size for a response body of a given size.
+
+    Small bodies are read in a single chunk (of at least
+    :const:`MIN_CHUNK_SIZE` bytes), and large bodies in about sixteen chunks,
+    up to :const:`MAX_CHUNK_SIZE` bytes each.
+    """
+    return max(MIN_CHUNK_SIZE, min(content_size_bytes // 16, MAX_CHUNK_SIZE))
+
+
+class ReadWrapper(io.RawIOBase):
+    """
+    Wraps a response body streaming iterator to provide a readable stream.
+
+    Chunks are pulled from the iterator only as they are needed. ``read(n)``
+    returns at most ``n`` bytes (fewer if the end of a chunk is reached, as
+    is usual for raw streams), and :meth:`readinto` fills the caller's buffer
+    without intermediate copies. Pass the stream to :class:`io.BufferedReader`
+    for line-oriented access.
+    """
 
     def __init__(self, iter_content: Callable[[int], Iterator[bytes]],
-                 content_size_bytes: int, size: int = 4096) -> None:
-        """Initialize the streaming iterator."""
-        self._iter_content = iter_content(size)
+                 content_size_bytes: int, size: Optional[int] = None) -> None:
+        """
+        Initialize the streaming iterator.
+
+        Parameters
+        ----------
+        iter_content : callable
+            E.g. :meth:`requests.Response.iter_content`.
+        content_size_bytes : int
+            Size of the response body.
+        size : int
+            Size of the chunks to request from ``iter_content``. By default,
+            this is chosen based on ``content_size_bytes`` (see
+            :func:`chunk_size_for`).
+
+        """
+        if size is None:
+            size = chunk_size_for(content_size_bytes)
+        self.chunk_size = size
+        self._iter_content = iter(iter_content(size))
+        self._chunk = b''
+        self._offset = 0
+        self._position = 0
         # Must be set for requests to treat this as streamable "file like
         # object".
         # See https://github.com/psf/requests/blob/bedd9284c9646e50c10b3defdf519d4ba479e2c7/requests/models.py#L476
@@ -26,16 +96,69 @@ class ReadWrapper(io.BytesIO):
         """Indicate that it *is* a readable stream."""
         return True
 
-    def read(self, *args: Any, **kwargs: Any) -> bytes:
+    def tell(self) -> int:
         """
-        Read the next chunk of the content stream.
+        Get the number of bytes read so far.
 
-        Arguments are ignored, since the chunk size must be set at the start.
+        Requests uses this (with ``len``) to determine how much of the body
+        remains to be sent.
         """
-        # print('read with size', size)
-        # if size == -1:
-        #     return b''.join(self._iter_content)
-        return next(self._iter_content)
+        return self._position
+
+    def _fill(self) -> bool:
+        """Make sure that there is unread data in the current chunk."""
+        while self._offset >= len(self._chunk):
+            chunk = next(self._iter_content, None)
+            if chunk is None:
+                return False
+            self._chunk, self._offset = chunk, 0
+        return True
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        """
+        Read up to ``size`` bytes of the content stream.
+
+        If ``size`` is negative or ``None``, read until the end of the stream.
+        Returns ``b''`` once the stream is exhausted.
+        """
+        if size is None or size < 0:
+            return self.readall()
+        if size == 0 or not self._fill():
+            return b''
+        start = self._offset
+        end = min(start + size, len(self._chunk))
+        data = self._chunk if start == 0 and end == len(self._chunk) \
+            else self._chunk[start:end]
+        self._offset = end
+        self._position += end - start
+        return data
+
+    def readall(self) -> bytes:
+        """Read until the end of the content stream."""
+        parts = []
+        while self._fill():
+            parts.append(self.read(len(self._chunk) - self._offset))
+        return b''.join(parts)
+
+    def readinto(self, buffer: WritableBuffer) -> int:
+        """Read as many bytes as will fit into ``buffer``."""
+        view = _byte_view(buffer)
+        filled = 0
+        while filled < len(view) and self._fill():
+            n = min(len(view) - filled, len(self._chunk) - self._offset)
+            view[filled:filled + n] = \
+                memoryview(self._chunk)[self._offset:self._offset + n]
+            self._offset += n
+            filled += n
+        self._position += filled
+        return filled
+
+    def close(self) -> None:
+        """Stop reading the response body."""
+        close = getattr(self._iter_content, 'close', None)
+        if close is not None:
+            close()
+        super(ReadWrapper, self).close()
 
     def __len__(self) -> int:
         return self.len
@@ -45,4 +168,334 @@ class ReadWrapper(io.BytesIO):
     # See https://github.com/psf/requests/blob/bedd9284c9646e50c10b3defdf519d4ba479e2c7/requests/models.py#L470-L473
     def __iter__(self) -> Iterator[bytes]:
         """Generate chunks of body content."""
-        return self._iter_content
\ No newline at end of file
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+class MultipartEncoder(io.RawIOBase):
+    """
+    Streams a ``multipart/form-data`` request body.
+
+    Passing files to requests via ``files=`` builds the entire body in memory
+    before it is sent. Passing a :class:`MultipartEncoder` as ``data``
+    instead sends the body as the file streams are read, ``chunk_size``
+    bytes at a time. If the size of every file can be determined (i.e. the
+    streams are seekable), ``len`` is set so that requests sends a
+    ``Content-Length``; otherwise, chunked transfer encoding is used.
+
+    .. code-block:: python
+
+       body = MultipartEncoder({'ancillary': 'false'},
+                               {'file': (filename, stream, mimetype)})
+       requests.post(url, data=body,
+                     headers={'Content-Type': body.content_type})
+
+    """
+
+    def __init__(self, fields: Mapping[str, Any],
+                 files: Mapping[str, Tuple[Optional[str], Readable,
+                                           Optional[str]]],
+                 boundary: Optional[str] = None,
+                 chunk_size: int = MIN_CHUNK_SIZE) -> None:
+        """
+        Lay out the parts of the body.
+
+        Each of ``files`` is a filename (which may be ``None``), a stream, and
+        a content type (``application/octet-stream`` if ``None``).
+        """
+        self.boundary = boundary or uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self._parts: Deque[Union[bytes, Readable]] = deque()
+        self._offset = 0
+        self._position = 0
+        length: Optional[int] = 0
+        for name, value in fields.items():
+            self._add(self._header(name) + b'\r\n'
+                      + str(value).encode('utf-8') + b'\r\n')
+        for name, (filename, stream, content_type) in files.items():
+            content_type = content_type or 'application/octet-stream'
+            self._add(self._header(name, filename) + b'Content-Type: '
+                      + content_type.encode('utf-8') + b'\r\n\r\n')
+            self._parts.append(stream)
+            size = _remaining(stream)
+            length = None if size is None or length is None \
+                else length + size
+            self._add(b'\r\n')
+        self._add(f'--{self.boundary}--\r\n'.encode('utf-8'))
+        if length is not None:
+            length += sum(len(part) for part in self._parts
+                          if isinstance(part, bytes))
+        self.len = length
+        """Size of the body, if known."""
+
+    @property
+    def content_type(self) -> str:
+        """The value of the ``Content-Type`` header for the request."""
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def _header(self, name: str, filename: Optional[str] = None) -> bytes:
+        """Start a part, up to the end of the ``Content-Disposition``."""
+        disposition = f'form-data; name="{_quote(name)}"'
+        if filename is not None:
+            disposition += f'; filename="{_quote(filename)}"'
+        return (f'--{self.boundary}\r\n'
+                f'Content-Disposition: {disposition}\r\n').encode('utf-8')
+
+    def _add(self, data: bytes) -> None:
+        if self._parts and isinstance(self._parts[-1], bytes):
+            self._parts[-1] += data
+        else:
+            self._parts.append(data)
+
+    def readable(self) -> bool:
+        """Indicate that this is a readable stream."""
+        return True
+
+    def tell(self) -> int:
+        """Get the number of bytes read so far."""
+        return self._position
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        """Read up to ``size`` bytes of the body (all of it, by default)."""
+        if size is None or size < 0:
+            return b''.join(iter(lambda: self.read(self.chunk_size), b''))
+        while self._parts:
+            part = self._parts[0]
+            if isinstance(part, bytes):
+                chunk = part[self._offset:self._offset + size]
+                self._offset += len(chunk)
+            else:
+                chunk = part.read(size)
+            if not chunk:
+                self._parts.popleft()
+                self._offset = 0
+                continue
+            self._position += len(chunk)
+            return chunk
+        return b''
+
+    def readinto(self, buffer: WritableBuffer) -> int:
+        """Read as many bytes as will fit into ``buffer``."""
+        view = _byte_view(buffer)
+        data = self.read(len(view))
+        view[:len(data)] = data
+        return len(data)
+
+    def __iter__(self) -> Iterator[bytes]:
+        """Generate chunks of the body."""
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+class IntegrityError(ValueError):
+    """Content does not have the expected checksum."""
+
+
+class PipelinedReader(io.RawIOBase):
+    """
+    Reads ahead from a stream on a separate thread, into a bounded ring.
+
+    Relaying a response body (e.g. a :class:`ReadWrapper`) directly as the
+    body of another request means that the download and the upload take
+    turns on one thread, so the transfer runs at the combined rate of the
+    two rather than the rate of the slower one. A :class:`PipelinedReader`
+    downloads on its own thread, into a ring of ``buffers`` buffers of
+    ``buffer_size`` bytes that the upload consumes. Besides the ring, the
+    reading thread holds up to two buffers, and the consumer one.
+
+    The MD5 checksum of the content is computed on the reading thread. The
+    last buffer is held back until the end of the source has been reached;
+    if ``checksum`` is given and does not match, :class:`IntegrityError` is
+    raised in its place, so that a service receiving the content never gets
+    all of content that is corrupt.
+
+    .. code-block:: python
+
+       reader = PipelinedReader(ReadWrapper(...), checksum)
+       try:
+           requests.post(url, data=reader)
+       finally:
+           reader.close()
+
+    The reading thread starts with the first call to :meth:`read`. Errors
+    raised by the source are raised by :meth:`read` when the consumer
+    catches up with them.
+    """
+
+    def __init__(self, source: IO[bytes], checksum: Optional[str] = None,
+                 buffer_size: int = MAX_CHUNK_SIZE, buffers: int = 4) -> None:
+        """Prepare to read from ``source``."""
+        self.expected = checksum
+        self.buffer_size = buffer_size
+        self._source = source
+        self._queue: queue.Queue = queue.Queue(buffers)
+        self._thread: Optional[threading.Thread] = None
+        self._closing = threading.Event()
+        self._hash = md5()
+        self._chunk = b''
+        self._offset = 0
+        self._position = 0
+        self._done = False
+        size = getattr(source, 'len', None)
+        if size is not None:
+            self.len = size - source.tell()
+            """Size of the content, if it is known."""
+        self.waited = 0.
+        """Seconds that the consumer spent waiting for the reading thread."""
+
+    @property
+    def checksum(self) -> str:
+        """URL-safe base64-encoded MD5 digest of the content read ahead."""
+        return urlsafe_b64encode(self._hash.digest()).decode('utf-8')
+
+    def readable(self) -> bool:
+        """Indicate that this is a readable stream."""
+        return True
+
+    def seekable(self) -> bool:
+        """Indicate that this is a non-seekable stream."""
+        return False
+
+    def tell(self) -> int:
+        """Get the number of bytes read so far."""
+        return self._position
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        """
+        Read up to ``size`` bytes (or the rest of the content, if negative).
+
+        Raises
+        ------
+        :class:`IntegrityError`
+            In place of the last of the content, if it does not have the
+            expected checksum.
+
+        """
+        if size is None or size < 0:
+            return b''.join(iter(lambda: self.read(self.buffer_size), b''))
+        if size == 0 or not self._fill():
+            return b''
+        start = self._offset
+        end = min(start + size, len(self._chunk))
+        data = self._chunk if start == 0 and end == len(self._chunk) \
+            else self._chunk[start:end]
+        self._offset = end
+        self._position += end - start
+        return data
+
+    def readinto(self, buffer: WritableBuffer) -> int:
+        """Read as many bytes as will fit into ``buffer``."""
+        view = _byte_view(buffer)
+        data = self.read(len(view))
+        view[:len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        """Stop reading ahead, and release the buffers."""
+        self._closing.set()
+        while True:     # Make room, in case the reading thread is waiting.
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        super(PipelinedReader, self).close()
+
+    def _fill(self) -> bool:
+        """Make sure that there is unread data in the current buffer."""
+        while self._offset >= len(self._chunk):
+            if self._done:
+                return False
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._read_ahead,
+                                                daemon=True)
+                self._thread.start()
+            start = time.perf_counter()
+            item = self._queue.get()
+            self.waited += time.perf_counter() - start
+            if item is None or isinstance(item, BaseException):
+                self._done = True
+                if item is not None:
+                    raise item
+                return False
+            self._chunk, self._offset = item, 0
+        return True
+
+    def _read_ahead(self) -> None:
+        """Fill buffers from the source, until the end or until closed."""
+        held: Optional[bytes] = None
+        try:
+            while not self._closing.is_set():
+                data = self._read_buffer()
+                if not data:
+                    break
+                self._hash.update(data)
+                if held is not None:
+                    self._put(held)
+                held = data
+            if self.expected is not None and self.checksum != self.expected:
+                raise IntegrityError(f'Expected {self.expected}, got'
+                                     f' {self.checksum}')
+            if held is not None:
+                self._put(held)
+            self._put(None)
+        except BaseException as e:
+            self._put(e)
+
+    def _read_buffer(self) -> bytes:
+        """Read ``buffer_size`` bytes, or as many as are left."""
+        parts: List[bytes] = []
+        remaining = self.buffer_size
+        while remaining > 0 and not self._closing.is_set():
+            data = self._source.read(remaining)
+            if not data:
+                break
+            parts.append(data)
+            remaining -= len(data)
+        return parts[0] if len(parts) == 1 else b''.join(parts)
+
+    def _put(self, item: Union[bytes, BaseException, None]) -> None:
+        """Add an item to the ring, unless we are closed while waiting."""
+        while not self._closing.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+
+def _byte_view(buffer: WritableBuffer) -> memoryview:
+    """
+    Get a writable view of ``buffer``, one byte per item.
+
+    The buffers passed to ``readinto`` by :mod:`io` are already of unsigned
+    bytes (format ``'B'``); other buffers are cast.
+    """
+    view = memoryview(buffer)
+    if view.format == 'B' and view.ndim == 1:
+        return view
+    return view.cast('B')   # type: ignore  # Not in older typeshed.
+
+
+def _quote(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '%22') \
+        .replace('\r', '%0D').replace('\n', '%0A')
+
+
+def _remaining(stream: Readable) -> Optional[int]:
+    """Get the number of bytes left in ``stream``, if it can be determined."""
+    seekable = cast(IO[bytes], stream)     # If not, we find out below.
+    try:
+        position = seekable.tell()
+        end = seekable.seek(0, io.SEEK_END)
+        seekable.seek(position)
+    except (AttributeError, OSError, ValueError):
+        return None
+    if end is None:     # Some file-like objects don't return the position.
+        return None
+    return end - position
@@ -0,0 +1,112 @@
+"""
+Benchmark uploads of source packages via :class:`.MultipartEncoder`.
+
+A local HTTP server stands in for the file manager. Each run uploads a file
+of the given size as ``multipart/form-data``, in two ways:
+
+``files``
+    Pass the file to requests via ``files=`` (as the file manager client did
+    previously), which builds the whole body in memory before sending it.
+``encoder``
+    Pass a :class:`.MultipartEncoder` as ``data``, which streams the body as
+    the file is read.
+
+The best time and the peak memory allocated (per :mod:`tracemalloc`) are
+reported for each.
+
+Usage: python benchmark_multipart.py [--size MB] [--runs N]
+"""
+
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Callable, IO, Tuple
+
+import requests
+
+from arxiv.submission.services.util import MultipartEncoder
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self) -> None:
+        if 'Content-Length' in self.headers:
+            remaining = int(self.headers['Content-Length'])
+            while remaining:
+                remaining -= len(self.rfile.read(min(remaining, 1024 * 1024)))
+        else:   # Chunked transfer encoding.
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                self.rfile.read(size + 2)
+                if not size:
+                    break
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+def files(session: requests.Session, url: str, f: IO[bytes]) -> None:
+    session.post(url, data={'ancillary': 'false'},
+                 files={'file': ('foo.tar.gz', f, 'application/gzip')})
+
+
+def encoder(session: requests.Session, url: str, f: IO[bytes]) -> None:
+    body = MultipartEncoder({'ancillary': 'false'},
+                            {'file': ('foo.tar.gz', f, 'application/gzip')})
+    session.post(url, data=body, headers={'Content-Type': body.content_type})
+
+
+def measure(func: Callable, session: requests.Session, url: str,
+            path: str, runs: int) -> Tuple[float, float]:
+    """Get the best time (in seconds) and peak memory (in MB)."""
+    best, peak = float('inf'), 0
+    for _ in range(runs):
+        with open(path, 'rb') as f:
+            tracemalloc.start()
+            start = time.perf_counter()
+            func(session, url, f)
+            best = min(best, time.perf_counter() - start)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+    return best, peak / 1024 / 1024
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=64,
+                        help='Size of the uploaded file, in MB')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    server = Server(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%i/' % server.server_port
+
+    session = requests.Session()
+    with tempfile.NamedTemporaryFile() as f:
+        f.write(os.urandom(args.size * 1024 * 1024))
+        f.flush()
+        print(f'{args.size} MB file, best of {args.runs} runs')
+        for name, func in (('files', files), ('encoder', encoder)):
+            seconds, peak = measure(func, session, url, f.name, args.runs)
+            print(f'{name:>8}: {seconds:6.3f} s, peak {peak:8.1f} MB')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
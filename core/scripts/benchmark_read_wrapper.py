@@ -0,0 +1,115 @@
+"""
+Benchmark streaming of response bodies via :class:`.ReadWrapper`.
+
+A local HTTP server stands in for the file manager, preview, and plain text
+services. Each run downloads a body of the given size and consumes it in two
+ways that are common in the agent:
+
+``copy``
+    Write the body to a file with :func:`shutil.copyfileobj` (as when storing
+    source packages and previews).
+``relay``
+    Stream the body to another (local) service in the body of a POST request
+    (as when relaying content to the legacy filesystem or the classifier).
+
+Throughput is reported for the adaptive chunk size, and for the fixed
+4096-byte chunks used previously.
+
+Usage: python benchmark_read_wrapper.py [--size MB] [--runs N]
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Callable, Optional
+
+import requests
+
+from arxiv.submission.services.util import ReadWrapper
+
+BODY = b''
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self) -> None:
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def do_POST(self) -> None:
+        remaining = int(self.headers['Content-Length'])
+        while remaining:
+            remaining -= len(self.rfile.read(min(remaining, 1024 * 1024)))
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+def open_stream(session: requests.Session, url: str,
+                size: Optional[int]) -> ReadWrapper:
+    response = session.get(url, stream=True)
+    return ReadWrapper(response.iter_content,
+                       int(response.headers['Content-Length']), size=size)
+
+
+def copy(session: requests.Session, url: str, size: Optional[int]) -> None:
+    with tempfile.TemporaryFile() as f:
+        shutil.copyfileobj(open_stream(session, url, size), f)
+
+
+def relay(session: requests.Session, url: str, size: Optional[int]) -> None:
+    session.post(url, data=open_stream(session, url, size))
+
+
+def measure(func: Callable, session: requests.Session, url: str,
+            size: Optional[int], runs: int) -> float:
+    """Get the best throughput (in MB/s) over ``runs`` runs."""
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        func(session, url, size)
+        best = min(best, time.perf_counter() - start)
+    return len(BODY) / best / 1024 / 1024
+
+
+def main() -> None:
+    global BODY
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=64,
+                        help='Size of the response body, in MB')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    BODY = os.urandom(args.size * 1024 * 1024)
+    server = Server(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%i/' % server.server_port
+
+    session = requests.Session()
+    print(f'{args.size} MB body, best of {args.runs} runs')
+    for name, func in (('copy', copy), ('relay', relay)):
+        for label, size in (('adaptive', None), ('4096 bytes', 4096)):
+            rate = measure(func, session, url, size, args.runs)
+            print(f'{name:>6} {label:>10}: {rate:8.1f} MB/s')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark relaying content from one service to another.
+
+Stand-ins for the download (from the file manager) and the upload (to the
+legacy filesystem) take time in proportion to the bytes that they move, at
+the given rates, without the buffering that local sockets would add. Each run
+relays content of the given size in two ways:
+
+``lockstep``
+    Upload directly from the download stream (as :class:`.CopySourceToLegacy`
+    did previously), so that the two take turns on one thread.
+``pipelined``
+    Upload from a :class:`.PipelinedReader`, which downloads on a separate
+    thread while the upload proceeds, and checks the checksum on the way.
+
+The best throughput is reported for each. Pipelining should approach the
+slower of the two rates; lockstep approaches their harmonic combination.
+
+Usage: python benchmark_transfer.py [--size MB] [--download MB/s]
+    [--upload MB/s] [--runs N]
+"""
+
+import io
+import time
+from argparse import ArgumentParser
+from base64 import urlsafe_b64encode
+from hashlib import md5
+from typing import IO, Optional
+
+from arxiv.submission.services.util import PipelinedReader
+
+UPLOAD_BLOCK = 8192
+"""Bytes read at a time by the upload (as by :mod:`http.client`)."""
+
+
+class Pace:
+    """Takes time in proportion to bytes moved, at a fixed rate."""
+
+    def __init__(self, rate: float) -> None:
+        self._rate = rate
+        self._owed = 0.
+
+    def __call__(self, size: int) -> None:
+        # Sleep is coarse, so let time owed accrue, and account for any
+        # oversleep.
+        self._owed += size / self._rate
+        if self._owed > 0.001:
+            start = time.perf_counter()
+            time.sleep(self._owed)
+            self._owed -= time.perf_counter() - start
+
+
+class Download(io.RawIOBase):
+    """Content that arrives at a fixed rate, as it is read."""
+
+    def __init__(self, content: bytes, rate: float) -> None:
+        self._content = io.BytesIO(content)
+        self._pace = Pace(rate)
+        self.len = len(content)
+
+    def readable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._content.tell()
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        data = self._content.read(size)
+        self._pace(len(data))
+        return data
+
+
+def upload(stream: IO[bytes], rate: float) -> None:
+    """Send the stream at a fixed rate."""
+    pace = Pace(rate)
+    for data in iter(lambda: stream.read(UPLOAD_BLOCK), b''):
+        pace(len(data))
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=32,
+                        help='Size of the content, in MB')
+    parser.add_argument('--download', type=float, default=50,
+                        help='Download rate, in MB/s')
+    parser.add_argument('--upload', type=float, default=50,
+                        help='Upload rate, in MB/s')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    content = bytes(args.size * 1024 * 1024)
+    checksum = urlsafe_b64encode(md5(content).digest()).decode('utf-8')
+    download_rate = args.download * 1024 * 1024
+    upload_rate = args.upload * 1024 * 1024
+
+    def lockstep() -> None:
+        upload(Download(content, download_rate), upload_rate)
+
+    def pipelined() -> None:
+        reader = PipelinedReader(Download(content, download_rate), checksum)
+        try:
+            upload(reader, upload_rate)
+        finally:
+            reader.close()
+
+    print(f'{args.size} MB, download {args.download} MB/s, upload'
+          f' {args.upload} MB/s, best of {args.runs} runs')
+    for name, func in (('lockstep', lockstep), ('pipelined', pipelined)):
+        best = float('inf')
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        print(f'{name:>10}: {args.size / best:8.1f} MB/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+"""
+Audit the legacy filesystem against the checksums expected by the NG system.
+
+The expected checksums of the source package and (confirmed) preview of each
+NG submission are exported from the classic database in bulk, using
+``expected_checksums.sql``:
+
+    mysql -B arXiv < expected_checksums.sql > expected.tsv
+
+Each shard directory is then audited in a pool of worker processes, rather
+than asking the filesystem service about one submission at a time. The
+checksum recorded in a file's sidecar is used while the file is unchanged (as
+for ``HEAD`` requests to the service); pass ``--verify`` to read every file
+instead.
+
+The audit is throttled so that it can run alongside normal traffic:
+``--max-rate`` limits the number of bytes per second read by all of the
+workers together. Each file or directory that is looked at counts as one
+block (:const:`BLOCK_SIZE`) against the limit, so that it also bounds
+metadata I/O when checksums are taken from sidecars.
+
+A report of discrepancies is written as tab-separated values, with the
+columns of :class:`Discrepancy`.
+
+Usage: python -m filesystem.audit EXPECTED [--processes N] [--max-rate BYTES]
+    [--verify] [--output PATH]
+
+The location of the filesystem is taken from ``LEGACY_FILESYSTEM_ROOT``, as
+for the application.
+"""
+
+import csv
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from base64 import urlsafe_b64encode
+from collections import defaultdict
+from hashlib import md5
+from multiprocessing import Pool
+from typing import Dict, IO, Iterator, List, NamedTuple, Optional, Set, \
+    Tuple
+
+from arxiv.base import logging
+
+from . import store
+from .factory import create_app
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 4096
+"""Bytes counted against the rate limit for each file or directory visited."""
+
+MISSING = 'missing'
+"""The file is not on the filesystem."""
+
+MISMATCH = 'mismatch'
+"""The file does not have the expected checksum."""
+
+NOT_UNPACKED = 'not unpacked'
+"""The source package is present, but the source directory is not."""
+
+Expected = Dict[int, Tuple[Optional[str], Optional[str]]]
+"""Expected source and preview checksums, by submission ID."""
+
+
+class Discrepancy(NamedTuple):
+    """A difference between the legacy filesystem and the NG system."""
+
+    submission_id: int
+    kind: str
+    """``source`` or ``preview``."""
+    problem: str
+    """:const:`MISSING`, :const:`MISMATCH`, or :const:`NOT_UNPACKED`."""
+    expected: str
+    found: str
+
+
+class Throttle:
+    """Limits the rate of I/O, by sleeping as needed."""
+
+    def __init__(self, rate: float) -> None:
+        """Allow ``rate`` bytes per second; ``0`` for no limit."""
+        self.rate = rate
+        self._until = time.monotonic()
+
+    def __call__(self, size: int) -> None:
+        """Account for ``size`` bytes of I/O."""
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self._until = max(self._until, now) + size / self.rate
+        if self._until > now:
+            time.sleep(self._until - now)
+
+
+def load_expected(stream: IO[str]) -> Dict[str, Expected]:
+    """
+    Load expected checksums, as exported by ``expected_checksums.sql``.
+
+    Returns
+    -------
+    dict
+        Expected checksums (see :const:`Expected`) by shard.
+
+    """
+    expected: Dict[str, Expected] = defaultdict(dict)
+    for row in csv.DictReader(stream, delimiter='\t'):
+        submission_id = int(row['submission_id'])
+        expected[str(submission_id)[:4]][submission_id] = (
+            _checksum_or_none(row['source_checksum']),
+            _checksum_or_none(row['preview_checksum'])
+        )
+    return dict(expected)
+
+
+def audit(root: str, source_prefix: str, expected: Dict[str, Expected],
+          processes: int = 4, max_rate: float = 0., verify: bool = False,
+          chunk_size: int = store.CHUNK_SIZE) -> Iterator[Discrepancy]:
+    """
+    Audit the shard directories under ``root`` in parallel.
+
+    Parameters
+    ----------
+    root : str
+        ``LEGACY_FILESYSTEM_ROOT``.
+    source_prefix : str
+        ``LEGACY_FILESYSTEM_SOURCE_PREFIX``.
+    expected : dict
+        Expected checksums by shard; see :func:`load_expected`.
+    processes : int
+        Number of worker processes.
+    max_rate : float
+        Bytes per second that may be read by all workers together; ``0`` for
+        no limit.
+    verify : bool
+        If ``True``, read every file rather than use checksum sidecars.
+    chunk_size : int
+        Number of bytes read from a file at a time.
+
+    Returns
+    -------
+    iterator
+        Yields a :class:`Discrepancy` for each problem found, shard by shard
+        (in the order in which the shards are finished).
+
+    """
+    tasks = [(root, source_prefix, shard, submissions,
+              max_rate / processes, verify, chunk_size)
+             for shard, submissions in sorted(expected.items())]
+    with Pool(processes) as pool:
+        for discrepancies in pool.imap_unordered(_audit_shard, tasks):
+            yield from discrepancies
+
+
+def audit_shard(root: str, source_prefix: str, shard: str,
+                expected: Expected, throttle: Throttle, verify: bool = False,
+                chunk_size: int = store.CHUNK_SIZE) -> List[Discrepancy]:
+    """Audit the submissions in one shard directory."""
+    shard_path = os.path.join(root, shard)
+    present = _list(shard_path, throttle)
+    discrepancies: List[Discrepancy] = []
+    for submission_id, (source, preview) in sorted(expected.items()):
+        submission_path = os.path.join(shard_path, str(submission_id))
+        names = _list(submission_path, throttle) \
+            if str(submission_id) in present else set()
+        if source is not None:
+            discrepancies.extend(_audit_file(
+                submission_id, 'source', submission_path,
+                f'{submission_id}.tar.gz', names, source, throttle, verify,
+                chunk_size
+            ))
+            if f'{submission_id}.tar.gz' in names \
+                    and source_prefix not in names:
+                discrepancies.append(Discrepancy(submission_id, 'source',
+                                                 NOT_UNPACKED, source, ''))
+        if preview is not None:
+            discrepancies.extend(_audit_file(
+                submission_id, 'preview', submission_path,
+                f'{submission_id}.pdf', names, preview, throttle, verify,
+                chunk_size
+            ))
+    return discrepancies
+
+
+def _audit_shard(task: tuple) -> List[Discrepancy]:
+    """Audit a shard in a worker process; see :func:`audit`."""
+    root, source_prefix, shard, expected, rate, verify, chunk_size = task
+    start = time.perf_counter()
+    discrepancies = audit_shard(root, source_prefix, shard, expected,
+                                Throttle(rate), verify, chunk_size)
+    logger.info('Audited %i submissions in shard %s in %.3f s; %i'
+                ' discrepancies', len(expected), shard,
+                time.perf_counter() - start, len(discrepancies))
+    return discrepancies
+
+
+def _audit_file(submission_id: int, kind: str, submission_path: str,
+                fname: str, names: Set[str], expected: str,
+                throttle: Throttle, verify: bool,
+                chunk_size: int) -> List[Discrepancy]:
+    if fname not in names:
+        return [Discrepancy(submission_id, kind, MISSING, expected, '')]
+    path = os.path.join(submission_path, fname)
+    throttle(BLOCK_SIZE)
+    checksum = None if verify else store._load_checksum(path)
+    if checksum is None:
+        try:
+            checksum = _read_checksum(path, throttle, chunk_size)
+        except FileNotFoundError:
+            return [Discrepancy(submission_id, kind, MISSING, expected, '')]
+    if checksum != expected:
+        return [Discrepancy(submission_id, kind, MISMATCH, expected,
+                            checksum)]
+    return []
+
+
+def _read_checksum(path: str, throttle: Throttle, chunk_size: int) -> str:
+    hash_md5 = md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            throttle(len(chunk))
+            hash_md5.update(chunk)
+    return urlsafe_b64encode(hash_md5.digest()).decode('utf-8')
+
+
+def _list(path: str, throttle: Throttle) -> Set[str]:
+    throttle(BLOCK_SIZE)
+    try:
+        return set(os.listdir(path))
+    except FileNotFoundError:
+        return set()
+
+
+def _checksum_or_none(value: Optional[str]) -> Optional[str]:
+    if not value or value == 'NULL':
+        return None
+    return value
+
+
+def main() -> None:
+    """Audit the legacy filesystem, and report any discrepancies."""
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('expected',
+                        help='Expected checksums, from expected_checksums.sql')
+    parser.add_argument('--processes', type=int, default=4,
+                        help='Number of worker processes')
+    parser.add_argument('--max-rate', type=float, default=20 * 1024 * 1024,
+                        help='Bytes per second to read; 0 for no limit')
+    parser.add_argument('--verify', action='store_true',
+                        help='Read every file, rather than use sidecars')
+    parser.add_argument('--output', default='-',
+                        help='Where to write the report (default: stdout)')
+    args = parser.parse_args()
+
+    app = create_app()
+    root = app.config['LEGACY_FILESYSTEM_ROOT']
+    source_prefix = app.config['LEGACY_FILESYSTEM_SOURCE_PREFIX']
+    with open(args.expected) as f:
+        expected = load_expected(f)
+
+    start = time.perf_counter()
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        writer = csv.writer(out, delimiter='\t', lineterminator='\n')
+        writer.writerow(Discrepancy._fields)
+        count = 0
+        for discrepancy in audit(root, source_prefix, expected,
+                                 args.processes, args.max_rate, args.verify):
+            writer.writerow(discrepancy)
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    total = sum(len(submissions) for submissions in expected.values())
+    print(f'Audited {total} submissions in {len(expected)} shards in'
+          f' {time.perf_counter() - start:.1f} s; found {count}'
+          ' discrepancies', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -18,4 +18,10 @@ LEGACY_FILESYSTEM_SOURCE_GID = \
     int(os.environ.get('LEGACY_FILESYSTEM_SOURCE_GID', os.getegid()))
 LEGACY_FILESYSTEM_SOURCE_PREFIX = 'src'
 
-MAX_PAYLOAD_SIZE_BYTES = 20 * 1_028
\ No newline at end of file
+LEGACY_FILESYSTEM_OBJECTS_ENABLED = \
+    bool(int(os.environ.get('LEGACY_FILESYSTEM_OBJECTS_ENABLED', '0')))
+"""Whether to deduplicate deposits via a content-addressed object area."""
+
+MAX_PAYLOAD_SIZE_BYTES = \
+    int(os.environ.get('MAX_PAYLOAD_SIZE_BYTES', 1024 * 1024 * 1024))
+"""Largest request body that will be accepted, in bytes."""
\ No newline at end of file
@@ -3,10 +3,11 @@
 from typing import Dict, Any, Tuple, Optional, IO
 from http import HTTPStatus
 
-from werkzeug.exceptions import NotFound, BadRequest, InternalServerError
+from werkzeug.exceptions import NotFound, BadRequest, InternalServerError, \
+    Conflict, PreconditionFailed, UnprocessableEntity
 from werkzeug.datastructures import FileStorage
 
-from . import store
+from . import store, unpack, uploads
 
 Response = Tuple[Dict[str, Any], HTTPStatus, Dict[str, str]]
 
@@ -18,7 +19,9 @@ def service_status() -> Response:
     return {}, HTTPStatus.OK, {}
 
 
-def deposit_source(submission_id: int, content: IO[bytes]) -> Response:
+def deposit_source(submission_id: int, content: Optional[IO[bytes]],
+                   checksum: Optional[str] = None,
+                   version: Optional[int] = None) -> Response:
     """
     Deposit the source package for a submission.
 
@@ -28,6 +31,14 @@ def deposit_source(submission_id: int, content: IO[bytes]) -> Response:
         Numeric submission identifier.
     content : IO
         A streaming bytes IO from the request body.
+    checksum : str or None
+        If provided, deposit existing content with this checksum (from the
+        object area) instead of ``content``. If there is no such content,
+        :class:`.PreconditionFailed` is raised.
+    version : int or None
+        If provided, a deposit with an older version than one that has
+        already started is refused with :class:`.Conflict`; see
+        :func:`.store.store_source`.
 
     Returns
     -------
@@ -39,26 +50,38 @@ def deposit_source(submission_id: int, content: IO[bytes]) -> Response:
         Headers to add to the response.
 
     """
+    if checksum is not None:
+        return _link_source(submission_id, checksum, version)
+    if content is None:
+        raise BadRequest('No content')
     try:
-        store.store_source(submission_id, content)
+        checksum = store.store_source(submission_id, content,
+                                      version=version)
+    except store.Superseded as e:
+        raise Conflict(f'Deposit superseded: {e}') from e
+    except unpack.UnsafeArchive as e:
+        raise UnprocessableEntity(f'Unsafe source package: {e}') from e
     except RuntimeError as e:
         raise InternalServerError(f'Could not store source: {e}') from e
-    headers = {'ETag': store.get_source_checksum(submission_id)}
+    headers = {'ETag': checksum}
     return {}, HTTPStatus.CREATED, headers
 
 
-def check_source_exists(submission_id: int) -> Response:
+def check_source_exists(submission_id: int, verify: bool = False) \
+        -> Response:
     """
     Determine whether or not the source package for a submission exists.
 
     Response includes the source package checksum in the ``ETag`` header, for
-    verification.
+    verification. The checksum recorded at deposit time is used unless
+    ``verify`` is ``True``.
 
     Parameters
     ----------
     submission_id : int
         Numeric submission identifier.
-    content : :class:`FileStorage` or None.
+    verify : bool
+        If ``True``, recompute the checksum from the file on disk.
 
     Returns
     -------
@@ -72,11 +95,13 @@ def check_source_exists(submission_id: int) -> Response:
     """
     if not store.does_source_exist(submission_id):
         raise NotFound(f'No source for submission: {submission_id}')
-    headers = {'ETag': store.get_source_checksum(submission_id)}
+    headers = {'ETag': store.get_source_checksum(submission_id, verify)}
     return {}, HTTPStatus.OK, headers
 
 
-def deposit_preview(submission_id: int, content: IO[bytes]) -> Response:
+def deposit_preview(submission_id: int, content: Optional[IO[bytes]],
+                    checksum: Optional[str] = None,
+                    version: Optional[int] = None) -> Response:
     """
     Deposit the PDF preview for a submission.
 
@@ -86,6 +111,14 @@ def deposit_preview(submission_id: int, content: IO[bytes]) -> Response:
         Numeric submission identifier.
     content : IO
         A streaming bytes IO from the request body.
+    checksum : str or None
+        If provided, deposit existing content with this checksum (from the
+        object area) instead of ``content``. If there is no such content,
+        :class:`.PreconditionFailed` is raised.
+    version : int or None
+        If provided, a deposit with an older version than one that has
+        already started is refused with :class:`.Conflict`; see
+        :func:`.store.store_preview`.
 
     Returns
     -------
@@ -97,26 +130,36 @@ def deposit_preview(submission_id: int, content: IO[bytes]) -> Response:
         Headers to add to the response.
 
     """
+    if checksum is not None:
+        return _link_preview(submission_id, checksum, version)
+    if content is None:
+        raise BadRequest('No content')
     try:
-        store.store_preview(submission_id, content)
+        checksum = store.store_preview(submission_id, content,
+                                       version=version)
+    except store.Superseded as e:
+        raise Conflict(f'Deposit superseded: {e}') from e
     except RuntimeError as e:
         raise InternalServerError(f'Could not store preview: {e}') from e
-    headers = {'ETag': store.get_preview_checksum(submission_id)}
+    headers = {'ETag': checksum}
     return {}, HTTPStatus.CREATED, headers
 
 
-def check_preview_exists(submission_id: int) -> Response:
+def check_preview_exists(submission_id: int, verify: bool = False) \
+        -> Response:
     """
     Determine whether or not the PDF preview for a submission exists.
 
     Response includes the PDF checksum in the ``ETag`` header, for
-    verification.
+    verification. The checksum recorded at deposit time is used unless
+    ``verify`` is ``True``.
 
     Parameters
     ----------
     submission_id : int
         Numeric submission identifier.
-    content : :class:`FileStorage` or None.
+    verify : bool
+        If ``True``, recompute the checksum from the file on disk.
 
     Returns
     -------
@@ -130,5 +173,190 @@ def check_preview_exists(submission_id: int) -> Response:
     """
     if not store.does_preview_exist(submission_id):
         raise NotFound(f'No preview for submission: {submission_id}')
-    headers = {'ETag': store.get_preview_checksum(submission_id)}
+    headers = {'ETag': store.get_preview_checksum(submission_id, verify)}
     return {}, HTTPStatus.OK, headers
+
+
+def _link_source(submission_id: int, checksum: str,
+                 version: Optional[int]) -> Response:
+    try:
+        found = store.link_source(submission_id, checksum, version=version)
+    except store.Superseded as e:
+        raise Conflict(f'Deposit superseded: {e}') from e
+    except unpack.UnsafeArchive as e:
+        raise UnprocessableEntity(f'Unsafe source package: {e}') from e
+    except RuntimeError as e:
+        raise InternalServerError(f'Could not store source: {e}') from e
+    if not found:
+        raise PreconditionFailed(f'No source with checksum {checksum}')
+    return {}, HTTPStatus.CREATED, {'ETag': checksum}
+
+
+def _link_preview(submission_id: int, checksum: str,
+                  version: Optional[int]) -> Response:
+    try:
+        found = store.link_preview(submission_id, checksum, version=version)
+    except store.Superseded as e:
+        raise Conflict(f'Deposit superseded: {e}') from e
+    except RuntimeError as e:
+        raise InternalServerError(f'Could not store preview: {e}') from e
+    if not found:
+        raise PreconditionFailed(f'No preview with checksum {checksum}')
+    return {}, HTTPStatus.CREATED, {'ETag': checksum}
+
+
+def start_upload(submission_id: int, kind: str, checksum: str) -> Response:
+    """
+    Start or resume a chunked upload of content with ``checksum``.
+
+    Parameters
+    ----------
+    submission_id : int
+        Numeric submission identifier.
+    kind : str
+        ``source`` or ``preview``.
+    checksum : str
+        URL-safe base64-encoded MD5 checksum of the complete content.
+
+    Returns
+    -------
+    dict
+        Data for the response body, with the ranges of bytes that have already
+        been received (start inclusive, end exclusive), and the chunks that
+        were acknowledged, with their checksums.
+    int
+        HTTP response status code: 201 if the upload is new, 200 if it was
+        already in progress.
+    dict
+        Headers to add to the response.
+
+    """
+    try:
+        received, created = uploads.start(submission_id, kind, checksum)
+        chunks = uploads.get_chunks(submission_id, kind, checksum)
+    except store.SecurityError as e:
+        raise BadRequest(f'Invalid upload: {e}') from e
+    except uploads.NoSuchUpload as e:     # Committed in the meantime.
+        raise NotFound(f'No such upload: {e}') from e
+    code = HTTPStatus.CREATED if created else HTTPStatus.OK
+    return {'received': received, 'chunks': chunks}, code, {}
+
+
+def get_upload(submission_id: int, kind: str, checksum: str) -> Response:
+    """
+    Get the ranges of bytes and chunks received for a chunked upload.
+
+    Returns
+    -------
+    dict
+        Data for the response body.
+    int
+        HTTP response status code.
+    dict
+        Headers to add to the response.
+
+    """
+    try:
+        received = uploads.get_received(submission_id, kind, checksum)
+        chunks = uploads.get_chunks(submission_id, kind, checksum)
+    except store.SecurityError as e:
+        raise BadRequest(f'Invalid upload: {e}') from e
+    except uploads.NoSuchUpload as e:
+        raise NotFound(f'No such upload: {e}') from e
+    return {'received': received, 'chunks': chunks}, HTTPStatus.OK, {}
+
+
+def upload_chunk(submission_id: int, kind: str, checksum: str,
+                 content: IO[bytes], offset: int, length: int,
+                 chunk_checksum: Optional[str]) -> Response:
+    """
+    Write a chunk of a chunked upload.
+
+    Parameters
+    ----------
+    submission_id : int
+        Numeric submission identifier.
+    kind : str
+        ``source`` or ``preview``.
+    checksum : str
+        URL-safe base64-encoded MD5 checksum of the complete content.
+    content : IO
+        A streaming bytes IO from the request body.
+    offset : int
+        Position of the chunk in the complete content.
+    length : int
+        Number of bytes in the chunk.
+    chunk_checksum : str
+        Base64-encoded MD5 checksum of the chunk, from ``Content-MD5``.
+
+    Returns
+    -------
+    dict
+        Data for the response body, with the ranges of bytes that have been
+        received.
+    int
+        HTTP response status code.
+    dict
+        Headers to add to the response.
+
+    """
+    if chunk_checksum is None:
+        raise BadRequest('Content-MD5 is required')
+    try:
+        received = uploads.write_chunk(submission_id, kind, checksum, content,
+                                       offset, length, chunk_checksum)
+    except store.SecurityError as e:
+        raise BadRequest(f'Invalid upload: {e}') from e
+    except uploads.NoSuchUpload as e:
+        raise NotFound(f'No such upload: {e}') from e
+    except uploads.BadChunk as e:
+        raise BadRequest(f'Chunk not accepted: {e}') from e
+    return {'received': received}, HTTPStatus.OK, {}
+
+
+def commit_upload(submission_id: int, kind: str, checksum: str,
+                  size: int, version: Optional[int] = None) -> Response:
+    """
+    Deposit the content of a chunked upload.
+
+    Parameters
+    ----------
+    submission_id : int
+        Numeric submission identifier.
+    kind : str
+        ``source`` or ``preview``.
+    checksum : str
+        URL-safe base64-encoded MD5 checksum of the complete content.
+    size : int
+        Size of the complete content, in bytes.
+    version : int or None
+        See :func:`deposit_source`.
+
+    Returns
+    -------
+    dict
+        Data for the response body.
+    int
+        HTTP response status code.
+    dict
+        Headers to add to the response.
+
+    """
+    try:
+        checksum = uploads.commit(submission_id, kind, checksum, size,
+                                  version=version)
+    except store.SecurityError as e:
+        raise BadRequest(f'Invalid upload: {e}') from e
+    except uploads.NoSuchUpload as e:
+        raise NotFound(f'No such upload: {e}') from e
+    except uploads.Incomplete as e:
+        raise BadRequest(f'Upload incomplete: {e}') from e
+    except store.ChecksumMismatch as e:
+        raise PreconditionFailed(f'Upload does not match: {e}') from e
+    except store.Superseded as e:
+        raise Conflict(f'Deposit superseded: {e}') from e
+    except unpack.UnsafeArchive as e:
+        raise UnprocessableEntity(f'Unsafe source package: {e}') from e
+    except RuntimeError as e:
+        raise InternalServerError(f'Could not store {kind}: {e}') from e
+    return {}, HTTPStatus.CREATED, {'ETag': checksum}
@@ -0,0 +1,17 @@
+-- Exports the checksums of the source package and the confirmed preview that
+-- the NG system expects to find on the legacy filesystem for each submission.
+-- For use with ``python -m filesystem.audit``.
+--
+-- mysql -B arXiv < expected_checksums.sql > expected.tsv
+SELECT sub.submission_id,
+       SUBSTRING_INDEX(sub.package, '@', -1) AS source_checksum,
+       (SELECT JSON_UNQUOTE(JSON_EXTRACT(ev.data, '$.preview_checksum'))
+        FROM arXiv.event ev
+        WHERE ev.submission_id = sub.submission_id
+          AND ev.event_type = 'ConfirmPreview'
+        ORDER BY ev.created DESC
+        LIMIT 1) AS preview_checksum
+FROM arXiv.arXiv_submissions sub
+WHERE sub.package LIKE 'fm://%@%'
+  AND sub.status NOT IN (10, 20, 22, 25, 29, 30)
+ORDER BY sub.submission_id;
@@ -2,7 +2,8 @@
 
 from flask import Flask, jsonify, Response
 from werkzeug.exceptions import HTTPException, Forbidden, Unauthorized, \
-    BadRequest, MethodNotAllowed, InternalServerError, NotFound
+    BadRequest, MethodNotAllowed, InternalServerError, NotFound, \
+    RequestEntityTooLarge, Conflict, PreconditionFailed, UnprocessableEntity
 
 from .routes import api
 
@@ -24,6 +25,10 @@ def register_error_handlers(app: Flask) -> None:
     app.errorhandler(InternalServerError)(jsonify_exception)
     app.errorhandler(NotFound)(jsonify_exception)
     app.errorhandler(MethodNotAllowed)(jsonify_exception)
+    app.errorhandler(RequestEntityTooLarge)(jsonify_exception)
+    app.errorhandler(Conflict)(jsonify_exception)
+    app.errorhandler(PreconditionFailed)(jsonify_exception)
+    app.errorhandler(UnprocessableEntity)(jsonify_exception)
 
 
 def jsonify_exception(error: HTTPException) -> Response:
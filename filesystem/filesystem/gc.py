@@ -0,0 +1,115 @@
+"""
+Garbage collection for the content-addressed object area.
+
+An object is orphaned when no submission links to it any more, i.e. when the
+object area holds the only link to the file. Orphaned objects are removed once
+they have been orphaned for at least ``--min-age`` seconds (judged by the
+inode change time, which is updated whenever a link to the file is added or
+removed), so that deposits in progress are not affected. Temporary
+directories left behind by interrupted deposits, and chunked uploads that
+have not been touched, are removed after the same period.
+
+Usage: python -m filesystem.gc [--min-age SECONDS] [--dry-run]
+
+The location of the filesystem is taken from ``LEGACY_FILESYSTEM_ROOT``, as
+for the application.
+"""
+
+import os
+import shutil
+import time
+from argparse import ArgumentParser
+from typing import Tuple
+
+from arxiv.base import logging
+
+from . import store, uploads
+from .factory import create_app
+
+logger = logging.getLogger(__name__)
+
+
+def collect_objects(objects_path: str, min_age: float,
+                    dry_run: bool = False) -> Tuple[int, int]:
+    """
+    Remove orphaned objects.
+
+    Returns
+    -------
+    int
+        Number of objects removed.
+    int
+        Total size of the objects removed, in bytes.
+
+    """
+    removed, size = 0, 0
+    threshold = time.time() - min_age
+    for directory, _, fnames in os.walk(objects_path):
+        for fname in fnames:
+            path = os.path.join(directory, fname)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if stat.st_nlink > 1 or stat.st_ctime > threshold:
+                continue
+            logger.debug('Removing orphaned object %s', path)
+            if not dry_run:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+            removed += 1
+            size += stat.st_size
+    return removed, size
+
+
+def collect_deposits(deposits_path: str, min_age: float,
+                     dry_run: bool = False) -> int:
+    """
+    Remove temporary directories left behind by interrupted deposits.
+
+    This works for the directories of chunked uploads, too; each upload's
+    directory is modified whenever a chunk is received.
+    """
+    removed = 0
+    threshold = time.time() - min_age
+    for directory, subdirectories, _ in os.walk(deposits_path):
+        for subdirectory in list(subdirectories):
+            path = os.path.join(directory, subdirectory)
+            if directory == deposits_path:     # Shard directories.
+                continue
+            subdirectories.remove(subdirectory)
+            if os.stat(path).st_mtime > threshold:
+                continue
+            logger.debug('Removing abandoned deposit %s', path)
+            if not dry_run:
+                shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def main() -> None:
+    """Collect garbage in the legacy filesystem."""
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--min-age', type=float, default=24 * 60 * 60,
+                        help='Seconds that an object must have been orphaned')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Report what would be removed, but keep it')
+    args = parser.parse_args()
+
+    app = create_app()
+    root = app.config['LEGACY_FILESYSTEM_ROOT']
+    objects, size = collect_objects(os.path.join(root, store.OBJECTS_DIR),
+                                    args.min_age, args.dry_run)
+    deposits = collect_deposits(os.path.join(root, store.DEPOSITS_DIR),
+                                args.min_age, args.dry_run)
+    deposits += collect_deposits(os.path.join(root, uploads.UPLOADS_DIR),
+                                 args.min_age, args.dry_run)
+    print(f'{"Would remove" if args.dry_run else "Removed"} {objects}'
+          f' orphaned objects ({size} bytes) and {deposits} abandoned'
+          ' deposits and uploads')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,11 @@
 """Request routing."""
 
-import io
-from typing import IO
+from typing import IO, Optional
 
 from flask import Blueprint, Response, request, jsonify, make_response, \
     current_app
 from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from werkzeug.http import parse_content_range_header
 
 from . import controllers
 
@@ -22,52 +22,195 @@ def service_status() -> Response:
 
 @api.route('/<int:submission_id>/source', methods=['POST'])
 def deposit_source(submission_id: int) -> Response:
-    """Deposit a source package for a submission."""
-    stream = request.stream
-    data, code, head = controllers.deposit_source(submission_id, get_body())
+    """
+    Deposit a source package for a submission.
+
+    Pass ``?checksum=...`` (and no body) to deposit content that the
+    filesystem already has; 412 Precondition Failed means that it does not.
+    Pass ``?version=...`` (an integer, e.g. the time of the event that the
+    content belongs to) to have a deposit with an older version than one
+    that has already started refused with 409 Conflict.
+    """
+    checksum = request.args.get('checksum')
+    content = get_body() if checksum is None else None
+    data, code, head = controllers.deposit_source(submission_id, content,
+                                                  checksum, _version())
     response: Response = make_response(jsonify(data), code, head)
     return response
 
 
 @api.route('/<int:submission_id>/source', methods=['HEAD'])
 def check_source_exists(submission_id: int) -> Response:
-    """Determine whether a source package for a submission is present."""
-    data, code, head = controllers.check_source_exists(submission_id)
+    """
+    Determine whether a source package for a submission is present.
+
+    Pass ``?verify=true`` to recompute the checksum in the ``ETag`` header
+    from the package itself.
+    """
+    data, code, head = controllers.check_source_exists(submission_id,
+                                                       _verify())
     response: Response = make_response(jsonify(data), code, head)
     return response
 
 
 @api.route('/<int:submission_id>/preview', methods=['POST'])
 def deposit_preview(submission_id: int) -> Response:
-    """Deposit a preview PDF for a submission."""
-    stream = request.stream
-    data, code, head = controllers.deposit_preview(submission_id, get_body())
+    """
+    Deposit a preview PDF for a submission.
+
+    Pass ``?checksum=...`` (and no body) to deposit content that the
+    filesystem already has; 412 Precondition Failed means that it does not.
+    See :func:`deposit_source` for ``?version=...``.
+    """
+    checksum = request.args.get('checksum')
+    content = get_body() if checksum is None else None
+    data, code, head = controllers.deposit_preview(submission_id, content,
+                                                   checksum, _version())
     response: Response = make_response(jsonify(data), code, head)
     return response
 
 
 @api.route('/<int:submission_id>/preview', methods=['HEAD'])
 def check_preview_exists(submission_id: int) -> Response:
-    """Determine whether a preview PDF for a submission is present."""
-    data, code, head = controllers.check_preview_exists(submission_id)
+    """
+    Determine whether a preview PDF for a submission is present.
+
+    Pass ``?verify=true`` to recompute the checksum in the ``ETag`` header
+    from the PDF itself.
+    """
+    data, code, head = controllers.check_preview_exists(submission_id,
+                                                        _verify())
     response: Response = make_response(jsonify(data), code, head)
     return response
 
 
+UPLOAD = '/<int:submission_id>/<any(source, preview):kind>/uploads/<checksum>'
+
+
+@api.route(UPLOAD, methods=['POST'])
+def start_upload(submission_id: int, kind: str, checksum: str) -> Response:
+    """
+    Start (or resume) a chunked upload of content with ``checksum``.
+
+    The response lists the ranges of bytes that have already been received,
+    and the chunks that were acknowledged, with their checksums.
+    """
+    data, code, head = controllers.start_upload(submission_id, kind,
+                                                checksum)
+    response: Response = make_response(jsonify(data), code, head)
+    return response
+
+
+@api.route(UPLOAD, methods=['GET'])
+def get_upload(submission_id: int, kind: str, checksum: str) -> Response:
+    """Get the ranges of bytes and chunks received for an upload."""
+    data, code, head = controllers.get_upload(submission_id, kind, checksum)
+    response: Response = make_response(jsonify(data), code, head)
+    return response
+
+
+@api.route(UPLOAD, methods=['PUT'])
+def upload_chunk(submission_id: int, kind: str, checksum: str) -> Response:
+    """
+    Send a chunk of an upload.
+
+    The position of the chunk is given by the ``Content-Range`` header (e.g.
+    ``bytes 0-1048575/*``), and its checksum by the ``Content-MD5`` header.
+    """
+    content_range = parse_content_range_header(
+        request.headers.get('Content-Range')
+    )
+    if content_range is None or content_range.units != 'bytes':
+        raise BadRequest('Content-Range is required')
+    data, code, head = controllers.upload_chunk(
+        submission_id, kind, checksum, get_body(), content_range.start,
+        content_range.stop - content_range.start,
+        request.headers.get('Content-MD5')
+    )
+    response: Response = make_response(jsonify(data), code, head)
+    return response
+
+
+@api.route(f'{UPLOAD}/commit', methods=['POST'])
+def commit_upload(submission_id: int, kind: str, checksum: str) -> Response:
+    """
+    Deposit the content of an upload, once all of its chunks have been sent.
+
+    The size of the content (in bytes) must be passed as ``?size=...``. If
+    the content does not match ``checksum``, the response is 412 Precondition
+    Failed, and the upload is kept so that chunks can be sent again. See
+    :func:`deposit_source` for ``?version=...``.
+    """
+    size = request.args.get('size', type=int)
+    if size is None or size < 0:
+        raise BadRequest('Size is required')
+    data, code, head = controllers.commit_upload(submission_id, kind,
+                                                 checksum, size, _version())
+    response: Response = make_response(jsonify(data), code, head)
+    return response
+
+
+def _version() -> Optional[int]:
+    """Get the version of a deposit, if the client provided one."""
+    version = request.args.get('version')
+    if version is None:
+        return None
+    try:
+        return int(version)
+    except ValueError as e:
+        raise BadRequest(f'Invalid version: {version}') from e
+
+
+def _verify() -> bool:
+    """Determine whether the client asked us to recompute checksums."""
+    return request.args.get('verify', 'false').lower() in ('1', 'true')
+
+
 def get_body() -> IO[bytes]:
-    """Get a ``BytesIO``-like object wrapping the request body."""
-    stream: IO[bytes]
-    if request.headers.get('Content-type') is not None:
-        length = int(request.headers.get('Content-length', 0))
-        if length == 0:
-            raise BadRequest('Body empty or content-length not set')
-        max_length = int(current_app.config['MAX_PAYLOAD_SIZE_BYTES'])
-        if length > max_length:
-            raise RequestEntityTooLarge(f'Body exceeds size of {max_length}')
-        stream = io.BytesIO(request.data)
-    else:
-        # DANGER! request.stream will ONLY be available if (a) the content-type
-        # header is not passed and (b) we have not accessed the body via any
-        # other means, e.g. ``.data``, ``.json``, etc.
-        stream = request.stream   # type: ignore
-    return stream
\ No newline at end of file
+    """
+    Get a readable stream of the request body.
+
+    The body is never read into memory all at once. If the client tells us
+    how long the body is, a body that is too long is refused outright;
+    otherwise, :class:`.RequestEntityTooLarge` is raised as soon as more than
+    ``MAX_PAYLOAD_SIZE_BYTES`` have been read.
+    """
+    max_length = int(current_app.config['MAX_PAYLOAD_SIZE_BYTES'])
+    length = request.headers.get('Content-length')
+    if length is not None and int(length) > max_length:
+        raise RequestEntityTooLarge(f'Body exceeds size of {max_length}')
+    if request.headers.get('Content-type') is not None and not length:
+        raise BadRequest('Body empty or content-length not set')
+    # request.stream is available so long as we have not accessed the body
+    # via any other means, e.g. ``.data``, ``.json``, ``.form``, etc.
+    return LimitedReader(request.stream, max_length)   # type: ignore
+
+
+class LimitedReader:
+    """Reads from a stream, up to a maximum number of bytes."""
+
+    def __init__(self, stream: IO[bytes], limit: int) -> None:
+        """Read at most ``limit`` bytes from ``stream``."""
+        self._stream = stream
+        self._remaining = limit
+        self.limit = limit
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Read up to ``size`` bytes (or the rest of the stream, if negative).
+
+        Raises
+        ------
+        :class:`.RequestEntityTooLarge`
+            If the stream goes on for more than ``limit`` bytes.
+
+        """
+        if size is None or size < 0:
+            return b''.join(iter(lambda: self.read(64 * 1024), b''))
+        # Ask for one byte more than we're allowed, so that we can tell
+        # whether the stream is too long.
+        chunk = self._stream.read(min(size, self._remaining + 1))
+        if len(chunk) > self._remaining:
+            raise RequestEntityTooLarge(f'Body exceeds size of {self.limit}')
+        self._remaining -= len(chunk)
+        return chunk
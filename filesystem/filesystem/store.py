@@ -29,18 +29,71 @@ set:
 - ``LEGACY_FILESYSTEM_SOURCE_GID``: gid for owner group (must exist)
 - ``LEGACY_FILESYSTEM_SOURCE_PREFIX``
 
+The MD5 checksum of each source package and preview is recorded when it is
+deposited, in a hidden sidecar file alongside it (e.g. ``.65393829.pdf.md5``).
+The sidecar also records the size and modification time of the file, so that
+a checksum is only reused while the file is unchanged; otherwise, the file is
+read again and the sidecar is updated. Pass ``verify=True`` to
+:func:`get_source_checksum` or :func:`get_preview_checksum` to ignore the
+sidecar and recompute the checksum from the file itself.
+
+Deposits are written to a temporary directory and then swapped into place, so
+readers never see a partially written package or preview. A client may pass a
+``version`` with each deposit (e.g. the time of the event that it is copying
+content for); a deposit with an older version than one that has already
+started for the same submission is refused, and a deposit in progress is
+abandoned if a deposit with the same or a newer version starts (see
+:class:`Superseded`). Deposits without a version are ordered by when they
+start.
+
+If ``LEGACY_FILESYSTEM_OBJECTS_ENABLED`` is set, source packages and previews
+are also kept in a content-addressed object area, keyed by checksum (see
+:const:`OBJECTS_DIR`). Deposits are hard-linked to the object with the same
+content, so identical packages and previews are stored only once, and a
+client that knows the checksum of an existing object can deposit it without
+sending the content at all (see :func:`link_source` and
+:func:`link_preview`). Objects that are no longer linked from any submission
+are removed by :mod:`filesystem.gc`.
+
 """
+import fcntl
 import os
+import re
 import tarfile
+import tempfile
+import threading
 import shutil
-from typing import IO
-from subprocess import Popen
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, Callable, IO, Iterator, Optional, Tuple
 from hashlib import md5
 from base64 import urlsafe_b64encode
 
 from flask import current_app
 from werkzeug.datastructures import FileStorage
 
+from arxiv.base import logging
+
+from . import unpack
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+"""Number of bytes read from a request body or file at a time."""
+
+SUPERSEDED_CHECK_INTERVAL = 1.
+"""Seconds between checks for a newer deposit, while content is read."""
+
+DEPOSITS_DIR = '.deposits'
+"""Directory (in ``LEGACY_FILESYSTEM_ROOT``) for deposits in progress."""
+
+OBJECTS_DIR = '.objects'
+"""Directory (in ``LEGACY_FILESYSTEM_ROOT``) for the content-addressed area."""
+
+CHECKSUM = re.compile(r'^[A-Za-z0-9_-]{22}==$')
+"""URL-safe base64-encoded MD5 digest."""
+
 
 class ConfigurationError(RuntimeError):
     """A required parameter is invalid/missing from the application config."""
@@ -50,6 +103,19 @@ class SecurityError(RuntimeError):
     """Something suspicious happened."""
 
 
+class Superseded(RuntimeError):
+    """A newer deposit of the same kind has started for the submission."""
+
+    def __init__(self, msg: str, latest: Optional[int] = None) -> None:
+        """Initialize with the version of the newer deposit, if known."""
+        super(Superseded, self).__init__(msg)
+        self.latest = latest
+
+
+class ChecksumMismatch(RuntimeError):
+    """The content of a deposit does not have the expected checksum."""
+
+
 def get_source(submission_id: int) -> None:
     """Retrieve a submission source package from the filesystem."""
     raise RuntimeError("NG components MUST NOT use this module to access"
@@ -67,48 +133,178 @@ def is_available() -> bool:
 
 
 def store_source(submission_id: int, content: IO[bytes],
-                 chunk_size: int = 4096) -> str:
-    """Store a source package for a submission."""
-    # Make sure that we have a place to put the source files.
+                 chunk_size: int = CHUNK_SIZE,
+                 expected: Optional[str] = None,
+                 version: Optional[int] = None) -> str:
+    """
+    Store a source package for a submission.
+
+    The package is written and unpacked in a temporary directory, and then
+    swapped into place. If ``expected`` is provided, the package is only
+    swapped into place if its checksum matches. See the module docstring for
+    ``version``.
+
+    Returns
+    -------
+    str
+        URL-safe base64-encoded MD5 checksum of the source package, computed
+        as it is written.
+
+    Raises
+    ------
+    :class:`Superseded`
+        If a deposit of source for the submission with a newer ``version``
+        has started, or if another deposit started while this one was in
+        progress.
+    :class:`ChecksumMismatch`
+        If the checksum of the package is not ``expected``.
+
+    """
     package_path = _source_package_path(submission_id)
     source_path = _source_path(submission_id)
-    if not os.path.exists(package_path):
-        os.makedirs(os.path.split(package_path)[0])
-    if not os.path.exists(source_path):
-        os.makedirs(source_path)
-
-    with open(package_path, 'wb') as f:
-        while True:
-            chunk = content.read(chunk_size)
-            if not chunk:
-                break
-            f.write(chunk)
-
-    _unpack_tarfile(package_path, source_path)
-    _set_modes(package_path)
-    _set_modes(source_path)
-    return get_source_checksum(submission_id)
+    dir_mode, file_mode, uid, gid = _get_modes()
+    with _Deposit(submission_id, 'source', version) as deposit:
+        tmp_package_path = deposit.path(package_path)
+        tmp_source_path = deposit.path(source_path)
+        os.mkdir(tmp_source_path)
+        _chmod_recurse(tmp_source_path, dir_mode, file_mode, uid, gid)
+
+        # The package is unpacked as it is received, rather than after it has
+        # been written to disk.
+        start = time.perf_counter()
+        with open(tmp_package_path, 'wb') as f:
+            tee = unpack.TeeReader(content, f, deposit.check)
+            count = _unpack(tee, tmp_source_path, chunk_size)
+            tee.drain(chunk_size)   # Keep anything after the archive, too.
+        _check_checksum(tee.checksum, expected)
+        _set_modes(tmp_package_path)
+        _intern(tmp_package_path, tee.checksum)
+        _save_checksum(tmp_package_path, tee.checksum)
+        deposit.commit(package_path, source_path,
+                       _checksum_path(package_path))
+    elapsed = time.perf_counter() - start
+    logger.info('Stored source for %i: %i bytes, %i entries in %.3f s'
+                ' (%.3f s receiving, %.3f s unpacking)', submission_id,
+                tee.size, count, elapsed, tee.waited, elapsed - tee.waited)
+    return tee.checksum
 
 
 def store_preview(submission_id: int, content: IO[bytes],
-                  chunk_size: int = 4096) -> str:
-    """Store a preview PDF for a submission."""
+                  chunk_size: int = CHUNK_SIZE,
+                  expected: Optional[str] = None,
+                  version: Optional[int] = None) -> str:
+    """
+    Store a preview PDF for a submission.
+
+    The PDF is written to a temporary directory, and then swapped into place.
+    If ``expected`` is provided, the PDF is only swapped into place if its
+    checksum matches. See the module docstring for ``version``.
+
+    Returns
+    -------
+    str
+        URL-safe base64-encoded MD5 checksum of the preview, computed as it is
+        written.
+
+    Raises
+    ------
+    :class:`Superseded`
+        If a deposit of a preview for the submission with a newer ``version``
+        has started, or if another deposit started while this one was in
+        progress.
+    :class:`ChecksumMismatch`
+        If the checksum of the PDF is not ``expected``.
+
+    """
     preview_path = _preview_path(submission_id)
-    if not os.path.exists(preview_path):
-        os.makedirs(os.path.split(preview_path)[0])
-    with open(preview_path, 'wb') as f:
-        while True:
-            chunk = content.read(chunk_size)
-            if not chunk:
-                break
-            f.write(chunk)
-    _set_modes(preview_path)
-    return get_preview_checksum(submission_id)
+    with _Deposit(submission_id, 'preview', version) as deposit:
+        tmp_preview_path = deposit.path(preview_path)
+        checksum = _write(content, tmp_preview_path, chunk_size,
+                          deposit.check)
+        _check_checksum(checksum, expected)
+        _set_modes(tmp_preview_path)
+        _intern(tmp_preview_path, checksum)
+        _save_checksum(tmp_preview_path, checksum)
+        deposit.commit(preview_path, _checksum_path(preview_path))
+    return checksum
+
+
+def link_source(submission_id: int, checksum: str,
+                chunk_size: int = CHUNK_SIZE,
+                version: Optional[int] = None) -> bool:
+    """
+    Deposit a source package that is already in the object area.
+
+    The package is hard-linked into place, and unpacked from the object. See
+    :func:`store_source` for ``version``.
 
+    Returns
+    -------
+    bool
+        ``False`` if there is no package with ``checksum`` in the object area
+        (or it is not enabled), in which case nothing is deposited.
+
+    """
+    object_path = _find_object(checksum)
+    if object_path is None:
+        return False
+    package_path = _source_package_path(submission_id)
+    source_path = _source_path(submission_id)
+    dir_mode, file_mode, uid, gid = _get_modes()
+    with _Deposit(submission_id, 'source', version) as deposit:
+        tmp_package_path = deposit.path(package_path)
+        tmp_source_path = deposit.path(source_path)
+        try:
+            os.link(object_path, tmp_package_path)
+        except FileNotFoundError:   # Collected in the meantime.
+            return False
+        os.mkdir(tmp_source_path)
+        _chmod_recurse(tmp_source_path, dir_mode, file_mode, uid, gid)
+        with open(tmp_package_path, 'rb') as f:
+            _unpack(f, tmp_source_path, chunk_size)
+        _save_checksum(tmp_package_path, checksum)
+        deposit.commit(package_path, source_path,
+                       _checksum_path(package_path))
+    return True
+
+
+def link_preview(submission_id: int, checksum: str,
+                 version: Optional[int] = None) -> bool:
+    """
+    Deposit a preview PDF that is already in the object area.
 
-def get_source_checksum(submission_id: int) -> str:
-    """Get the checksum of the source package for a submission."""
-    return _get_checksum(_source_package_path(submission_id))
+    See :func:`store_preview` for ``version``.
+
+    Returns
+    -------
+    bool
+        ``False`` if there is no PDF with ``checksum`` in the object area (or
+        it is not enabled), in which case nothing is deposited.
+
+    """
+    object_path = _find_object(checksum)
+    if object_path is None:
+        return False
+    preview_path = _preview_path(submission_id)
+    with _Deposit(submission_id, 'preview', version) as deposit:
+        tmp_preview_path = deposit.path(preview_path)
+        try:
+            os.link(object_path, tmp_preview_path)
+        except FileNotFoundError:   # Collected in the meantime.
+            return False
+        _save_checksum(tmp_preview_path, checksum)
+        deposit.commit(preview_path, _checksum_path(preview_path))
+    return True
+
+
+def get_source_checksum(submission_id: int, verify: bool = False) -> str:
+    """
+    Get the checksum of the source package for a submission.
+
+    If ``verify`` is ``True``, the checksum is computed from the package
+    itself rather than taken from its sidecar.
+    """
+    return _get_checksum(_source_package_path(submission_id), verify)
 
 
 def does_source_exist(submission_id: int) -> bool:
@@ -116,9 +312,14 @@ def does_source_exist(submission_id: int) -> bool:
     return os.path.exists(_source_package_path(submission_id))
 
 
-def get_preview_checksum(submission_id: int) -> str:
-    """Get the checksum of the preview PDF for a submission."""
-    return _get_checksum(_preview_path(submission_id))
+def get_preview_checksum(submission_id: int, verify: bool = False) -> str:
+    """
+    Get the checksum of the preview PDF for a submission.
+
+    If ``verify`` is ``True``, the checksum is computed from the PDF itself
+    rather than taken from its sidecar.
+    """
+    return _get_checksum(_preview_path(submission_id), verify)
 
 
 def does_preview_exist(submission_id: int) -> bool:
@@ -170,18 +371,254 @@ def _preview_path(submission_id: int) -> str:
     return os.path.join(_submission_path(submission_id), preview_fname)
 
 
-def _get_checksum(path: str) -> str:
+class _Deposit:
+    """
+    A deposit in progress, for a submission.
+
+    Files are written to a temporary directory on the same volume as the
+    submission directory, under ``{LEGACY_FILESYSTEM_ROOT}/.deposits``, and
+    swapped into place by :meth:`commit`. Each deposit records itself (and its
+    ``version``) as the latest of its kind for the submission when it starts,
+    unless the latest deposit has a newer version, in which case it raises
+    :class:`Superseded` straight away. The record is kept after the deposit
+    is committed, so that a deposit with an older version is refused even if
+    it only starts after a newer one has finished. If another deposit of the
+    same kind takes over in the meantime, :meth:`check` (called as content
+    is read) and :meth:`commit` raise :class:`Superseded`, so that the older
+    deposit gives up without finishing its I/O. Starting and committing are
+    serialized with an advisory lock on the submission.
+    """
+
+    def __init__(self, submission_id: int, kind: str,
+                 version: Optional[int] = None) -> None:
+        """Prepare a deposit of ``kind`` for ``submission_id``."""
+        self.submission_id = submission_id
+        self.kind = kind
+        self.version = version
+        submission_path = _submission_path(submission_id)
+        base_dir = os.path.dirname(os.path.dirname(submission_path))
+        self._state_dir = os.path.join(base_dir, DEPOSITS_DIR,
+                                       str(submission_id)[:4])
+        self._latest_path = os.path.join(self._state_dir,
+                                         f'{submission_id}.{kind}')
+        self._lock_path = os.path.join(self._state_dir,
+                                       f'{submission_id}.lock')
+        self._submission_path = submission_path
+        self._last_check = 0.
+        self.tmp_dir = ''
+        self.token = ''
+
+    def __enter__(self) -> '_Deposit':
+        os.makedirs(self._state_dir, exist_ok=True)
+        os.makedirs(self._submission_path, exist_ok=True)
+        with self._lock():
+            _, latest = self._read_latest()
+            if self.version is not None and latest is not None \
+                    and self.version < latest:
+                raise Superseded(f'A {self.kind} deposit for'
+                                 f' {self.submission_id} with version'
+                                 f' {latest} has started', latest)
+            self.tmp_dir = tempfile.mkdtemp(prefix=f'{self.submission_id}.',
+                                            dir=self._state_dir)
+            self.token = os.path.basename(self.tmp_dir)
+            tmp_path = f'{self._latest_path}.{self.token}'
+            with open(tmp_path, 'w') as f:
+                f.write(self.token if self.version is None
+                        else f'{self.token} {self.version}')
+            os.replace(tmp_path, self._latest_path)
+        self._last_check = time.monotonic()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        if self.tmp_dir:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def path(self, final_path: str) -> str:
+        """Get the temporary path for a file that will end up at ``path``."""
+        return os.path.join(self.tmp_dir, os.path.basename(final_path))
+
+    def check(self, force: bool = False) -> None:
+        """
+        Make sure that this is still the latest deposit.
+
+        Unless ``force`` is ``True``, this checks at most once every
+        :const:`SUPERSEDED_CHECK_INTERVAL` seconds.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_check < SUPERSEDED_CHECK_INTERVAL:
+            return
+        self._last_check = now
+        token, latest = self._read_latest()
+        if token != self.token:
+            raise Superseded(f'A newer {self.kind} deposit for'
+                             f' {self.submission_id} has started', latest)
+
+    def commit(self, *final_paths: str) -> None:
+        """
+        Move files from the temporary directory into place.
+
+        Files are moved in the order given. Files are replaced atomically;
+        directories are swapped via two renames, so that a reader sees either
+        the old or the new directory in full (or, very briefly, neither).
+        """
+        with self._lock():
+            self.check(force=True)
+            for final_path in final_paths:
+                tmp_path = self.path(final_path)
+                if not os.path.exists(tmp_path):
+                    continue
+                if os.path.isdir(tmp_path):
+                    if os.path.exists(final_path):
+                        os.rename(final_path, f'{tmp_path}.old')
+                    os.rename(tmp_path, final_path)
+                else:
+                    os.replace(tmp_path, final_path)
+
+    def _read_latest(self) -> Tuple[Optional[str], Optional[int]]:
+        """Get the token and version (if any) of the latest deposit."""
+        try:
+            with open(self._latest_path) as f:
+                token, _, version = f.read().partition(' ')
+        except OSError:
+            return None, None
+        return token, int(version) if version else None
+
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        # Advisory locks are held per process, so threads in this process
+        # need their own lock.
+        with _THREAD_LOCK, open(self._lock_path, 'a') as f:
+            fcntl.lockf(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(f, fcntl.LOCK_UN)
+
+
+_THREAD_LOCK = threading.Lock()
+
+
+def _unpack(stream: unpack.Readable, unpack_to: str,
+            chunk_size: int) -> int:
+    try:
+        return unpack.extract(stream, unpack_to, *_get_modes(),
+                              chunk_size=chunk_size)
+    except (tarfile.TarError, EOFError, OSError, zlib.error) as e:
+        raise RuntimeError(f'Could not unpack source: {e}') from e
+
+
+def _objects_path() -> Optional[str]:
+    """Get the location of the object area, if it is enabled."""
+    if not current_app.config.get('LEGACY_FILESYSTEM_OBJECTS_ENABLED'):
+        return None
+    try:
+        base_dir = current_app.config['LEGACY_FILESYSTEM_ROOT']
+    except KeyError as e:
+        raise ConfigurationError(f'Missing required config params: {e}') from e
+    return os.path.join(base_dir, OBJECTS_DIR)
+
+
+def _object_path(objects_path: str, checksum: str) -> str:
+    if not CHECKSUM.match(checksum):
+        raise SecurityError(f'Not a checksum: {checksum}')
+    return os.path.join(objects_path, checksum[:2], checksum)
+
+
+def _find_object(checksum: str) -> Optional[str]:
+    """Get the path of the object with ``checksum``, if we have it."""
+    objects_path = _objects_path()
+    if objects_path is None or not CHECKSUM.match(checksum):
+        return None
+    object_path = _object_path(objects_path, checksum)
+    if not os.path.exists(object_path):
+        return None
+    return object_path
+
+
+def _intern(path: str, checksum: str) -> None:
+    """
+    Deduplicate the file at ``path`` using the object area, if enabled.
+
+    If there is already an object with ``checksum``, ``path`` is replaced with
+    a hard link to it; otherwise, the file becomes the object.
+    """
+    objects_path = _objects_path()
+    if objects_path is None:
+        return
+    object_path = _object_path(objects_path, checksum)
+    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+    try:
+        os.link(path, object_path)
+        return
+    except FileExistsError:
+        pass
+    tmp_path = f'{path}.link'
+    try:
+        os.link(object_path, tmp_path)
+    except FileNotFoundError:   # Collected in the meantime; keep our copy.
+        return
+    os.replace(tmp_path, path)
+
+
+def _get_checksum(path: str, verify: bool = False) -> str:
+    saved = None if verify else _load_checksum(path)
+    if saved is not None:
+        return saved
     hash_md5 = md5()
     with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
             hash_md5.update(chunk)
-    return urlsafe_b64encode(hash_md5.digest()).decode('utf-8')
+    checksum = urlsafe_b64encode(hash_md5.digest()).decode('utf-8')
+    _save_checksum(path, checksum)
+    return checksum
+
 
+def _check_checksum(checksum: str, expected: Optional[str]) -> None:
+    if expected is not None and checksum != expected:
+        raise ChecksumMismatch(f'Expected {expected}, got {checksum}')
 
-def _unpack_tarfile(tar_path: str, unpack_to: str) -> None:
-    result = Popen(['tar', '-xzf', tar_path, '-C', unpack_to]).wait()
-    if result != 0:
-        raise RuntimeError(f'tar exited with {result}')
+
+def _checksum_path(path: str) -> str:
+    directory, fname = os.path.split(path)
+    return os.path.join(directory, f'.{fname}.md5')
+
+
+def _load_checksum(path: str) -> Optional[str]:
+    """Get the checksum recorded for ``path``, if it is still current."""
+    try:
+        with open(_checksum_path(path)) as f:
+            size, mtime, checksum = f.read().split()
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    if int(size) != stat.st_size or int(mtime) != stat.st_mtime_ns:
+        return None
+    return checksum
+
+
+def _save_checksum(path: str, checksum: str) -> None:
+    """Record the checksum of ``path``, along with its size and mtime."""
+    sidecar_path = _checksum_path(path)
+    tmp_path = f'{sidecar_path}.{os.getpid()}.tmp'
+    try:
+        stat = os.stat(path)
+        with open(tmp_path, 'w') as f:
+            f.write(f'{stat.st_size} {stat.st_mtime_ns} {checksum}\n')
+        os.replace(tmp_path, sidecar_path)
+    except OSError:
+        # The sidecar is only an optimization; we can always fall back to
+        # reading the file.
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _write(content: IO[bytes], path: str, chunk_size: int,
+           check: Optional[Callable[[], None]] = None) -> str:
+    """Write ``content`` to ``path``, and get its checksum along the way."""
+    with open(path, 'wb') as f:
+        tee = unpack.TeeReader(content, f, check)
+        tee.drain(chunk_size)
+    return tee.checksum
 
 
 def _chmod_recurse(parent: str, dir_mode: int, file_mode: int,
@@ -219,7 +656,7 @@ def _chmod_recurse(parent: str, dir_mode: int, file_mode: int,
     os.chmod(parent, dir_mode)
 
 
-def _set_modes(path: str) -> None:
+def _get_modes() -> Tuple[int, int, int, int]:
     try:
         dir_mode = current_app.config['LEGACY_FILESYSTEM_SOURCE_DIR_MODE']
         file_mode = current_app.config['LEGACY_FILESYSTEM_SOURCE_MODE']
@@ -227,4 +664,8 @@ def _set_modes(path: str) -> None:
         source_gid = current_app.config['LEGACY_FILESYSTEM_SOURCE_GID']
     except KeyError as e:
         raise ConfigurationError(f'Missing required config params: {e}') from e
-    _chmod_recurse(path, dir_mode, file_mode, source_uid, source_gid)
\ No newline at end of file
+    return dir_mode, file_mode, source_uid, source_gid
+
+
+def _set_modes(path: str) -> None:
+    _chmod_recurse(path, *_get_modes())
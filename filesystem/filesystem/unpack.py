@@ -0,0 +1,204 @@
+"""
+Streaming extraction of source packages.
+
+Source packages are unpacked while the request body is being received: a
+:class:`TeeReader` writes each chunk of the body to the package file (and
+updates its checksum) as it is handed to :func:`extract`, which decompresses
+and unpacks it one entry at a time. Permissions and ownership are set on each
+file and directory as it is created, so there is no need for a second pass
+over the unpacked tree.
+
+Like GNU tar, leading slashes are stripped from entry names. Entries that
+would end up outside of the target directory (via ``..``, or via a link) are
+refused, and device files and FIFOs are skipped.
+"""
+
+import os
+import shutil
+import tarfile
+import time
+from base64 import urlsafe_b64encode
+from hashlib import md5
+from typing import Callable, IO, List, Optional, cast
+
+from typing_extensions import Protocol
+
+
+class UnsafeArchive(RuntimeError):
+    """The package contains an entry that would be unpacked out of bounds."""
+
+
+class Readable(Protocol):
+    """A stream that can be read in chunks; all that :func:`extract` needs."""
+
+    def read(self, __size: int = ...) -> bytes:
+        """Read up to ``size`` bytes."""
+        ...
+
+
+class TeeReader:
+    """Copies a stream to a file, and computes its checksum, as it is read."""
+
+    def __init__(self, content: IO[bytes], out: IO[bytes],
+                 check: Optional[Callable[[], None]] = None) -> None:
+        """
+        Read from ``content``, and write to ``out``.
+
+        If provided, ``check`` is called before each read; it may raise an
+        exception to abandon the copy.
+        """
+        self._content = content
+        self._out = out
+        self._check = check
+        self._hash = md5()
+        self.size = 0
+        """Number of bytes read so far."""
+        self.waited = 0.
+        """Seconds spent waiting on ``content``."""
+
+    def read(self, size: int = -1) -> bytes:
+        """Read from ``content``, copying to ``out``."""
+        if self._check is not None:
+            self._check()
+        start = time.perf_counter()
+        chunk = self._content.read(size)
+        self.waited += time.perf_counter() - start
+        if chunk:
+            self._hash.update(chunk)
+            self._out.write(chunk)
+            self.size += len(chunk)
+        return chunk
+
+    def drain(self, chunk_size: int) -> None:
+        """Read (and copy) the rest of ``content``."""
+        while self.read(chunk_size):
+            pass
+
+    @property
+    def checksum(self) -> str:
+        """URL-safe base64-encoded MD5 digest of the content read so far."""
+        return urlsafe_b64encode(self._hash.digest()).decode('utf-8')
+
+
+def extract(stream: Readable, unpack_to: str, dir_mode: int, file_mode: int,
+            uid: int, gid: int, chunk_size: int) -> int:
+    """
+    Unpack a gzipped tarball from ``stream`` into ``unpack_to``.
+
+    The stream is read only as far as the end of the archive.
+
+    Parameters
+    ----------
+    stream : :class:`Readable`
+        Readable stream of the gzipped tarball.
+    unpack_to : str
+        Directory in which to unpack; it must already exist.
+    dir_mode : int
+        Mode to set on directories; see :func:`os.chmod`.
+    file_mode : int
+        Mode to set on files.
+    uid : int
+        UID for owner user.
+    gid : int
+        GID for owner group.
+    chunk_size : int
+        Number of bytes to read from ``stream`` at a time.
+
+    Returns
+    -------
+    int
+        Number of entries unpacked.
+
+    Raises
+    ------
+    :class:`UnsafeArchive`
+        If an entry would be unpacked outside of ``unpack_to``.
+    :class:`tarfile.TarError`
+        If the stream is not a valid gzipped tarball.
+
+    """
+    root = os.path.realpath(unpack_to)
+    count = 0
+    # In stream mode, tarfile only ever reads from the file object.
+    fileobj = cast(IO[bytes], stream)
+    with tarfile.open(fileobj=fileobj, mode='r|gz', bufsize=chunk_size) as tar:
+        for member in tar:
+            path = _member_path(root, member.name)
+            if path is None:
+                continue
+            _makedirs(root, os.path.dirname(path), dir_mode, uid, gid)
+            if os.path.islink(path):    # Never write through a link.
+                os.unlink(path)
+            if member.isdir():
+                _makedirs(root, path, dir_mode, uid, gid)
+            elif member.isfile():
+                source = tar.extractfile(member)
+                if source is None:
+                    raise tarfile.ExtractError(f'Unreadable: {member.name}')
+                with open(path, 'wb') as f:
+                    shutil.copyfileobj(source, f, chunk_size)
+                os.utime(path, (member.mtime, member.mtime))
+                _set_mode(path, file_mode, uid, gid)
+            elif member.issym():
+                if os.path.isabs(member.linkname):
+                    raise UnsafeArchive(f'Absolute link: {member.name}')
+                # The link is resolved relative to the directory that really
+                # holds it, through any links that are already unpacked. Its
+                # text is normalized, so that only leading ``..`` remain;
+                # links unpacked later can't then change where it points.
+                linkname = os.path.normpath(member.linkname)
+                parent = os.path.realpath(os.path.dirname(path))
+                _check_within(root, parent, member.name)
+                _check_within(root, os.path.realpath(
+                    os.path.join(parent, linkname)
+                ), member.name)
+                if os.path.lexists(path):
+                    os.unlink(path)
+                os.symlink(linkname, path)
+                os.lchown(path, uid, gid)
+            elif member.islnk():
+                target = _member_path(root, member.linkname)
+                if target is None or not os.path.isfile(target):
+                    raise UnsafeArchive(f'Bad hard link: {member.name}')
+                _check_within(root, os.path.realpath(target), member.name)
+                if os.path.exists(path):
+                    os.unlink(path)
+                os.link(target, path)
+            else:
+                continue    # Devices, FIFOs, etc.
+            count += 1
+    return count
+
+
+def _member_path(root: str, name: str) -> Optional[str]:
+    """Get the path at which to unpack an entry, if it is not the root."""
+    parts = [part for part in name.split('/') if part not in ('', '.')]
+    if '..' in parts:
+        raise UnsafeArchive(f'Entry outside of package: {name}')
+    if not parts:
+        return None
+    return os.path.join(root, *parts)
+
+
+def _check_within(root: str, path: str, name: str) -> None:
+    if path != root and not path.startswith(root + os.sep):
+        raise UnsafeArchive(f'Entry outside of package: {name}')
+
+
+def _makedirs(root: str, path: str, dir_mode: int, uid: int,
+              gid: int) -> None:
+    """Create a directory and its parents, with mode and owner set."""
+    missing: List[str] = []
+    while not os.path.isdir(path):
+        missing.append(path)
+        path = os.path.dirname(path)
+    # Make sure that we're not about to follow a link out of the package.
+    _check_within(root, os.path.realpath(path), path)
+    for directory in reversed(missing):
+        os.mkdir(directory)
+        _set_mode(directory, dir_mode, uid, gid)
+
+
+def _set_mode(path: str, mode: int, uid: int, gid: int) -> None:
+    os.chown(path, uid, gid)
+    os.chmod(path, mode)
@@ -0,0 +1,358 @@
+"""
+Resumable, chunked uploads of source packages and previews.
+
+A deposit of a large source package or preview can be sent in chunks rather
+than in a single request, so that a dropped connection only costs the chunk
+that was in flight. An upload is identified by the submission, the kind of
+content (``source`` or ``preview``), and the checksum of the complete
+content, so a client that starts the same upload again (e.g. when a task is
+retried) picks up where it left off.
+
+1. The client starts the upload (see :func:`start`), and gets the byte ranges
+   that have already been received.
+2. The client sends the missing chunks, in any order and in parallel if it
+   likes, each with its offset and its own checksum (see :func:`write_chunk`).
+   A chunk is verified before it is written, and is acknowledged once it has
+   been written. The checksum of each chunk is recorded (see
+   :func:`get_chunks`), so that a client can tell whether the chunk that was
+   acknowledged for a range is the one that it would send now.
+3. The client commits the upload (see :func:`commit`), which deposits the
+   content as if it had been sent in one piece, provided that all of it has
+   been received and the checksum of the whole matches. If it does not
+   match, the upload is kept, so that the client can resend only the chunks
+   that differ.
+
+Uploads in progress live under ``{LEGACY_FILESYSTEM_ROOT}/.uploads``, on the
+same volume as the submissions. Uploads that are never committed are removed
+by :mod:`filesystem.gc`.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import threading
+from base64 import b64encode
+from contextlib import contextmanager
+from hashlib import md5
+from typing import IO, Iterator, List, Optional, Tuple
+
+from flask import current_app
+
+from arxiv.base import logging
+
+from . import store
+
+logger = logging.getLogger(__name__)
+
+UPLOADS_DIR = '.uploads'
+"""Directory (in ``LEGACY_FILESYSTEM_ROOT``) for uploads in progress."""
+
+KINDS = ('source', 'preview')
+"""Kinds of content that can be uploaded."""
+
+Range = Tuple[int, int]
+"""Start (inclusive) and end (exclusive) of a range of bytes."""
+
+Chunk = Tuple[int, int, str]
+"""The range of bytes of a chunk, and its base64-encoded MD5 checksum."""
+
+
+class NoSuchUpload(RuntimeError):
+    """There is no upload in progress for the content."""
+
+
+class BadChunk(RuntimeError):
+    """A chunk does not have the length or checksum that the client sent."""
+
+
+class Incomplete(RuntimeError):
+    """Some of the content of an upload has not been received."""
+
+
+def start(submission_id: int, kind: str, checksum: str) -> Tuple[List[Range],
+                                                                 bool]:
+    """
+    Start (or resume) an upload of content with ``checksum``.
+
+    Returns
+    -------
+    list
+        Ranges of bytes that have already been received.
+    bool
+        ``True`` if the upload is new, ``False`` if it was already in progress.
+
+    """
+    path = _upload_path(submission_id, kind, checksum)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Set up the upload in a temporary directory, and move it into place, so
+    # that concurrent starts don't see a half-prepared upload.
+    tmp_path = tempfile.mkdtemp(prefix=f'{submission_id}.',
+                                dir=os.path.dirname(path))
+    open(os.path.join(tmp_path, 'content'), 'wb').close()
+    _save_chunks(tmp_path, [])
+    try:
+        os.rename(tmp_path, path)
+        created = True
+    except OSError:     # Already in progress.
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        created = False
+    return get_received(submission_id, kind, checksum), created
+
+
+def get_received(submission_id: int, kind: str, checksum: str) -> List[Range]:
+    """Get the ranges of bytes that have been received for an upload."""
+    return _load_received(_existing_upload_path(submission_id, kind, checksum))
+
+
+def get_chunks(submission_id: int, kind: str, checksum: str) -> List[Chunk]:
+    """Get the chunks that have been acknowledged for an upload, in order."""
+    return _load_chunks(_existing_upload_path(submission_id, kind, checksum))
+
+
+def write_chunk(submission_id: int, kind: str, checksum: str,
+                content: IO[bytes], offset: int, length: int,
+                chunk_checksum: str,
+                chunk_size: int = store.CHUNK_SIZE) -> List[Range]:
+    """
+    Write a chunk of an upload, starting at byte ``offset``.
+
+    Parameters
+    ----------
+    submission_id : int
+        Numeric submission identifier.
+    kind : str
+        ``source`` or ``preview``.
+    checksum : str
+        URL-safe base64-encoded MD5 checksum of the complete content.
+    content : IO
+        A streaming bytes IO from the request body.
+    offset : int
+        Position of the chunk in the complete content.
+    length : int
+        Number of bytes in the chunk.
+    chunk_checksum : str
+        Base64-encoded MD5 checksum of the chunk (as in the ``Content-MD5``
+        header).
+    chunk_size : int
+        Number of bytes to read from ``content`` at a time.
+
+    Returns
+    -------
+    list
+        Ranges of bytes that have been received, including this chunk.
+
+    Raises
+    ------
+    :class:`NoSuchUpload`
+        If the upload has not been started (or has been committed).
+    :class:`BadChunk`
+        If the chunk does not have the expected length or checksum, in which
+        case it is neither written nor acknowledged.
+
+    """
+    path = _existing_upload_path(submission_id, kind, checksum)
+    # The chunk is received into a file of its own, and only copied into the
+    # content once it is verified, so that a chunk that is corrupted in
+    # transit can't overwrite bytes that were acknowledged already.
+    fd, chunk_path = tempfile.mkstemp(prefix='chunk.', dir=path)
+    try:
+        with os.fdopen(fd, 'w+b') as f:
+            hash_md5 = md5()
+            received = 0
+            for data in iter(lambda: content.read(chunk_size), b''):
+                if received + len(data) > length:
+                    raise BadChunk(f'Chunk is longer than {length} bytes')
+                hash_md5.update(data)
+                f.write(data)
+                received += len(data)
+            if received != length:
+                raise BadChunk(f'Expected {length} bytes, got {received}')
+            actual = b64encode(hash_md5.digest()).decode('utf-8')
+            if actual != chunk_checksum:
+                raise BadChunk(f'Expected checksum {chunk_checksum}, got'
+                               f' {actual}')
+            f.seek(0)
+            _copy_into(f, os.path.join(path, 'content'), offset, chunk_size)
+    finally:
+        try:
+            os.remove(chunk_path)
+        except FileNotFoundError:   # Committed in the meantime.
+            pass
+    with _lock(path):
+        chunks = _add_chunk(_load_chunks(path),
+                            (offset, offset + length, chunk_checksum))
+        _save_chunks(path, chunks)
+    return _merge(chunks)
+
+
+def commit(submission_id: int, kind: str, checksum: str, size: int,
+           chunk_size: int = store.CHUNK_SIZE,
+           version: Optional[int] = None) -> str:
+    """
+    Deposit the content of a complete upload.
+
+    See :func:`.store.store_source` for ``version``.
+
+    The upload is finished once it is committed (successfully or not), except
+    if content is missing or does not match ``checksum``. In the latter case,
+    the chunks are kept, so that a client can compare their checksums (see
+    :func:`get_chunks`) with its own, and resend only those that differ.
+
+    Returns
+    -------
+    str
+        URL-safe base64-encoded MD5 checksum of the content.
+
+    Raises
+    ------
+    :class:`NoSuchUpload`
+        If the upload has not been started (or has been committed).
+    :class:`Incomplete`
+        If any of the first ``size`` bytes have not been received.
+    :class:`.store.ChecksumMismatch`
+        If the content does not have the checksum of the upload.
+    :class:`.store.Superseded`
+        If a deposit of the same kind for the submission with a newer
+        ``version`` has started, or if another deposit started while this one
+        was in progress.
+
+    """
+    path = _existing_upload_path(submission_id, kind, checksum)
+    with _lock(path):
+        chunks = _load_chunks(path)
+        missing = _missing(_merge(chunks), size)
+        if missing:
+            raise Incomplete(f'Missing ranges: {missing}')
+        # Anything past the end is dropped, and is no longer acknowledged.
+        content_path = os.path.join(path, 'content')
+        os.truncate(content_path, size)
+        _save_chunks(path, [chunk for chunk in chunks if chunk[1] <= size])
+    deposit = store.store_source if kind == 'source' else store.store_preview
+    finished = True
+    try:
+        with open(content_path, 'rb') as f:
+            return deposit(submission_id, f, chunk_size, expected=checksum,
+                           version=version)
+    except store.ChecksumMismatch:
+        finished = False
+        raise
+    finally:
+        if finished:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _upload_path(submission_id: int, kind: str, checksum: str) -> str:
+    store._validate_submission_id(submission_id)
+    if kind not in KINDS:
+        raise store.SecurityError(f'Not a kind of content: {kind}')
+    if not store.CHECKSUM.match(checksum):
+        raise store.SecurityError(f'Not a checksum: {checksum}')
+    try:
+        base_dir = current_app.config['LEGACY_FILESYSTEM_ROOT']
+    except KeyError as e:
+        raise store.ConfigurationError(f'Missing required config params: {e}') \
+            from e
+    return os.path.join(base_dir, UPLOADS_DIR, str(submission_id)[:4],
+                        f'{submission_id}.{kind}.{checksum}')
+
+
+def _existing_upload_path(submission_id: int, kind: str,
+                          checksum: str) -> str:
+    path = _upload_path(submission_id, kind, checksum)
+    if not os.path.isdir(path):
+        raise NoSuchUpload(f'No {kind} upload for {submission_id} with'
+                           f' checksum {checksum}')
+    return path
+
+
+def _load_received(path: str) -> List[Range]:
+    return _merge(_load_chunks(path))
+
+
+def _load_chunks(path: str) -> List[Chunk]:
+    try:
+        with open(os.path.join(path, 'received')) as f:
+            return [(start, end, checksum)
+                    for start, end, checksum in json.load(f)]
+    except FileNotFoundError as e:    # Committed in the meantime.
+        raise NoSuchUpload(f'No upload at {path}') from e
+
+
+def _save_chunks(path: str, chunks: List[Chunk]) -> None:
+    """Record the chunks that have been received (and mark the upload live)."""
+    tmp_path = os.path.join(path, f'received.{os.getpid()}.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(chunks, f)
+    os.replace(tmp_path, os.path.join(path, 'received'))
+
+
+def _copy_into(source: IO[bytes], path: str, offset: int,
+               chunk_size: int) -> None:
+    """Write the content of ``source`` into the file at ``path``."""
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        for data in iter(lambda: source.read(chunk_size), b''):
+            os.pwrite(fd, data, offset)
+            offset += len(data)
+    finally:
+        os.close(fd)
+
+
+def _add_chunk(chunks: List[Chunk], new: Chunk) -> List[Chunk]:
+    """Add a chunk, replacing any that it overwrote (even in part)."""
+    start, end, _ = new
+    return sorted([chunk for chunk in chunks
+                   if chunk[1] <= start or end <= chunk[0]] + [new])
+
+
+def _merge(chunks: List[Chunk]) -> List[Range]:
+    """Get the ranges of bytes that are covered by ``chunks``."""
+    ranges: List[Range] = []
+    for start, end, _ in chunks:
+        ranges = _add_range(ranges, (start, end))
+    return ranges
+
+
+def _add_range(ranges: List[Range], new: Range) -> List[Range]:
+    """Add a range, merging it with any that it overlaps or abuts."""
+    merged: List[Range] = []
+    start, end = new
+    for other_start, other_end in sorted(ranges):
+        if other_end < start or end < other_start:
+            merged.append((other_start, other_end))
+        else:
+            start, end = min(start, other_start), max(end, other_end)
+    merged.append((start, end))
+    return sorted(merged)
+
+
+def _missing(ranges: List[Range], size: int) -> List[Range]:
+    """Get the ranges of the first ``size`` bytes that are not in ``ranges``."""
+    missing: List[Range] = []
+    position = 0
+    for start, end in sorted(ranges):
+        if start > position:
+            missing.append((position, min(start, size)))
+        position = max(position, end)
+        if position >= size:
+            break
+    if position < size:
+        missing.append((position, size))
+    return [(start, end) for start, end in missing if start < end]
+
+
+@contextmanager
+def _lock(path: str) -> Iterator[None]:
+    # Advisory locks are held per process, so threads in this process need
+    # their own lock.
+    with _THREAD_LOCK, open(os.path.join(path, 'lock'), 'a') as f:
+        fcntl.lockf(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.lockf(f, fcntl.LOCK_UN)
+
+
+_THREAD_LOCK = threading.Lock()
@@ -2,12 +2,18 @@
 
 from unittest import TestCase, mock
 from http import HTTPStatus
+import io
 import os
+import tarfile
 import tempfile
+from base64 import b64encode, urlsafe_b64encode
+from hashlib import md5
 
+from werkzeug.exceptions import Conflict, RequestEntityTooLarge
 
 from filesystem.factory import create_app
-from filesystem import store
+from filesystem import controllers, gc, store, uploads
+from filesystem.routes import LimitedReader
 
 data_path = os.path.join(os.path.split(os.path.abspath(__file__))[0], 'data')
 
@@ -55,6 +61,35 @@ class TestCheckSourceExists(TestBase):
         self.assertIn('ETag', response.headers)
         self.assertEqual(response.headers['ETag'], '1B2M2Y8AsgTpgAmY7PhCfg==')
 
+    def test_checksum_sidecar(self):
+        """The checksum recorded at deposit time is used while it's current."""
+        submission_id = 1234567891
+        with self.app.app_context():
+            package_path = store._source_package_path(submission_id)
+            os.makedirs(os.path.split(package_path)[0])
+            with open(package_path, 'wb') as f:
+                f.write(b'')
+            store._save_checksum(package_path, 'foochecksum')
+            response = self.client.head(f'/{submission_id}/source')
+            self.assertEqual(response.headers['ETag'], 'foochecksum',
+                             'The recorded checksum is used')
+
+            response = self.client.head(f'/{submission_id}/source?verify=true')
+            self.assertEqual(response.headers['ETag'],
+                             '1B2M2Y8AsgTpgAmY7PhCfg==',
+                             'The checksum is recomputed on request')
+
+            store._save_checksum(package_path, 'foochecksum')
+            with open(package_path, 'wb') as f:
+                f.write(b'foo')
+            response = self.client.head(f'/{submission_id}/source')
+            self.assertEqual(response.headers['ETag'],
+                             'rL0Y20zC-Fzt72VPzMSk2A==',
+                             'The checksum is recomputed if the file changed')
+            self.assertEqual(store._load_checksum(package_path),
+                             'rL0Y20zC-Fzt72VPzMSk2A==',
+                             'The recomputed checksum is recorded')
+
     def test_nonexistant_source(self):
         """A source package does not exist."""
         with self.app.app_context():
@@ -93,6 +128,100 @@ class TestDepositPreview(TestBase):
                          'Preview checksum is included in ETag response'
                          ' header')
 
+    @mock.patch(f'{store.__name__}._get_checksum')
+    def test_deposit_preview_single_pass(self, mock_get_checksum):
+        """The checksum is computed as the preview is written."""
+        with open(self.pdf_file, 'rb') as f:
+            with self.app.app_context():
+                response = self.client.post('/123456/preview', data=f)
+        self.assertEqual(response.headers['ETag'], '6OJd0ylj4j-HRNSZpWDJig==')
+        self.assertEqual(mock_get_checksum.call_count, 0,
+                         'The preview is not read back from disk')
+
+    @mock.patch(f'{store.__name__}.SUPERSEDED_CHECK_INTERVAL', 0)
+    def test_superseded(self):
+        """A deposit gives up if a newer one starts."""
+        submission_id = 123456
+        app = self.app
+        preview_path = os.path.join(self.root, '1234', '123456', '123456.pdf')
+
+        class Content:
+            def __init__(self):
+                self.reads = 0
+
+            def read(self, size=-1):
+                self.reads += 1
+                if self.reads == 1:
+                    # A newer deposit happens while this one is in progress.
+                    with app.app_context():
+                        store.store_preview(submission_id, io.BytesIO(b'new'))
+                    return b'old'
+                with open(preview_path, 'rb') as f:
+                    assert f.read() == b'new', 'Only complete files are seen'
+                return b'more'
+
+        with self.app.app_context():
+            with self.assertRaises(Conflict):
+                controllers.deposit_preview(submission_id, Content())
+        with open(preview_path, 'rb') as f:
+            self.assertEqual(f.read(), b'new', 'The newer deposit wins')
+        self.assertEqual(
+            os.listdir(os.path.join(self.root, '.deposits', '1234')),
+            ['123456.lock', '123456.preview'],
+            'Temporary files are cleaned up'
+        )
+
+    def test_older_version_refused(self):
+        """A deposit with an older version does not replace a newer one."""
+        preview_path = os.path.join(self.root, '1234', '123456', '123456.pdf')
+        with self.app.app_context():
+            response = self.client.post('/123456/preview?version=20',
+                                        data=b'new')
+            self.assertEqual(response.status_code, HTTPStatus.CREATED)
+            response = self.client.post('/123456/preview?version=10',
+                                        data=b'old')
+            self.assertEqual(response.status_code, HTTPStatus.CONFLICT,
+                             'An older deposit that starts later is refused')
+            response = self.client.post('/123456/preview?version=foo',
+                                        data=b'old')
+            self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        with open(preview_path, 'rb') as f:
+            self.assertEqual(f.read(), b'new')
+
+        with self.app.app_context():
+            store.store_preview(123456, io.BytesIO(b'newer'), version=20)
+        with open(preview_path, 'rb') as f:
+            self.assertEqual(f.read(), b'newer', 'The same version may retry')
+
+    @mock.patch(f'{store.__name__}.SUPERSEDED_CHECK_INTERVAL', 0)
+    def test_older_version_does_not_supersede(self):
+        """An older deposit that starts later does not abort a newer one."""
+        preview_path = os.path.join(self.root, '1234', '123456', '123456.pdf')
+        app = self.app
+        refused = []
+
+        class Content:
+            def __init__(self):
+                self.reads = 0
+
+            def read(self, size=-1):
+                self.reads += 1
+                if self.reads == 1:
+                    with app.app_context():
+                        try:
+                            store.store_preview(123456, io.BytesIO(b'old'),
+                                                version=10)
+                        except store.Superseded as e:
+                            refused.append(e.latest)
+                    return b'new'
+                return b''
+
+        with self.app.app_context():
+            store.store_preview(123456, Content(), version=20)
+        self.assertEqual(refused, [20])
+        with open(preview_path, 'rb') as f:
+            self.assertEqual(f.read(), b'new', 'The newer deposit wins')
+
 
 class TestDepositSource(TestBase):
     """Test depositing a source package."""
@@ -116,12 +245,13 @@ class TestDepositSource(TestBase):
                          'Returns 201 Created')
 
         self.assertListEqual(
-            os.listdir(os.path.join(self.root, '1234', '123456')),
-            ['123456.tar.gz', 'src'],
-            'Source package ends up in the right location'
+            sorted(os.listdir(os.path.join(self.root, '1234', '123456'))),
+            ['.123456.tar.gz.md5', '123456.tar.gz', 'src'],
+            'Source package and its checksum end up in the right location'
         )
         self.assertListEqual(
-            os.listdir(os.path.join(self.root, '1234', '123456', 'src')),
+            sorted(os.listdir(os.path.join(self.root, '1234', '123456',
+                                           'src'))),
             [
                 'agn_lumhist.ps',
                 'agn_spectra.ps_page_1',
@@ -147,6 +277,25 @@ class TestDepositSource(TestBase):
                          'Source package checksum is included in ETag response'
                          ' header')
 
+    def test_deposit_unsafe_source(self):
+        """Deposit a source package with an entry that escapes ``src``."""
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+            for name, linkname in [('a', '.'), ('a/l', '../secret')]:
+                info = tarfile.TarInfo(name)
+                info.type = tarfile.SYMTYPE
+                info.linkname = linkname
+                tar.addfile(info)
+        buffer.seek(0)
+        with self.app.app_context():
+            response = self.client.post('/123456/source', data=buffer)
+        self.assertEqual(response.status_code,
+                         HTTPStatus.UNPROCESSABLE_ENTITY,
+                         'Returns 422 Unprocessable Entity, so that the'
+                         ' deposit is not retried')
+        self.assertFalse(os.path.exists(os.path.join(self.root, '1234',
+                                                     '123456', 'src')))
+
 
 class TestCheckPreviewExists(TestBase):
     """Test support for HEAD requests to check if preview exists."""
@@ -169,4 +318,203 @@ class TestCheckPreviewExists(TestBase):
         with self.app.app_context():
             response = self.client.head('/12345/preview')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND,
-                         'Returns 404 Not Found')
\ No newline at end of file
+                         'Returns 404 Not Found')
+
+class TestLimitedReader(TestCase):
+    """Request bodies are read up to a limit."""
+
+    def test_within_limit(self):
+        """A stream that is no longer than the limit is read in full."""
+        reader = LimitedReader(io.BytesIO(b'foocontent'), 10)
+        self.assertEqual(reader.read(3), b'foo')
+        self.assertEqual(reader.read(), b'content')
+        self.assertEqual(reader.read(3), b'')
+
+    def test_over_limit(self):
+        """An error is raised as soon as the limit is exceeded."""
+        reader = LimitedReader(io.BytesIO(b'foocontent'), 5)
+        self.assertEqual(reader.read(3), b'foo')
+        with self.assertRaises(RequestEntityTooLarge):
+            reader.read(3)
+
+
+class TestObjects(TestBase):
+    """Identical deposits share storage via the object area."""
+
+    def setUp(self):
+        """Enable the object area."""
+        super(TestObjects, self).setUp()
+        self.app.config['LEGACY_FILESYSTEM_OBJECTS_ENABLED'] = True
+
+    def deposit(self, submission_id, path, kind='source', checksum=None):
+        with open(path, 'rb') as f:
+            with self.app.app_context():
+                if checksum is None:
+                    return self.client.post(f'/{submission_id}/{kind}',
+                                            data=f)
+                return self.client.post(f'/{submission_id}/{kind}'
+                                        f'?checksum={checksum}')
+
+    def test_deduplicate(self):
+        """Identical packages are hard links to the same object."""
+        first = self.deposit(123456, self.source_file)
+        second = self.deposit(234567, self.source_file)
+        self.assertEqual(first.headers['ETag'], second.headers['ETag'])
+        first_path = os.path.join(self.root, '1234', '123456',
+                                  '123456.tar.gz')
+        second_path = os.path.join(self.root, '2345', '234567',
+                                   '234567.tar.gz')
+        self.assertTrue(os.path.samefile(first_path, second_path))
+        self.assertEqual(os.stat(first_path).st_nlink, 3,
+                         'Two deposits, and the object')
+        self.assertIn('draft.tex',
+                      os.listdir(os.path.join(self.root, '2345', '234567',
+                                              'src')))
+
+    def test_deposit_by_checksum(self):
+        """Content that we have can be deposited by checksum alone."""
+        checksum = self.deposit(123456, self.pdf_file, 'preview') \
+            .headers['ETag']
+        response = self.deposit(234567, self.pdf_file, 'preview', checksum)
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(response.headers['ETag'], checksum)
+        self.assertTrue(os.path.samefile(
+            os.path.join(self.root, '1234', '123456', '123456.pdf'),
+            os.path.join(self.root, '2345', '234567', '234567.pdf')
+        ))
+
+        response = self.deposit(345678, self.source_file, 'source',
+                                'rL0Y20zC-Fzt72VPzMSk2A==')
+        self.assertEqual(response.status_code, HTTPStatus.PRECONDITION_FAILED,
+                         'Content that we do not have must be sent')
+        response = self.deposit(345678, self.source_file, 'source',
+                                '../../etc/passwd')
+        self.assertEqual(response.status_code, HTTPStatus.PRECONDITION_FAILED)
+
+    def test_collect_garbage(self):
+        """Objects that are no longer linked are removed."""
+        self.deposit(123456, self.pdf_file, 'preview')
+        objects_path = os.path.join(self.root, store.OBJECTS_DIR)
+        self.assertEqual(gc.collect_objects(objects_path, 0), (0, 0),
+                         'The object is still in use')
+        os.remove(os.path.join(self.root, '1234', '123456', '123456.pdf'))
+        self.assertEqual(gc.collect_objects(objects_path, 3600), (0, 0),
+                         'The object was orphaned too recently')
+        self.assertEqual(gc.collect_objects(objects_path, 0), (1, 25))
+        self.assertEqual(gc.collect_objects(objects_path, 0), (0, 0))
+
+
+class TestUploads(TestBase):
+    """Content can be sent in chunks, and the upload resumed."""
+
+    def setUp(self):
+        """We have a PDF to send in chunks."""
+        super(TestUploads, self).setUp()
+        with open(self.pdf_file, 'rb') as f:
+            self.content = f.read()
+        self.checksum = \
+            urlsafe_b64encode(md5(self.content).digest()).decode('utf-8')
+        self.path = f'/123456/preview/uploads/{self.checksum}'
+
+    def put(self, start, end, chunk=None):
+        chunk = self.content[start:end] if chunk is None else chunk
+        return self.client.put(self.path, data=chunk, headers={
+            'Content-Range': f'bytes {start}-{end - 1}/*',
+            'Content-MD5': b64encode(md5(chunk).digest()).decode('utf-8')
+        })
+
+    def test_upload(self):
+        """Chunks are sent out of order, and the upload resumed."""
+        size = len(self.content)
+        response = self.client.post(self.path)
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(response.json, {'received': [], 'chunks': []})
+
+        self.assertEqual(self.put(10, size).json, {'received': [[10, size]]})
+        response = self.put(0, 10, b'0123456789')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.json['received'], [[0, size]],
+                         'The chunk is acknowledged, even if it is wrong')
+
+        response = self.client.post(self.path)
+        self.assertEqual(response.status_code, HTTPStatus.OK,
+                         'The upload is resumed')
+        self.assertEqual(response.json['received'], [[0, size]])
+        wrong = b64encode(md5(b'0123456789').digest()).decode('utf-8')
+        self.assertEqual(response.json['chunks'][0], [0, 10, wrong],
+                         'Checksums of the chunks are reported')
+
+        response = self.client.post(f'{self.path}/commit?size={size}')
+        self.assertEqual(response.status_code, HTTPStatus.PRECONDITION_FAILED,
+                         'The content as a whole does not match')
+        self.assertFalse(os.path.exists(
+            os.path.join(self.root, '1234', '123456', '123456.pdf')
+        ))
+        self.assertEqual(self.client.get(self.path).json['received'],
+                         [[0, size]], 'The upload is kept')
+
+        self.put(0, 10)
+        response = self.client.post(f'{self.path}/commit?size={size}')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(response.headers['ETag'], self.checksum)
+        with open(os.path.join(self.root, '1234', '123456', '123456.pdf'),
+                  'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(os.listdir(os.path.join(self.root, '.uploads',
+                                                 '1234')), [])
+
+    def test_incomplete(self):
+        """An upload can't be committed until all of it has been received."""
+        size = len(self.content)
+        self.client.post(self.path)
+        self.put(10, size)
+        response = self.client.post(f'{self.path}/commit?size={size}')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST,
+                         'Content is missing')
+        self.assertEqual(self.client.get(self.path).json['received'],
+                         [[10, size]])
+
+    def test_bad_chunk(self):
+        """A chunk that is corrupted in transit is not acknowledged."""
+        self.client.post(self.path)
+        response = self.put(0, 10, b'0123456789')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        response = self.client.put(self.path, data=self.content[10:20],
+                                   headers={'Content-Range': 'bytes 10-19/*',
+                                            'Content-MD5': 'Zm9v'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        response = self.client.put(self.path, data=self.content[10:20],
+                                   headers={'Content-Range': 'bytes 10-29/*',
+                                            'Content-MD5': 'Zm9v'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST,
+                         'The chunk is too short')
+        self.assertEqual(self.client.get(self.path).json['received'],
+                         [[0, 10]])
+        response = self.client.put(self.path, data=b'9876543210',
+                                   headers={'Content-Range': 'bytes 0-9/*',
+                                            'Content-MD5': 'Zm9v'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        with self.app.app_context():
+            path = uploads._upload_path(123456, 'preview', self.checksum)
+        with open(os.path.join(path, 'content'), 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789',
+                             'Acknowledged bytes are not overwritten')
+        self.assertEqual(sorted(os.listdir(path)),
+                         ['content', 'lock', 'received'],
+                         'Rejected chunks are not left behind')
+
+    def test_no_upload(self):
+        """Chunks can only be sent for an upload that has been started."""
+        self.assertEqual(self.put(0, 10).status_code, HTTPStatus.NOT_FOUND)
+        response = self.client.post('/123456/preview/uploads/../../etc')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        response = self.client.post('/123456/preview/uploads/foo')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_missing(self):
+        """Gaps in the content that has been received are found."""
+        self.assertEqual(uploads._missing([(0, 5), (8, 12)], 10), [(5, 8)])
+        self.assertEqual(uploads._missing([(2, 5)], 10), [(0, 2), (5, 10)])
+        self.assertEqual(uploads._missing([(0, 10)], 10), [])
+        self.assertEqual(uploads._add_range([(0, 5), (8, 12)], (5, 8)),
+                         [(0, 12)])
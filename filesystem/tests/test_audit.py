@@ -0,0 +1,95 @@
+"""Tests for :mod:`filesystem.audit`."""
+
+import io
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+from filesystem import audit, store
+from filesystem.factory import create_app
+
+data_path = os.path.join(os.path.split(os.path.abspath(__file__))[0], 'data')
+
+
+class TestAudit(TestCase):
+    """Audit deposits against the checksums that the NG system expects."""
+
+    def setUp(self):
+        """Deposit source and previews for a few submissions."""
+        self.root = tempfile.mkdtemp()
+        self.app = create_app()
+        self.app.config.update({
+            'LEGACY_FILESYSTEM_ROOT': self.root,
+            'LEGACY_FILESYSTEM_SOURCE_UID': os.geteuid(),
+            'LEGACY_FILESYSTEM_SOURCE_GID': os.getegid(),
+        })
+        with self.app.app_context():
+            for submission_id in (12345678, 12349999, 23456789):
+                with open(os.path.join(data_path, '12345678.tar.gz'),
+                          'rb') as f:
+                    self.source = store.store_source(submission_id, f)
+                with open(os.path.join(data_path, '12345678.pdf'),
+                          'rb') as f:
+                    self.preview = store.store_preview(submission_id, f)
+
+    def tearDown(self):
+        """Remove the filesystem."""
+        shutil.rmtree(self.root)
+
+    def expected(self, rows):
+        lines = ['submission_id\tsource_checksum\tpreview_checksum']
+        lines += ['\t'.join(row) for row in rows]
+        return audit.load_expected(io.StringIO('\n'.join(lines) + '\n'))
+
+    def test_audit(self):
+        """Missing, corrupted, and half-deposited content is reported."""
+        expected = self.expected([
+            ('12345678', self.source, self.preview),
+            ('12349999', self.source, 'NULL'),
+            ('23456789', self.source, self.preview),
+            ('34567890', self.source, self.preview),
+        ])
+        self.assertEqual(sorted(expected), ['1234', '2345', '3456'])
+        self.assertEqual(expected['1234'][12349999], (self.source, None))
+
+        shutil.rmtree(os.path.join(self.root, '1234', '12349999', 'src'))
+        pdf_path = os.path.join(self.root, '2345', '23456789',
+                                '23456789.pdf')
+        with open(pdf_path, 'ab') as f:
+            f.write(b'garbage')
+
+        report = sorted(audit.audit(self.root, 'src', expected, processes=2))
+        self.assertEqual(len(report), 4)
+        self.assertEqual(report[0], audit.Discrepancy(
+            12349999, 'source', audit.NOT_UNPACKED, self.source, ''
+        ))
+        self.assertEqual(report[1][:3],
+                         (23456789, 'preview', audit.MISMATCH),
+                         'The stale sidecar is not trusted')
+        self.assertEqual(report[2][:3], (34567890, 'preview', audit.MISSING))
+        self.assertEqual(report[3][:3], (34567890, 'source', audit.MISSING))
+
+    def test_verify(self):
+        """Checksums are recomputed if asked, rather than taken on trust."""
+        expected = self.expected([('12345678', self.source, self.preview)])
+        sidecar_path = os.path.join(self.root, '1234', '12345678',
+                                    '.12345678.pdf.md5')
+        with open(sidecar_path) as f:
+            size, mtime, _ = f.read().split()
+        with open(sidecar_path, 'w') as f:
+            f.write(f'{size} {mtime} bogus==\n')
+        self.assertEqual(len(list(audit.audit(self.root, 'src', expected))),
+                         1)
+        self.assertEqual(
+            list(audit.audit(self.root, 'src', expected, verify=True)), []
+        )
+
+    def test_throttle(self):
+        """I/O is limited to the given rate."""
+        throttle = audit.Throttle(100 * 1024)
+        start = time.monotonic()
+        for _ in range(10):
+            throttle(4 * 1024)
+        self.assertGreaterEqual(time.monotonic() - start, 0.35)
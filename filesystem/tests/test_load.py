@@ -0,0 +1,78 @@
+"""Load tests for deposits to the filesystem shim."""
+
+import os
+import shutil
+import tempfile
+import threading
+import tracemalloc
+from http import HTTPStatus
+from unittest import TestCase
+
+from filesystem.factory import create_app
+
+N_DEPOSITS = 8
+"""Number of concurrent deposits."""
+
+BODY_SIZE = 4 * 1024 * 1024
+"""Size of each deposited body, in bytes."""
+
+
+class TestConcurrentDeposits(TestCase):
+    """Deposit several large previews at once."""
+
+    def setUp(self):
+        """Create an app that writes to a temporary directory."""
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.app = create_app()
+        self.app.config.update({
+            'LEGACY_FILESYSTEM_ROOT': self.root,
+            'LEGACY_FILESYSTEM_SOURCE_DIR_MODE': 0o40775,
+            'LEGACY_FILESYSTEM_SOURCE_MODE': 0o100664,
+            'LEGACY_FILESYSTEM_SOURCE_UID': os.geteuid(),
+            'LEGACY_FILESYSTEM_SOURCE_GID': os.getegid(),
+            'LEGACY_FILESYSTEM_SOURCE_PREFIX': 'src',
+            'MAX_PAYLOAD_SIZE_BYTES': BODY_SIZE
+        })
+        self.body_path = os.path.join(self.root, 'body.pdf')
+        with open(self.body_path, 'wb') as f:
+            f.write(os.urandom(BODY_SIZE))
+
+    def deposit(self, submission_id: int, results: dict) -> None:
+        client = self.app.test_client()
+        with open(self.body_path, 'rb') as f:
+            response = client.post(f'/{submission_id}/preview',
+                                   input_stream=f,
+                                   content_type='application/pdf')
+        results[submission_id] = response.status_code
+
+    def test_concurrent_deposits(self):
+        """Bodies are streamed to disk, not held in memory."""
+        results = {}
+        threads = [threading.Thread(target=self.deposit,
+                                    args=(1000000 + i, results))
+                   for i in range(N_DEPOSITS)]
+        tracemalloc.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.assertEqual(set(results.values()), {HTTPStatus.CREATED})
+        self.assertLess(peak, BODY_SIZE,
+                        'Less memory is used than the size of a single body')
+        for i in range(N_DEPOSITS):
+            path = os.path.join(self.root, '1000', str(1000000 + i),
+                                f'{1000000 + i}.pdf')
+            self.assertEqual(os.path.getsize(path), BODY_SIZE)
+
+    def test_too_large(self):
+        """Bodies over the limit are refused."""
+        with open(self.body_path, 'ab') as f:
+            f.write(b'!')
+        results = {}
+        self.deposit(1000000, results)
+        self.assertEqual(results[1000000], HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+
@@ -0,0 +1,118 @@
+"""Tests for :mod:`filesystem.unpack`."""
+
+import io
+import os
+import stat
+import tarfile
+import tempfile
+from base64 import urlsafe_b64encode
+from hashlib import md5
+from typing import Union
+from unittest import TestCase
+
+from filesystem import unpack
+
+
+def make_tarball(*members: tarfile.TarInfo, content: bytes = b'foo') -> bytes:
+    """Make a gzipped tarball with ``members``."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        for member in members:
+            if member.isfile():
+                member.size = len(content)
+                tar.addfile(member, io.BytesIO(content))
+            else:
+                tar.addfile(member)
+    return buffer.getvalue()
+
+
+def member(name: str, type: bytes = tarfile.REGTYPE,
+           linkname: str = '') -> tarfile.TarInfo:
+    info = tarfile.TarInfo(name)
+    info.type = type
+    info.linkname = linkname
+    return info
+
+
+class TestExtract(TestCase):
+    """Unpack tarballs as they are streamed."""
+
+    def setUp(self):
+        """Create a place to unpack."""
+        self.root = tempfile.mkdtemp()
+        self.unpack_to = os.path.join(self.root, 'src')
+        os.mkdir(self.unpack_to)
+
+    def extract(self, data: Union[bytes, unpack.TeeReader]) -> int:
+        stream = io.BytesIO(data) if isinstance(data, bytes) else data
+        return unpack.extract(stream, self.unpack_to, 0o40750, 0o100640,
+                              os.geteuid(), os.getegid(), 1024)
+
+    def test_extract(self):
+        """Files and directories are created with the right modes."""
+        count = self.extract(make_tarball(
+            member('/foo/bar/baz.tex'),
+            member('foo/qux', tarfile.DIRTYPE),
+            member('foo/link.tex', tarfile.SYMTYPE, 'bar/baz.tex'),
+            member('foo/fifo', tarfile.FIFOTYPE),
+        ))
+        self.assertEqual(count, 3, 'The FIFO is skipped')
+        path = os.path.join(self.unpack_to, 'foo', 'bar', 'baz.tex')
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'foo', 'Leading slash is stripped')
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o640)
+        for directory in ('foo', 'foo/bar', 'foo/qux'):
+            mode = os.stat(os.path.join(self.unpack_to, directory)).st_mode
+            self.assertEqual(stat.S_IMODE(mode), 0o750)
+        self.assertEqual(
+            os.readlink(os.path.join(self.unpack_to, 'foo', 'link.tex')),
+            'bar/baz.tex'
+        )
+        self.assertFalse(
+            os.path.exists(os.path.join(self.unpack_to, 'foo', 'fifo'))
+        )
+
+    def test_traversal(self):
+        """Entries may not be unpacked outside of the target directory."""
+        for members in [(member('../escaped'),),
+                        (member('foo/../../escaped'),),
+                        (member('link', tarfile.SYMTYPE, '/etc/passwd'),),
+                        (member('link', tarfile.SYMTYPE, '../'),),
+                        (member('link', tarfile.SYMTYPE, '.'),
+                         member('link/../../escaped'),),
+                        (member('link', tarfile.LNKTYPE, '../escaped'),),
+                        (member('a', tarfile.SYMTYPE, '.'),
+                         member('a/l', tarfile.SYMTYPE, '../secret'),)]:
+            with self.assertRaises(unpack.UnsafeArchive):
+                self.extract(make_tarball(*members))
+        self.assertEqual(os.listdir(self.root), ['src'])
+
+    def test_link_to_outside(self):
+        """Entries may not be written via a link that points outside."""
+        outside = tempfile.mkdtemp()
+        os.symlink(outside, os.path.join(self.unpack_to, 'link'))
+        with self.assertRaises(unpack.UnsafeArchive):
+            self.extract(make_tarball(member('link/sub/escaped')))
+        self.assertEqual(os.listdir(outside), [])
+
+    def test_link_via_link(self):
+        """Links are unpacked as written, once normalized and checked."""
+        self.extract(make_tarball(
+            member('a', tarfile.SYMTYPE, 'sub'),
+            member('sub', tarfile.DIRTYPE),
+            member('a/l', tarfile.SYMTYPE, '../x/../sub'),
+        ))
+        self.assertEqual(os.readlink(os.path.join(self.unpack_to, 'sub', 'l')),
+                         '../sub')
+
+    def test_tee(self):
+        """The whole body is copied and checksummed, even after the archive."""
+        data = make_tarball(member('foo.tex')) + b'trailing'
+        out = io.BytesIO()
+        tee = unpack.TeeReader(io.BytesIO(data), out)
+        self.assertEqual(self.extract(tee), 1)
+        tee.drain(1024)
+        self.assertEqual(out.getvalue(), data)
+        self.assertEqual(tee.size, len(data))
+        self.assertEqual(tee.checksum,
+                         urlsafe_b64encode(md5(data).digest()).decode('utf-8'))